@@ -0,0 +1,191 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import time
+import warnings
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8")
+
+
+def create_faiss_index(dim: int, index_type: str = "flat", nlist: int = 1024, pq_m: int = 16,
+                       pq_nbits: int = 8, hnsw_m: int = 32, ef_construction: int = 200) -> faiss.Index:
+    # every index type scores by inner product, like the original IndexFlatIP
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "ivf_pq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    if index_type in ("sq_fp16", "sq_int8"):
+        # 2 or 1 bytes per dimension instead of 4, int8 learns per-dimension ranges in training
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "sq_fp16" else faiss.ScalarQuantizer.QT_8bit
+        return faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def fit_index_params(num_vectors: int, index_type: str, nlist: int, pq_nbits: int) -> Tuple[str, int, int]:
+    """
+    (index_type, nlist, pq_nbits) trainable on num_vectors vectors, with a
+    warning for every setting that had to change.
+    """
+    if not index_type.startswith("ivf"):
+        return index_type, nlist, pq_nbits
+    # IVF needs enough training points per centroid (faiss asks for 39)
+    fitted = max(1, min(nlist, num_vectors // 39))
+    if fitted != nlist:
+        warnings.warn(f"nlist lowered from {nlist} to {fitted}: {num_vectors} vectors train at most "
+                      f"{num_vectors // 39 or 1} centroids with 39 points each")
+    if index_type == "ivf_pq" and num_vectors < 2 ** pq_nbits:
+        # every PQ codebook needs at least 2 ** pq_nbits training points
+        nbits = num_vectors.bit_length() - 1
+        if nbits < 4:
+            warnings.warn(f"{num_vectors} vectors are too few to train ivf_pq, building a flat index instead")
+            return "flat", fitted, pq_nbits
+        warnings.warn(f"pq_nbits lowered from {pq_nbits} to {nbits}: ivf_pq needs 2 ** pq_nbits training "
+                      f"vectors and there are only {num_vectors}")
+        pq_nbits = nbits
+    return index_type, fitted, pq_nbits
+
+
+def train_faiss_index(index: faiss.Index, embeddings: np.ndarray, train_size: int = 100_000, seed: int = 0) -> None:
+    # IVF coarse centroids and PQ codebooks are learned from a random corpus sample
+    if index.is_trained:
+        return
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(embeddings), min(train_size, len(embeddings)), replace=False))
+    index.train(np.ascontiguousarray(embeddings[sample], dtype="float32"))
+
+
+def is_exact(index: faiss.Index) -> bool:
+    # a flat float32 index already returns exact inner products, anything else is worth rescoring
+    return isinstance(index, faiss.IndexFlat)
+
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    # per-call parameters, so concurrent searches with different knobs do not race on the index
+    if nprobe and faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def rescore(embeddings: np.ndarray, queries: np.ndarray, rows: np.ndarray, k: int):
+    """
+    Exact float32 inner products of each query with its candidate rows (e.g.
+    from a quantized index), best k per query as (scores, rows), -1 padded.
+    """
+    valid = rows >= 0
+    # one sorted read of the distinct candidate rows, memmap friendly
+    unique, inverse = np.unique(np.where(valid, rows, 0), return_inverse=True)
+    vectors = np.asarray(embeddings[unique], dtype="float32")[inverse.reshape(rows.shape)]
+    scores = np.einsum("qd,qcd->qc", np.asarray(queries, dtype="float32"), vectors)
+    scores[~valid] = -np.inf
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    scores = np.take_along_axis(scores, order, axis=1)
+    rows = np.where(np.isfinite(scores), np.take_along_axis(rows, order, axis=1), -1)
+    return scores, rows
+
+
+def search(index: faiss.Index, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+           ef_search: Optional[int] = None, embeddings: Optional[np.ndarray] = None, rescore_factor: int = 4):
+    # with embeddings, k * rescore_factor candidates are re-ranked by exact float32 scores
+    depth = k * rescore_factor if embeddings is not None else k
+    params = search_parameters(index, nprobe, ef_search)
+    if params is None:
+        scores, rows = index.search(queries, depth)
+    else:
+        scores, rows = index.search(queries, depth, params=params)
+    if embeddings is None:
+        return scores, rows
+    return rescore(embeddings, queries, rows, k)
+
+
+def exact_top_k(embeddings: np.ndarray, queries: np.ndarray, k: int, chunk_size: int = 16_384) -> np.ndarray:
+    """Exact inner-product top k rows per query, scanning the embeddings in chunks."""
+    best_scores = np.empty((len(queries), 0), dtype="float32")
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype="float32")
+        scores = queries @ chunk.T
+        # top k of the chunk, then merged with the top k so far
+        top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        scores = np.hstack([best_scores, np.take_along_axis(scores, top, axis=1)])
+        rows = np.hstack([best_rows, top + start])
+        keep = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    return best_rows
+
+
+def _timed_recall(exact: np.ndarray, run) -> Dict:
+    start = time.perf_counter()
+    _, found = run()
+    seconds = time.perf_counter() - start
+    hits = sum(len(set(f[f >= 0]) & set(e)) for f, e in zip(found, exact))
+    return {"recall": hits / exact.size, "ms_per_query": 1000 * seconds / len(exact)}
+
+
+def recall_report(index: faiss.Index, embeddings: np.ndarray, index_type: str, k: int = 10,
+                  num_queries: int = 1000, sweep: Optional[List[int]] = None, seed: int = 0,
+                  build_seconds: Optional[float] = None, rescore_factor: Optional[int] = None,
+                  baseline: bool = True) -> Dict:
+    """
+    recall@k against exact search for corpus vectors used as queries, at
+    each value of the index's search knob (nprobe for IVF, efSearch for HNSW).
+    With rescore_factor, each setting is also measured with float32 rescoring
+    of k * rescore_factor candidates from embeddings. With baseline, the same
+    queries are timed on an IndexFlatIP over the same vectors.
+    """
+    rng = np.random.default_rng(seed)
+    query_rows = np.sort(rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False))
+    queries = np.ascontiguousarray(embeddings[query_rows], dtype="float32")
+    exact = exact_top_k(embeddings, queries, k)
+
+    knob = {"ivf_flat": "nprobe", "ivf_pq": "nprobe", "hnsw": "ef_search"}.get(index_type)
+    if knob is None:
+        sweep = [None]
+    elif sweep is None:
+        sweep = [1, 4, 16, 64, 256] if knob == "nprobe" else [16, 32, 64, 128, 256]
+    if index_type == "flat":
+        rescore_factor = None
+        baseline = False
+
+    results = []
+    for value in sweep:
+        knobs = {knob: value} if knob else {}
+        results.append({"param": knob, "value": value, "rescore_factor": None,
+                        **_timed_recall(exact, lambda: search(index, queries, k, **knobs))})
+        if rescore_factor:
+            results.append({"param": knob, "value": value, "rescore_factor": rescore_factor,
+                            **_timed_recall(exact, lambda: search(index, queries, k, embeddings=embeddings,
+                                                                  rescore_factor=rescore_factor, **knobs))})
+
+    report = {
+        "index_type": index_type,
+        "ntotal": int(index.ntotal),
+        "k": k,
+        "num_queries": len(queries),
+        "index_bytes": int(faiss.serialize_index(index).size),
+        "build_seconds": build_seconds,
+        "results": results,
+    }
+    if baseline:
+        # the exact IndexFlatIP this index replaces, its recall is 1 by definition
+        flat = faiss.IndexFlatIP(embeddings.shape[1])
+        for start in range(0, len(embeddings), 65_536):
+            flat.add(np.ascontiguousarray(embeddings[start:start + 65_536], dtype="float32"))
+        report["baseline"] = {"index_type": "flat", "index_bytes": int(flat.ntotal) * flat.d * 4,
+                              **_timed_recall(exact, lambda: flat.search(queries, k))}
+    return report
+
+
+def write_recall_report(report: Dict, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
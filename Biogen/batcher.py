@@ -0,0 +1,93 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future
+import queue
+import threading
+import time
+import numpy as np
+
+# (query texts) -> (len(texts), dim) query matrix
+EncodeBatch = Callable[[List[str]], np.ndarray]
+# (query matrix, depth, nprobe, ef_search) -> (scores, rows), one row per query
+SearchBatch = Callable[[np.ndarray, int, Optional[int], Optional[int]], Tuple[np.ndarray, np.ndarray]]
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent dense searches. Callers block on search(); a
+    background thread collects queued queries for up to window_ms after the
+    first one arrives, or until max_batch are waiting, then encodes them in
+    one forward pass and runs one FAISS search per (nprobe, ef_search)
+    setting, handing every caller its own row of the result.
+    """
+
+    def __init__(self, encode_batch: EncodeBatch, search_batch: SearchBatch,
+                 window_ms: float = 2.0, max_batch: int = 64):
+        self.encode_batch = encode_batch
+        self.search_batch = search_batch
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.queue: "queue.Queue[Tuple[str, int, Optional[int], Optional[int], Future]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_sizes: Dict[int, int] = {}
+        self.worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, text: str, depth: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Future:
+        future: Future = Future()
+        self.queue.put((text, depth, nprobe, ef_search, future))
+        return future
+
+    def search(self, text: str, depth: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, rows) of the best depth hits for one query, faiss -1 padding dropped."""
+        return self.submit(text, depth, nprobe, ef_search).result()
+
+    def _collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            with self.lock:
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            try:
+                queries = self.encode_batch([item[0] for item in batch])
+                # search parameters are per call, so requests are grouped by them
+                groups: Dict[Tuple[Optional[int], Optional[int]], List[int]] = {}
+                for i, (_, _, nprobe, ef_search, _) in enumerate(batch):
+                    groups.setdefault((nprobe, ef_search), []).append(i)
+                for (nprobe, ef_search), members in groups.items():
+                    depth = max(batch[i][1] for i in members)
+                    scores, rows = self.search_batch(queries[members], depth, nprobe, ef_search)
+                    for j, i in enumerate(members):
+                        found = rows[j][:batch[i][1]] >= 0
+                        batch[i][4].set_result((scores[j][:batch[i][1]][found], rows[j][:batch[i][1]][found]))
+            except Exception as e:
+                for item in batch:
+                    if not item[4].done():
+                        item[4].set_exception(e)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+        batches = sum(sizes.values())
+        queries = sum(size * count for size, count in sizes.items())
+        return {
+            "batches": batches,
+            "queries": queries,
+            "mean_batch_size": queries / batches if batches else 0.0,
+            "max_batch_size": max(sizes, default=0),
+            "batch_size_counts": sizes,
+            "queue_depth": self.queue.qsize(),
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+        }
@@ -0,0 +1,160 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from array import array
+import json
+import re
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
+from structures import Doc
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    # lower-cased alphanumeric runs, matches what preprocess_query leaves of a query
+    return TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the whole corpus. Every (doc, term) weight
+    idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    is computed once at build time and stored in a CSR matrix with one row
+    per doc (FAISS row order), so a query score is a sum of stored weights.
+    idf uses corpus-wide document frequencies: log(1 + (N - df + 0.5) / (df + 0.5)).
+    """
+
+    def __init__(self, matrix: csr_matrix, vocabulary: Dict[str, int], k1: float = 1.5, b: float = 0.75,
+                 by_term: Optional[csc_matrix] = None):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.k1 = k1
+        self.b = b
+        self._by_term = by_term
+
+    @classmethod
+    def build(cls, docs: Iterable[Doc], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        indptr = array("q", [0])
+        indices = array("i")
+        tfs = array("f")
+        doc_lengths = array("f")
+
+        # one pass over the docs, only the sparse counts are kept
+        for doc in docs:
+            counts: Dict[int, int] = {}
+            tokens = tokenize((doc.title or "") + " " + (doc.text or ""))
+            for token in tokens:
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id in sorted(counts):
+                indices.append(term_id)
+                tfs.append(counts[term_id])
+            indptr.append(len(indices))
+            doc_lengths.append(len(tokens))
+
+        num_docs = len(doc_lengths)
+        # one index dtype for indices and indptr, otherwise scipy copies them into a common one
+        index_dtype = np.int32 if len(indices) < 2 ** 31 else np.int64
+        indptr_np = np.frombuffer(indptr, dtype=np.int64).astype(index_dtype)
+        indices_np = np.frombuffer(indices, dtype=np.int32).astype(index_dtype)
+        tf = np.frombuffer(tfs, dtype=np.float32)
+        lengths = np.frombuffer(doc_lengths, dtype=np.float32)
+
+        df = np.bincount(indices_np, minlength=len(vocabulary))
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(lengths.mean()) if num_docs else 0.0
+        norms = k1 * (1 - b + b * lengths / avgdl) if avgdl else np.full(num_docs, k1, dtype=np.float32)
+        row_norms = np.repeat(norms, np.diff(indptr_np).astype(np.int64))
+        weights = (idf[indices_np] * tf * (k1 + 1) / (tf + row_norms)).astype(np.float32)
+
+        matrix = csr_matrix((weights, indices_np, indptr_np), shape=(num_docs, len(vocabulary)))
+        return cls(matrix, vocabulary, k1, b)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def by_term(self) -> csc_matrix:
+        # column-major copy for full-corpus scoring, made on first use unless it was loaded
+        if self._by_term is None:
+            self._by_term = self.matrix.tocsc()
+        return self._by_term
+
+    def query_terms(self, query_text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Term ids of the query and how often each occurs, unknown terms dropped."""
+        counts: Dict[int, int] = {}
+        for token in tokenize(query_text):
+            term_id = self.vocabulary.get(token)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        return np.fromiter(counts, dtype=np.int64, count=len(counts)), \
+            np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+    def score(self, query_text: str, rows: Iterable[int]) -> np.ndarray:
+        """BM25 scores of the given candidate rows, in the given order."""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        term_ids, counts = self.query_terms(query_text)
+        if not len(rows) or not len(term_ids):
+            return np.zeros(len(rows), dtype=np.float32)
+        query = csr_matrix((counts, term_ids, [0, len(term_ids)]), shape=(1, self.matrix.shape[1]))
+        return np.asarray((self.matrix[rows] @ query.T).todense(), dtype=np.float32).ravel()
+
+    def search(self, query_text: str, top_n: int = 10,
+               rows: Optional[Iterable[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best top_n (rows, scores), highest score first. With rows only those
+        candidates are scored, otherwise the postings of the query terms are
+        read from the column-major matrix, so cost follows their length and
+        not the corpus size.
+        """
+        if rows is not None:
+            candidates = np.asarray(list(rows), dtype=np.int64)
+            scores = self.score(query_text, candidates)
+        else:
+            term_ids, counts = self.query_terms(query_text)
+            by_term = self.by_term
+            postings = [(by_term.indices[by_term.indptr[t]:by_term.indptr[t + 1]],
+                         by_term.data[by_term.indptr[t]:by_term.indptr[t + 1]] * count)
+                        for t, count in zip(term_ids, counts)]
+            if not postings:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            candidates, inverse = np.unique(np.concatenate([p[0] for p in postings]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([p[1] for p in postings])).astype(np.float32)
+
+        if top_n < len(scores):
+            top = np.argpartition(-scores, top_n - 1)[:top_n] if top_n > 0 else np.empty(0, dtype=np.int64)
+        else:
+            top = np.arange(len(scores))
+        # highest score first, ties in row order
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return candidates[top], scores[top]
+
+    def save(self, prefix: str) -> None:
+        """Write the matrices as .npy files (mappable by load) and the vocabulary as JSON."""
+        np.save(prefix + ".data.npy", self.matrix.data)
+        np.save(prefix + ".indices.npy", self.matrix.indices)
+        np.save(prefix + ".indptr.npy", self.matrix.indptr)
+        by_term = self.by_term
+        np.save(prefix + ".term_data.npy", by_term.data)
+        np.save(prefix + ".term_indices.npy", by_term.indices)
+        np.save(prefix + ".term_indptr.npy", by_term.indptr)
+        with open(prefix + ".json", "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "shape": list(self.matrix.shape),
+                       "vocabulary": sorted(self.vocabulary, key=self.vocabulary.get)}, f)
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> "BM25Index":
+        mmap_mode = "r" if mmap else None
+        with open(prefix + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        shape = tuple(meta["shape"])
+
+        def arrays(name: str) -> tuple:
+            return tuple(np.load(f"{prefix}.{part}.npy", mmap_mode=mmap_mode)
+                         for part in (f"{name}data", f"{name}indices", f"{name}indptr"))
+
+        # copy=False keeps the memory-mapped arrays as the matrix storage
+        matrix = csr_matrix(arrays(""), shape=shape, copy=False)
+        by_term = csc_matrix(arrays("term_"), shape=shape, copy=False)
+        vocabulary = {term: term_id for term_id, term in enumerate(meta["vocabulary"])}
+        return cls(matrix, vocabulary, meta["k1"], meta["b"], by_term)
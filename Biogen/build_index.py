@@ -1,115 +1,150 @@
 # build_index.py
-from typing import List, Tuple
-import glob
-import json
+from typing import Iterable, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
+import time
 import numpy as np
-from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer
 import faiss
 from structures import Doc
-import torch
+from doc_store import article_to_doc, iter_articles
+from encoder import get_query_encoder, default_device
+from embed import encode_corpus
+from bm25_index import BM25Index
+from hybrid import HybridRetriever
+from ann import create_faiss_index, fit_index_params, train_faiss_index, recall_report, write_recall_report, search as ann_search
 
 
 def load_jsonl(jsonl_dir: str) -> List[Doc]:
-    docs: List[Doc] = []
-    for path in sorted(glob.glob(os.path.join(jsonl_dir, "*.jsonl"))):
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                article = json.loads(line)
-                doc = Doc(
-                    id=article.get("id", ""),
-                    title=article.get("title", ""),
-                    text=article.get("text", ""),
-                    authors=article.get("authors"),
-                    journal=article.get("journal"),
-                    pub_date=article.get("pub_date")
-                )
-                full_text = ((doc.title or "") + " " + (doc.text or "")).strip()
-                if full_text:
-                    docs.append(doc)
-
-    return docs
-
-
-def tokenize_docs(docs: List[Doc]) -> List[List[str]]:
-    return [(doc.title + " " + doc.text).split() for doc in docs]
-
-
-def build_bm25(tokenized_docs: List[List[str]]) -> BM25Okapi:
-    return BM25Okapi(tokenized_docs)
-
-
-def query_bm25(query_text: str, bm25: BM25Okapi, docs: List[Doc], top_n: int = 10) -> List[Doc]:
-    tokenized_query = query_text.split()
-    scores = bm25.get_scores(tokenized_query)
-    top_indices = scores.argsort()[-top_n:][::-1]
-    results = []
-    for i in top_indices:
-        doc = docs[i]
-        doc.score = float(scores[i])
-        results.append(doc)
-    return results
+    # same rows, in the same order, as build_doc_store writes
+    return [article_to_doc(article) for _, article in iter_articles(jsonl_dir)]
 
 
-def build_faiss_index(docs: List[Doc],
+def build_faiss_index(docs: Sequence[Doc],
                       model_name: str = "all-MiniLM-L6-v2",
                       batch_size: int = 1024,
-                      save_dir: str = "faiss_chunks") -> Tuple[faiss.IndexFlatIP, np.ndarray]:
+                      save_dir: str = "faiss_chunks",
+                      index_type: str = "flat",
+                      nlist: int = 1024,
+                      pq_m: int = 16,
+                      pq_nbits: int = 8,
+                      hnsw_m: int = 32,
+                      train_size: int = 100_000,
+                      report_file: Optional[str] = None,
+                      report_k: int = 10,
+                      processes: Optional[int] = None,
+                      rescore_factor: int = 4,
+                      checkpoint_model: Optional[str] = None) -> Tuple[faiss.Index, np.ndarray]:
+    # index_type: "flat" (exact), "ivf_flat", "ivf_pq" (trained on a corpus sample), "hnsw",
+    # or "sq_fp16" / "sq_int8" (scalar-quantized flat scan, 2x / 4x smaller);
+    # report_file gets recall@report_k against exact search over a sweep of nprobe / efSearch,
+    # with and without float32 rescoring of report_k * rescore_factor candidates, and IndexFlatIP timings
+
+    start = time.perf_counter()
+
+    # embeddings go straight to save_dir/embeddings.npy, an interrupted build resumes where it stopped;
+    # processes > 1 encodes on that many CPU worker processes; checkpoint_model names the model
+    # that wrote embeddings_batch_<n>.npy files of an older build, so they can be reused
+    embeddings = encode_corpus(docs, model_name, batch_size, save_dir, processes,
+                               checkpoint_model=checkpoint_model)
+
+    # IVF and PQ are trained on at most train_size vectors
+    index_type, nlist, pq_nbits = fit_index_params(min(len(embeddings), train_size), index_type, nlist, pq_nbits)
+    index = create_faiss_index(embeddings.shape[1], index_type, nlist=nlist, pq_m=pq_m, pq_nbits=pq_nbits,
+                               hnsw_m=hnsw_m)
+    train_faiss_index(index, embeddings, train_size)
+    # added a chunk at a time from the memmap, the corpus embeddings are never all resident
+    for i in range(0, len(embeddings), batch_size):
+        index.add(np.ascontiguousarray(embeddings[i:i + batch_size]))
+
+    if report_file:
+        report = recall_report(index, embeddings, index_type, k=report_k,
+                               build_seconds=time.perf_counter() - start, rescore_factor=rescore_factor)
+        write_recall_report(report, report_file)
+    return index, embeddings
 
-    os.makedirs(save_dir, exist_ok=True)
-    model = SentenceTransformer(model_name)
 
-    all_embeddings: List[np.ndarray] = []
-    dim = None
-    index = None
+def save_faiss_index(faiss_index: faiss.Index, file_path: str) -> None:
+    faiss.write_index(faiss_index, file_path)
 
-    for i in range(0, len(docs), batch_size):
-        batch_docs = docs[i:i + batch_size]
-        texts = [doc.title + " " + doc.text for doc in batch_docs]
 
-        batch_embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+def load_faiss_index(file_path: str) -> faiss.Index:
+    return faiss.read_index(file_path)
 
-        # *** MINIMAL FIX: skip empty embedding batches ***
-        if batch_embeddings is None or batch_embeddings.shape[0] == 0:
-            continue
 
-        # attach embeddings to docs
-        for j, doc in enumerate(batch_docs):
-            doc.embedding = batch_embeddings[j]
+def search_faiss(query_text: str, faiss_index: faiss.Index,
+                 model_name: str = "all-MiniLM-L6-v2", top_k: int = 1000,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 embeddings: Optional[np.ndarray] = None, rescore_factor: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+    # the model is loaded once per process and repeated queries come from the cache
+    query_vec = get_query_encoder(model_name, default_device()).encode([query_text])
+    # nprobe (IVF) / ef_search (HNSW) trade recall for speed, ignored by other index types;
+    # embeddings (the float32 memmap from build_faiss_index) rescore the hits of a quantized index
+    D, I = ann_search(faiss_index, query_vec, top_k, nprobe, ef_search, embeddings, rescore_factor)
 
-        # save crash-safe batch
-        np.save(os.path.join(save_dir, f"embeddings_batch_{i // batch_size}.npy"), batch_embeddings)
+    # faiss pads with -1 when it finds fewer than top_k vectors
+    found = I[0] >= 0
+    return D[0][found], I[0][found]
 
-        if index is None:
-            dim = batch_embeddings.shape[1]
-            index = faiss.IndexFlatIP(dim)
 
-        index.add(batch_embeddings)
-        all_embeddings.append(batch_embeddings)
+def query_faiss(query_text: str, faiss_index: faiss.Index, docs: Sequence[Doc],
+                model_name: str = "all-MiniLM-L6-v2", top_k: int = 1000,
+                nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Doc]:
 
-    # safe because empty batches were skipped
-    all_embeddings_np = np.vstack(all_embeddings)
-    return index, all_embeddings_np
+    scores, rows = search_faiss(query_text, faiss_index, model_name, top_k, nprobe, ef_search)
+    results = [docs[i] for i in rows]
+    for i, doc in enumerate(results):
+        doc.score = float(scores[i])
+    return results
 
 
-def save_faiss_index(faiss_index: faiss.Index, file_path: str) -> None:
-    faiss.write_index(faiss_index, file_path)
+def build_bm25_index(docs: Iterable[Doc], prefix: str) -> BM25Index:
+    # corpus-wide BM25, rows in the same order as the FAISS index
+    bm25_index = BM25Index.build(docs)
+    bm25_index.save(prefix)
+    return bm25_index
 
 
-def load_faiss_index(file_path: str) -> faiss.Index:
-    return faiss.read_index(file_path)
+def query_bm25_index(query_text: str, bm25_index: BM25Index, docs: Sequence[Doc],
+                     top_n: int = 10, rows: Optional[Iterable[int]] = None) -> List[Doc]:
+    # rows restricts scoring to candidates (e.g. FAISS hits), otherwise the whole corpus is searched
+    top_rows, scores = bm25_index.search(query_text, top_n, rows)
+    results = []
+    for row, score in zip(top_rows, scores):
+        doc = docs[int(row)]
+        doc.score = float(score)
+        results.append(doc)
+    return results
 
 
-def query_faiss(query_text: str, faiss_index: faiss.Index, docs: List[Doc],
-                model_name: str = "all-MiniLM-L6-v2", top_k: int = 1000) -> List[Doc]:
+# one thread pool for every query_hybrid call in a process, created on first use
+# (a pool made at import would be copied into forked workers without its threads)
+_hybrid_executor = None
+_hybrid_executor_pid = None
+_hybrid_executor_lock = threading.Lock()
 
-    device = "mps" if torch.backends.mps.is_built() else "cpu"
-    model = SentenceTransformer(model_name, device=device)
-    query_vec = model.encode([query_text], convert_to_numpy=True)
-    D, I = faiss_index.search(query_vec, top_k)
 
-    results = [docs[i] for i in I[0]]
-    for i, doc in enumerate(results):
-        doc.score = float(D[0][i])
+def _get_hybrid_executor() -> ThreadPoolExecutor:
+    global _hybrid_executor, _hybrid_executor_pid
+    with _hybrid_executor_lock:
+        if _hybrid_executor is None or _hybrid_executor_pid != os.getpid():
+            _hybrid_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid")
+            _hybrid_executor_pid = os.getpid()
+        return _hybrid_executor
+
+
+def query_hybrid(query_text: str, faiss_index: faiss.Index, bm25_index: BM25Index, docs: Sequence[Doc],
+                 model_name: str = "all-MiniLM-L6-v2", top_n: int = 10, depth: int = 100,
+                 fusion: str = "rrf", alpha: float = 0.5,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Doc]:
+    # dense and full-corpus BM25 retrieval run concurrently, their rankings are fused
+    retriever = HybridRetriever(
+        lambda text, k: search_faiss(text, faiss_index, model_name, k, nprobe, ef_search), bm25_index,
+        executor=_get_hybrid_executor())
+    rows, scores = retriever.search(query_text, top_n, depth, fusion, alpha)
+    results = []
+    for row, score in zip(rows, scores):
+        doc = docs[int(row)]
+        doc.score = float(score)
+        results.append(doc)
     return results
@@ -0,0 +1,185 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+import multiprocessing
+import os
+import re
+import zlib
+import numpy as np
+from structures import Doc
+
+# MinHash with universal hashing h(x) = (a * x + b) mod p over 32-bit shingle hashes,
+# p is the smallest prime above 2^32 so every product fits in uint64
+MERSENNE_PRIME = np.uint64((1 << 32) + 15)
+MAX_HASH = np.uint64((1 << 32) - 1)
+WORD = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str, shingle_size: int = 5) -> np.ndarray:
+    words = WORD.findall(text.lower())
+    if len(words) <= shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    # crc32 instead of hash(): it is stable across worker processes
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64)
+
+
+def make_permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(hashes: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    values = (np.outer(hashes, a) + b) % MERSENNE_PRIME
+    return (values.min(axis=0) & MAX_HASH).astype(np.uint32)
+
+
+def choose_bands(num_perm: int, threshold: float, recall: float = 0.9) -> Tuple[int, int]:
+    # two docs with Jaccard s share a bucket with probability 1 - (1 - s^r)^b;
+    # take the longest bands that still catch pairs at the threshold with the
+    # given probability, candidates are verified on their full signatures anyway
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+
+_worker_permutations = None
+
+def _init_worker(num_perm: int, seed: int) -> None:
+    global _worker_permutations
+    _worker_permutations = make_permutations(num_perm, seed)
+
+
+def _signature_chunk(texts: List[str], shingle_size: int) -> np.ndarray:
+    a, b = _worker_permutations
+    return np.stack([minhash(shingle_hashes(text, shingle_size), a, b) for text in texts])
+
+
+def _chunked(texts: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    chunk = []
+    for text in texts:
+        chunk.append(text)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def minhash_signatures(texts: Iterable[str], num_perm: int = 128, shingle_size: int = 5, seed: int = 1,
+                       processes: Optional[int] = None, chunk_size: int = 1000) -> Iterator[np.ndarray]:
+    """Yield (chunk_size, num_perm) signature arrays in input order."""
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(num_perm, seed)
+        for chunk in _chunked(texts, chunk_size):
+            yield _signature_chunk(chunk, shingle_size)
+        return
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(num_perm, seed)) as pool:
+        # texts are streamed: at most two chunks per worker are in flight
+        pending = deque()
+        for chunk in _chunked(texts, chunk_size):
+            pending.append(pool.apply_async(_signature_chunk, (chunk, shingle_size)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]  # path halving
+        i = parent[i]
+    return i
+
+
+def _band_buckets(band: np.ndarray) -> Iterator[np.ndarray]:
+    """Rows (ascending) of every bucket of one band that holds more than one row."""
+    # each row's band values as one opaque key, rows with equal keys share a bucket
+    keys = np.ascontiguousarray(band).view(np.dtype((np.void, band.dtype.itemsize * band.shape[1]))).ravel()
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    # most buckets hold a single row, only the shared ones are grouped
+    shared = np.flatnonzero(counts[inverse] > 1)
+    shared = shared[np.argsort(inverse[shared], kind="stable")]
+    bounds = np.flatnonzero(np.diff(inverse[shared])) + 1
+    yield from np.split(shared, bounds) if len(shared) else ()
+
+
+def near_duplicate_clusters(texts: Iterable[str], threshold: float = 0.8, num_perm: int = 128,
+                            shingle_size: int = 5, seed: int = 1, processes: Optional[int] = None,
+                            chunk_size: int = 1000) -> List[int]:
+    """
+    For each text, the row of the first text in its near-duplicate cluster.
+    Band collisions are confirmed by the estimated Jaccard similarity of the
+    two signatures, so the banding only has to find candidates.
+    """
+    bands, rows = choose_bands(num_perm, threshold)
+    chunks = list(minhash_signatures(texts, num_perm, shingle_size, seed, processes, chunk_size))
+    signatures = np.concatenate(chunks) if chunks else np.empty((0, num_perm), dtype=np.uint32)
+    del chunks
+    parent: List[int] = list(range(len(signatures)))
+    min_agree = threshold * num_perm
+
+    def similar(row: int, other: int) -> bool:
+        return np.count_nonzero(signatures[other] == signatures[row]) >= min_agree
+
+    def union(row: int, other: int) -> None:
+        # the smaller row stays the root, so clusters are represented by their first doc
+        root, other_root = _find(parent, row), _find(parent, other)
+        if root != other_root:
+            parent[max(root, other_root)] = min(root, other_root)
+
+    # one band at a time, so only a single band's buckets are ever in memory
+    for band in range(bands):
+        for members in _band_buckets(signatures[:, band * rows:(band + 1) * rows]):
+            # the bucket's rows grouped by cluster; a row joins every cluster it already
+            # belongs to or that has any member passing the check, not just the first row
+            clusters: Dict[int, List[int]] = {}
+            for row in members.tolist():
+                row_root = _find(parent, row)
+                joined: Optional[List[int]] = None
+                for root, cluster in list(clusters.items()):
+                    if root != row_root and not any(similar(row, other) for other in cluster):
+                        continue
+                    union(row, cluster[0])
+                    del clusters[root]
+                    if joined is None:
+                        joined = cluster
+                    else:
+                        joined.extend(cluster)
+                if joined is None:
+                    joined = []
+                joined.append(row)
+                clusters[_find(parent, row)] = joined
+
+    return [_find(parent, row) for row in range(len(parent))]
+
+
+def dedup_docs(docs: List[Doc], threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5,
+               processes: Optional[int] = None, chunk_size: int = 1000) -> Tuple[List[Doc], Dict[str, List[str]]]:
+    """
+    Collapse near-duplicate docs (title + text) into their first occurrence.
+    Returns the kept docs in input order and representative id -> ids of
+    every doc in its cluster, the representative first.
+    """
+    texts = ((doc.title or "") + " " + (doc.text or "") for doc in docs)
+    representatives = near_duplicate_clusters(texts, threshold, num_perm, shingle_size,
+                                              processes=processes, chunk_size=chunk_size)
+    kept: List[Doc] = []
+    clusters: Dict[str, List[str]] = {}
+    for row, representative in enumerate(representatives):
+        if row == representative:
+            kept.append(docs[row])
+            clusters[docs[row].id] = [docs[row].id]
+        else:
+            clusters[docs[representative].id].append(docs[row].id)
+    return kept, clusters
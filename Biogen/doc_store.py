@@ -0,0 +1,217 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+from array import array
+from collections.abc import Mapping
+import glob
+import hashlib
+import json
+import mmap
+import os
+import numpy as np
+from structures import Doc
+
+# A document store is four files sharing a path prefix:
+#   <prefix>.records          one JSON record per line, in FAISS row order
+#                             (not .jsonl, so a store next to the corpus is never read back as input)
+#   <prefix>.offsets.npy      uint64 start of every row plus the end of the payload
+#   <prefix>.id_hashes.npy    open-addressing table: 64-bit hash of the doc id per slot
+#   <prefix>.id_rows.npy      row of the doc in each slot, -1 for an empty slot
+# Everything is opened with mmap, so startup and memory do not grow with the corpus.
+EMPTY = -1
+
+
+def article_to_doc(article: Dict) -> Doc:
+    return Doc(
+        id=article.get("id", ""),
+        title=article.get("title", ""),
+        text=article.get("text", ""),
+        authors=article.get("authors"),
+        journal=article.get("journal"),
+        pub_date=article.get("pub_date")
+    )
+
+
+def has_text(article: Dict) -> bool:
+    # the filter load_jsonl has always applied, FAISS rows are built from these articles only
+    return bool(((article.get("title", "") or "") + " " + (article.get("text", "") or "")).strip())
+
+
+def iter_articles(jsonl_dir: str) -> Iterator[tuple]:
+    """Yield (raw line, parsed article) for every article with text, in row order."""
+    for path in sorted(glob.glob(os.path.join(jsonl_dir, "*.jsonl"))):
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    article = json.loads(line)
+                except json.JSONDecodeError:
+                    # malformed lines are skipped, in the store and the FAISS rows alike
+                    continue
+                if has_text(article):
+                    yield line, article
+
+
+def id_hash(doc_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _check_id_collisions(prefix: str, offsets: np.ndarray, first_rows: np.ndarray,
+                         inverse: np.ndarray, counts: np.ndarray) -> None:
+    # rows sharing a hash must share the id too, otherwise one of the ids could never be found
+    shared = np.flatnonzero(counts[inverse] > 1)
+    if not len(shared):
+        return
+    with open(prefix + ".records", "rb") as payload:
+        def doc_id(row: int) -> str:
+            payload.seek(int(offsets[row]))
+            return str(json.loads(payload.read(int(offsets[row + 1] - offsets[row]))).get("id", ""))
+
+        for row in shared:
+            first = int(first_rows[inverse[row]])
+            if first != row and doc_id(first) != doc_id(int(row)):
+                raise ValueError(f"doc ids {doc_id(first)!r} (row {first}) and {doc_id(int(row))!r} (row {row}) "
+                                 f"have the same 64-bit hash, the store cannot tell them apart")
+
+
+def build_doc_store(jsonl_dir: str, prefix: str, rows: Optional[Iterable[int]] = None) -> int:
+    """
+    Write the store for the articles of jsonl_dir. rows optionally selects
+    which rows (in iter_articles order) to keep, e.g. the ones left after
+    dedup, so the store lines up with a FAISS index built from them.
+    Returns the number of stored docs.
+    """
+    keep = None if rows is None else set(rows)
+    offsets = array("Q", [0])
+    hashes = array("Q")
+    with open(prefix + ".records", "wb") as payload:
+        for row, (line, article) in enumerate(iter_articles(jsonl_dir)):
+            if keep is not None and row not in keep:
+                continue
+            payload.write(line)
+            payload.write(b"\n")
+            offsets.append(offsets[-1] + len(line) + 1)
+            hashes.append(id_hash(str(article.get("id", ""))))
+    offsets = np.frombuffer(offsets, dtype=np.uint64)
+    np.save(prefix + ".offsets.npy", offsets)
+
+    # one slot per distinct hash, taken by the first row with it
+    hashes = np.frombuffer(hashes, dtype=np.uint64)
+    unique, first_rows, inverse, counts = np.unique(hashes, return_index=True, return_inverse=True,
+                                                    return_counts=True)
+    _check_id_collisions(prefix, offsets, first_rows, inverse, counts)
+
+    # linear probing at load factor <= 0.5, filled in home slot order: each hash lands on
+    # its home slot or right after the run of hashes placed before it
+    num_slots = 1
+    while num_slots < 2 * len(hashes):
+        num_slots *= 2
+    slot_hashes = np.zeros(num_slots, dtype=np.uint64)
+    slot_rows = np.full(num_slots, EMPTY, dtype=np.int64)
+    mask = num_slots - 1
+    homes = (unique & np.uint64(mask)).astype(np.int64)
+    order = np.argsort(homes, kind="stable")
+    unique, first_rows, homes = unique[order], first_rows[order], homes[order]
+    rank = np.arange(len(homes))
+    slots = np.maximum.accumulate(homes - rank) + rank
+    fits = slots < num_slots
+    slot_hashes[slots[fits]] = unique[fits]
+    slot_rows[slots[fits]] = first_rows[fits]
+    # the few runs that reach the end of the table wrap around to its first free slots
+    for h, row in zip(unique[~fits], first_rows[~fits]):
+        slot = int(h) & mask
+        while slot_rows[slot] != EMPTY:
+            slot = (slot + 1) & mask
+        slot_hashes[slot] = h
+        slot_rows[slot] = row
+    np.save(prefix + ".id_hashes.npy", slot_hashes)
+    np.save(prefix + ".id_rows.npy", slot_rows)
+    return len(hashes)
+
+
+def doc_store_exists(prefix: str) -> bool:
+    return all(os.path.exists(prefix + suffix)
+               for suffix in (".records", ".offsets.npy", ".id_hashes.npy", ".id_rows.npy"))
+
+
+class DocStore:
+    """
+    Read-only, row-addressed documents. store[row] decodes one Doc on
+    access, so the store can stand in for the docs list that FAISS row ids
+    index into; store.by_id maps PMIDs to Docs.
+    """
+
+    def __init__(self, prefix: str):
+        self._file = open(prefix + ".records", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = np.load(prefix + ".offsets.npy", mmap_mode="r")
+        self._slot_hashes = np.load(prefix + ".id_hashes.npy", mmap_mode="r")
+        self._slot_rows = np.load(prefix + ".id_rows.npy", mmap_mode="r")
+        self.by_id = _DocsById(self)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def record(self, row: int) -> Dict:
+        """The raw JSON record of a row."""
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return json.loads(self._mm[int(self._offsets[row]):int(self._offsets[row + 1])])
+
+    def __getitem__(self, row: int) -> Doc:
+        return article_to_doc(self.record(row))
+
+    def __iter__(self) -> Iterator[Doc]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        h = id_hash(doc_id)
+        mask = len(self._slot_rows) - 1
+        slot = h & mask
+        while self._slot_rows[slot] != EMPTY:
+            if self._slot_hashes[slot] == h:
+                row = int(self._slot_rows[slot])
+                # confirm on the record itself, a 64-bit hash match is not a proof
+                return row if str(self.record(row).get("id", "")) == doc_id else None
+            slot = (slot + 1) & mask
+        return None
+
+    def docs(self, rows: Iterable[int]) -> List[Doc]:
+        return [self[row] for row in rows]
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+class _DocsById(Mapping):
+    """PMID -> Doc view of a DocStore, a drop-in for the old doc_lookup dict."""
+
+    def __init__(self, store: DocStore):
+        self._store = store
+
+    def __getitem__(self, doc_id: str) -> Doc:
+        row = self._store.row_of(doc_id)
+        if row is None:
+            raise KeyError(doc_id)
+        return self._store[row]
+
+    def __contains__(self, doc_id) -> bool:
+        return self._store.row_of(doc_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # rows holding a slot are the first row of every distinct id
+        rows = np.sort(self._store._slot_rows[self._store._slot_rows != EMPTY])
+        for row in rows:
+            yield self._store.record(int(row)).get("id", "")
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._store._slot_rows != EMPTY))
+
+
+def open_doc_store(prefix: str) -> DocStore:
+    return DocStore(prefix)
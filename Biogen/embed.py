@@ -0,0 +1,164 @@
+from typing import Dict, List, Optional, Sequence, Set
+from collections import deque
+import json
+import multiprocessing
+import os
+import numpy as np
+from structures import Doc
+
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDINGS_DTYPE = "float32"
+PROGRESS_FILE = "progress.json"
+
+
+def _doc_text(doc: Doc) -> str:
+    return (doc.title or "") + " " + (doc.text or "")
+
+
+def _load_progress(save_dir: str) -> Optional[Dict]:
+    path = os.path.join(save_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_progress(save_dir: str, progress: Dict) -> None:
+    # write then rename, a crash never leaves a half-written progress file
+    path = os.path.join(save_dir, PROGRESS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+
+# worker state: each process loads the model once and maps the output file on first use
+_worker_model = None
+_worker_output = None
+_worker_output_path = None
+
+def _init_worker(model_name: str, device: Optional[str], threads: Optional[int]) -> None:
+    global _worker_model
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from encoder import get_model
+    _worker_model = get_model(model_name, device)
+
+
+def _embedding_dim() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+
+def _encode_texts(texts: List[str], normalize: bool, minibatch: int = 32) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=minibatch, show_progress_bar=False, convert_to_numpy=True,
+                                normalize_embeddings=normalize).astype(EMBEDDINGS_DTYPE, copy=False)
+
+
+def _encode_batch(batch_no: int, start: int, texts: List[str], output_path: str, normalize: bool) -> int:
+    global _worker_output, _worker_output_path
+    if _worker_output_path != output_path:
+        _worker_output = np.load(output_path, mmap_mode="r+")
+        _worker_output_path = output_path
+    _worker_output[start:start + len(texts)] = _encode_texts(texts, normalize)
+    _worker_output.flush()
+    return batch_no
+
+
+def encode_corpus(docs: Sequence[Doc], model_name: str = "all-MiniLM-L6-v2", batch_size: int = 1024,
+                  save_dir: str = "faiss_chunks", processes: Optional[int] = None,
+                  device: Optional[str] = None, normalize: bool = False,
+                  checkpoint_model: Optional[str] = None) -> np.memmap:
+    """
+    Embed title + text of every doc into save_dir/embeddings.npy, a float32
+    (len(docs), dim) array written in place through a memmap. Completed
+    batches are recorded in save_dir/progress.json together with the model,
+    dtype and normalization, so an interrupted build only encodes the batches
+    that are missing, and a build with other settings starts over.
+    embeddings_batch_<n>.npy checkpoints of older builds carry no such
+    metadata; they are copied in only when checkpoint_model names the model
+    that wrote them and it is model_name (they were never normalized).
+    processes > 1 encodes on a pool of CPU workers with a bounded number of
+    batches in flight, so peak memory is about one batch per worker.
+    Returns the embeddings as a read-only memmap.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    output_path = os.path.join(save_dir, EMBEDDINGS_FILE)
+    num_batches = (len(docs) + batch_size - 1) // batch_size
+    processes = processes or 1
+    threads = max(1, (os.cpu_count() or 1) // processes) if processes > 1 else None
+    settings = {"num_docs": len(docs), "model": model_name, "dtype": EMBEDDINGS_DTYPE,
+                "normalize": normalize, "batch_size": batch_size}
+
+    progress = _load_progress(save_dir)
+    if progress is not None and (any(progress.get(key) != value for key, value in settings.items())
+                                 or not os.path.exists(output_path)):
+        # a different corpus, model or setup, the rows on disk are stale
+        progress = None
+    if progress is not None and len(progress["done"]) == num_batches:
+        return np.load(output_path, mmap_mode="r")
+
+    # spawn: torch does not survive fork once it has started its thread pools
+    context = multiprocessing.get_context("spawn")
+    pool = None
+    try:
+        if processes > 1:
+            pool = context.Pool(processes, initializer=_init_worker, initargs=(model_name, "cpu", threads))
+        else:
+            _init_worker(model_name, device, None)
+
+        if progress is None:
+            dim = pool.apply(_embedding_dim) if pool else _embedding_dim()
+            np.lib.format.open_memmap(output_path, mode="w+", dtype=EMBEDDINGS_DTYPE, shape=(len(docs), dim)).flush()
+            progress = {**settings, "dim": dim, "done": []}
+            _save_progress(save_dir, progress)
+
+        done: Set[int] = set(progress["done"])
+        if checkpoint_model == model_name and not normalize:
+            output = np.load(output_path, mmap_mode="r+")
+            for batch_no in range(num_batches):
+                checkpoint = os.path.join(save_dir, f"embeddings_batch_{batch_no}.npy")
+                start = batch_no * batch_size
+                if batch_no not in done and os.path.exists(checkpoint):
+                    batch = np.load(checkpoint)
+                    if batch.dtype == EMBEDDINGS_DTYPE and \
+                            batch.shape == (min(batch_size, len(docs) - start), progress["dim"]):
+                        output[start:start + len(batch)] = batch
+                        done.add(batch_no)
+            output.flush()
+            del output
+            progress["done"] = sorted(done)
+            _save_progress(save_dir, progress)
+
+        def finished(batch_no: int) -> None:
+            done.add(batch_no)
+            progress["done"] = sorted(done)
+            _save_progress(save_dir, progress)
+
+        todo = [batch_no for batch_no in range(num_batches) if batch_no not in done]
+        pending = deque()
+        for batch_no in todo:
+            start = batch_no * batch_size
+            # rows are read one by one, so a DocStore works as well as a list
+            texts = [_doc_text(docs[row]) for row in range(start, min(start + batch_size, len(docs)))]
+            if pool is None:
+                finished(_encode_batch(batch_no, start, texts, output_path, normalize))
+                continue
+            # two batches per worker in flight: one encoding, one queued behind it
+            pending.append(pool.apply_async(_encode_batch, (batch_no, start, texts, output_path, normalize)))
+            if len(pending) >= 2 * processes:
+                finished(pending.popleft().get())
+        while pending:
+            finished(pending.popleft().get())
+    except BaseException:
+        # stop the workers now, batches still queued would only be encoded and thrown away
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            pool = None
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return np.load(output_path, mmap_mode="r")
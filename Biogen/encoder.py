@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import numpy as np
+from sentence_transformers import SentenceTransformer
+import torch
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# process-wide: every model/device pair is loaded once
+_models: Dict[Tuple[str, str], SentenceTransformer] = {}
+_encoders: Dict[Tuple[str, str], "QueryEncoder"] = {}
+_lock = threading.Lock()
+
+
+def default_device() -> str:
+    if torch.cuda.is_available():
+        return "cuda"
+    return "mps" if torch.backends.mps.is_built() else "cpu"
+
+
+def get_model(model_name: str = DEFAULT_MODEL, device: Optional[str] = None) -> SentenceTransformer:
+    # None means the default device, so both spellings share one loaded model
+    device = device or default_device()
+    key = (model_name, device)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = SentenceTransformer(model_name, device=device)
+        return model
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split())
+
+
+class QueryEncoder:
+    """
+    Encodes query texts with a shared model and keeps the most recent
+    cache_size embeddings, keyed by (normalized text, normalize flag).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = None, cache_size: int = 10_000):
+        self.model_name = model_name
+        self.model = get_model(model_name, device)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[Tuple[str, bool], np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def encode(self, texts: List[str], normalize: bool = False) -> np.ndarray:
+        """(len(texts), dim) float32 embeddings, only cache misses reach the model."""
+        keys = [(normalize_query(text), normalize) for text in texts]
+        found: Dict[Tuple[str, bool], np.ndarray] = {}
+        with self.lock:
+            for key in keys:
+                embedding = self.cache.get(key)
+                if embedding is not None:
+                    self.cache.move_to_end(key)
+                    found[key] = embedding
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            # one batched forward pass for every miss, the model is not held under the lock
+            embeddings = self.model.encode([text for text, _ in missing], convert_to_numpy=True,
+                                           normalize_embeddings=normalize).astype("float32")
+            with self.lock:
+                for key, embedding in zip(missing, embeddings):
+                    embedding.flags.writeable = False
+                    found[key] = embedding
+                    if self.cache_size > 0:
+                        self.cache[key] = embedding
+                        self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.cache), "capacity": self.cache_size}
+
+
+def get_query_encoder(model_name: str = DEFAULT_MODEL, device: Optional[str] = None) -> QueryEncoder:
+    device = device or default_device()
+    key = (model_name, device)
+    with _lock:
+        encoder = _encoders.get(key)
+    if encoder is None:
+        # created outside _lock, get_model takes it to load the model
+        encoder = QueryEncoder(model_name, device)
+        with _lock:
+            encoder = _encoders.setdefault(key, encoder)
+    return encoder
@@ -1,13 +1,22 @@
 import os
 import json
 import random
+import fcntl
+import threading
+import time
+from typing import Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
+from doc_store import build_doc_store, doc_store_exists, open_doc_store
+from encoder import get_query_encoder
+from bm25_index import BM25Index
+from hybrid import HybridRetriever
+from ann import search as ann_search
+from batcher import QueryBatcher
 
 app = FastAPI()
 load_dotenv()
@@ -18,28 +27,148 @@ approved_key = os.getenv("API_KEY")
 # Paths
 INDEX_PATH = "/index/faiss_index.index"
 DATA_DIR = "/index/pubmed_jsonl"
+DOC_STORE_PREFIX = "/index/pubmed_docs"
+BM25_PREFIX = "/index/pubmed_bm25"
 
-# Load FAISS index
-index = faiss.read_index(INDEX_PATH)
-dim = index.d
-print(f"FAISS index loaded with {index.ntotal} vectors of dimension {dim}")
-
-# Load all JSONL docs into memory
-json_docs = []
-for file_name in sorted(os.listdir(DATA_DIR)):
-    if not file_name.endswith(".jsonl"):
-        continue
-    with open(os.path.join(DATA_DIR, file_name), "r", encoding="utf-8") as f:
-        for line in f:
+# ANN search knobs (IVF nprobe, HNSW efSearch), requests may override them
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# float32 embeddings written by build_faiss_index; when present, hits of a quantized or
+# approximate index are rescored exactly from k * FAISS_RESCORE_FACTOR candidates
+EMBEDDINGS_PATH = os.getenv("FAISS_EMBEDDINGS", "/index/embeddings.npy")
+RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", "4"))
+
+# Concurrent dense searches are coalesced: queued queries wait up to BATCH_WINDOW_MS
+# (or until BATCH_MAX_SIZE are queued) and share one encode and one FAISS search
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "64"))
+
+# FAISS_MMAP=0 reads the whole index into each worker instead of mapping it.
+# IO_FLAG_MMAP maps IVF inverted lists; flat codes (flat, SQ, HNSW storage) need
+# IO_FLAG_MMAP_IFC, which older faiss builds lack, and are then read into memory.
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") != "0"
+FAISS_IO_FLAGS = faiss.IO_FLAG_READ_ONLY
+if FAISS_MMAP:
+    FAISS_IO_FLAGS |= faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+# failed attaches are retried with exponential backoff; after ATTACH_RETRIES the worker
+# exits so the process manager replaces it
+ATTACH_RETRIES = int(os.getenv("ATTACH_RETRIES", "5"))
+ATTACH_BACKOFF_SECONDS = float(os.getenv("ATTACH_BACKOFF_SECONDS", "2"))
+
+# Serving state, attached lazily per worker process. Every large structure is memory-mapped
+# read-only, so N uvicorn workers share one copy of the index and corpus in the page cache.
+index = None
+rescore_embeddings = None
+doc_store = None
+bm25_index = None
+encoder = None
+query_batcher = None
+hybrid_retriever = None
+index_mapped = False
+ready = threading.Event()
+attach_error = None
+attach_lock = threading.Lock()
+
+
+def prepare() -> None:
+    # builds the document store and BM25 files if missing, once across workers (file lock)
+    with open(os.path.join(os.path.dirname(DOC_STORE_PREFIX), ".prepare.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Memory-mapped document store, rows line up with the FAISS index.
+        # Built once from the JSONL files with the same filter load_jsonl applies.
+        if not doc_store_exists(DOC_STORE_PREFIX):
+            print(f"Building document store at {DOC_STORE_PREFIX}...")
+            build_doc_store(DATA_DIR, DOC_STORE_PREFIX)
+        # Corpus-wide BM25 index, built once from the document store
+        if not os.path.exists(BM25_PREFIX + ".json"):
+            print(f"Building BM25 index at {BM25_PREFIX}...")
+            store = open_doc_store(DOC_STORE_PREFIX)
             try:
-                doc = json.loads(line)
-                json_docs.append(doc)
-            except json.JSONDecodeError:
-                continue
-print(f"Loaded {len(json_docs)} documents into memory")
+                BM25Index.build(store).save(BM25_PREFIX)
+            finally:
+                store.close()
+
+
+def attach() -> None:
+    global index, index_mapped, rescore_embeddings, doc_store, bm25_index, encoder, query_batcher, \
+        hybrid_retriever, attach_error
+    with attach_lock:
+        if ready.is_set():
+            return
+        try:
+            prepare()
+
+            # FAISS index mapped from the file (IVF lists, flat codes) instead of read into this process
+            index = faiss.read_index(INDEX_PATH, FAISS_IO_FLAGS)
+            index_mapped = FAISS_MMAP and (faiss.try_extract_index_ivf(index) is not None
+                                           or hasattr(faiss, "IO_FLAG_MMAP_IFC"))
+            if FAISS_MMAP and not index_mapped:
+                print("This faiss build cannot map flat codes (no IO_FLAG_MMAP_IFC), "
+                      "the index is read into this worker's memory")
+            print(f"FAISS index {'mapped' if index_mapped else 'loaded'} with {index.ntotal} vectors "
+                  f"of dimension {index.d}")
+
+            if RESCORE_FACTOR > 1 and os.path.exists(EMBEDDINGS_PATH):
+                rescore_embeddings = np.load(EMBEDDINGS_PATH, mmap_mode="r")
+                if rescore_embeddings.shape != (index.ntotal, index.d):
+                    raise RuntimeError(f"{EMBEDDINGS_PATH} has shape {rescore_embeddings.shape}, "
+                                       f"index has {(index.ntotal, index.d)}")
+                print(f"Rescoring top {RESCORE_FACTOR}x candidates from {EMBEDDINGS_PATH}")
+
+            doc_store = open_doc_store(DOC_STORE_PREFIX)
+            if len(doc_store) != index.ntotal:
+                raise RuntimeError(f"{DOC_STORE_PREFIX} has {len(doc_store)} documents, index has {index.ntotal} vectors")
+            print(f"Opened document store with {len(doc_store)} documents")
+            bm25_index = BM25Index.load(BM25_PREFIX)
+            print(f"BM25 index attached with {len(bm25_index.vocabulary)} terms")
+
+            # Shared query encoder: model loaded once per worker, repeated queries served from its LRU cache
+            encoder = get_query_encoder('all-MiniLM-L6-v2')
+            query_batcher = QueryBatcher(lambda texts: encoder.encode(texts, normalize=True), search_batch,
+                                         BATCH_WINDOW_MS, BATCH_MAX_SIZE)
+            # BM25 and FAISS first stages run side by side for mode="hybrid", the dense
+            # query goes straight to the batcher instead of blocking a pool thread
+            hybrid_retriever = HybridRetriever(query_batcher.submit, bm25_index, dense_async=True)
+            attach_error = None
+            ready.set()
+        except Exception as e:
+            attach_error = repr(e)
+            raise
+
+
+def require_ready() -> None:
+    if not ready.is_set():
+        raise HTTPException(status_code=503, detail="Index not attached yet")
+
+
+def attach_with_retry() -> None:
+    for attempt in range(ATTACH_RETRIES + 1):
+        try:
+            attach()
+            return
+        except Exception as e:
+            print(f"Attach attempt {attempt + 1} failed: {e!r}")
+            if attempt < ATTACH_RETRIES:
+                time.sleep(min(ATTACH_BACKOFF_SECONDS * 2 ** attempt, 60))
+    print(f"Could not attach after {ATTACH_RETRIES + 1} attempts, exiting worker")
+    os._exit(1)
+
 
-# Load sentence transformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# attach in the background, /ready reports when this worker can serve
+@app.on_event("startup")
+def start_attach():
+    threading.Thread(target=attach_with_retry, name="attach", daemon=True).start()
+
+
+def search_batch(queries: np.ndarray, depth: int, nprobe: Optional[int], ef_search: Optional[int]):
+    return ann_search(index, queries, depth, nprobe or DEFAULT_NPROBE, ef_search or DEFAULT_EF_SEARCH,
+                      rescore_embeddings, RESCORE_FACTOR)
+
+
+def dense_search(text: str, depth: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    return query_batcher.search(text, depth, nprobe, ef_search)
 
 
 # Pydantic model
@@ -47,13 +176,19 @@ class QueryRequest(BaseModel):
     text: str
     k: int = 5
     docid: str = None
+    mode: str = "rerank"      # "rerank": BM25 over FAISS hits, "hybrid": fused BM25 + FAISS retrieval
+    fusion: str = "rrf"       # hybrid only: "rrf" or "weighted"
+    alpha: float = 0.5        # hybrid only: weight of the dense ranking
+    nprobe: Optional[int] = None     # IVF indexes: inverted lists visited
+    ef_search: Optional[int] = None  # HNSW indexes: search beam width
 
 
 # Middleware for API key
 @app.middleware("http")
 async def verify_keys(request: Request, call_next):
     api_key = request.headers.get("x-api-key")
-    if api_key != approved_key:
+    # readiness probes come from the orchestrator, which has no API key
+    if request.url.path != "/ready" and api_key != approved_key:
         raise HTTPException(status_code=403, detail="Forbidden: Invalid API key")
     return await call_next(request)
 
@@ -61,25 +196,25 @@ async def verify_keys(request: Request, call_next):
 # Query endpoint
 @app.post("/query")
 def query_index(query: QueryRequest):
-    # Embed query
-    query_embedding = model.encode(
-        query.text,
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    ).astype('float32')
-    query_embedding = np.expand_dims(query_embedding, axis=0)
-
-    # FAISS search
+    require_ready()
+    if query.mode == "hybrid":
+        return query_hybrid(query)
+    if query.mode != "rerank":
+        raise HTTPException(status_code=400, detail=f"Unknown mode {query.mode!r}")
+
+    # Embed query and FAISS search, batched with concurrent requests
     k = query.k
-    scores, indices = index.search(query_embedding, k + 2)  # overfetch in case of skipped docs
+    scores, indices = dense_search(query.text, k + 2,  # overfetch in case of skipped docs
+                                   query.nprobe, query.ef_search)
 
-    # Collect candidates
+    # Collect candidates with their FAISS rows
     candidates = []
-    for score, idx in zip(scores[0], indices[0]):
+    candidate_rows = []
+    for score, idx in zip(scores, indices):
         if len(candidates) >= k + 2:
             break
         try:
-            result = json_docs[idx]
+            result = doc_store.record(idx)
             if query.docid and result.get("id") == query.docid:
                 continue
             candidates.append({
@@ -89,38 +224,61 @@ def query_index(query: QueryRequest):
                 "body": result.get("text", ""),
                 "url": result.get("PubmedData.ArticleIdList.ArticleId.ArticleId", "")
             })
+            candidate_rows.append(int(idx))
         except (IndexError, KeyError, json.JSONDecodeError):
             continue
 
-    # BM25 rerank
+    # BM25 rerank with corpus-wide statistics, candidates are scored by row
     if candidates:
-        candidate_texts = [c["body"] for c in candidates if c["body"]]
-        tokenized_candidates = [text.split() for text in candidate_texts if text]
-        if tokenized_candidates:
-            bm25 = BM25Okapi(tokenized_candidates)
-            query_tokens = query.text.split()
-            bm25_scores = bm25.get_scores(query_tokens)
-            for c, s in zip(candidates, bm25_scores):
-                c["score"] = round(float(s), 4)
+        bm25_scores = bm25_index.score(query.text, candidate_rows)
+        for c, s in zip(candidates, bm25_scores):
+            c["score"] = round(float(s), 4)
 
     # Return top 3 after rerank
     results = {i + 1: c for i, c in enumerate(sorted(candidates, key=lambda x: -x["score"])[:3])}
     return results
 
 
+def query_hybrid(query: QueryRequest):
+    k = query.k
+    try:
+        rows, scores = hybrid_retriever.search(query.text, top_n=k + 1, depth=max(100, k + 2),
+                                               fusion=query.fusion, alpha=query.alpha,
+                                               nprobe=query.nprobe, ef_search=query.ef_search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results = {}
+    for score, idx in zip(scores, rows):
+        if len(results) >= k:
+            break
+        result = doc_store.record(int(idx))
+        if query.docid and result.get("id") == query.docid:
+            continue
+        results[len(results) + 1] = {
+            "score": round(float(score), 4),
+            "docid": result.get("id", ""),
+            "title": result.get("MedlineCitation.Article.ArticleTitle.ArticleTitle", ""),
+            "body": result.get("text", ""),
+            "url": result.get("PubmedData.ArticleIdList.ArticleId.ArticleId", "")
+        }
+    return results
+
+
 # Random articles endpoint
 @app.get("/random")
 def get_random_articles(k: int = Query(default=5, ge=1, le=2000)):
+    require_ready()
     results = {}
     seen_indices = set()
     count = 0
     while count < k:
-        idx = random.randint(0, len(json_docs) - 1)
+        idx = random.randint(0, len(doc_store) - 1)
         if idx in seen_indices:
             continue
         seen_indices.add(idx)
         try:
-            doc = json_docs[idx]
+            doc = doc_store.record(idx)
             results[count + 1] = {
                 "docid": doc.get("id", ""),
                 "title": doc.get("MedlineCitation.Article.ArticleTitle.ArticleTitle", ""),
@@ -131,3 +289,38 @@ def get_random_articles(k: int = Query(default=5, ge=1, le=2000)):
         except (KeyError, json.JSONDecodeError):
             continue
     return results
+
+
+# Query embedding cache counters
+@app.get("/metrics/encoder")
+def get_encoder_metrics():
+    require_ready()
+    return encoder.stats()
+
+
+# Micro-batching counters: batch size histogram, queue depth, settings
+@app.get("/metrics/batching")
+def get_batching_metrics():
+    require_ready()
+    return query_batcher.stats()
+
+
+# Readiness of this worker: 200 once the index, documents and BM25 are attached, 503 before
+@app.get("/ready")
+def get_ready():
+    if not ready.is_set():
+        return JSONResponse(status_code=503, content={"ready": False, "pid": os.getpid(), "error": attach_error})
+    return {
+        "ready": True,
+        "pid": os.getpid(),
+        "vectors": int(index.ntotal),
+        "documents": len(doc_store),
+        "bm25_terms": len(bm25_index.vocabulary),
+        "faiss_mmap": index_mapped,
+        "rescoring": rescore_embeddings is not None,
+    }
+
+
+if __name__ == "__main__":
+    # build the document store and BM25 files ahead of starting the workers
+    prepare()
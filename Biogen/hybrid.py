@@ -0,0 +1,103 @@
+from typing import Callable, Optional, Sequence, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import numpy as np
+from bm25_index import BM25Index
+
+# (query text, depth, **knobs) -> (scores, rows), best first, or a Future of them
+DenseSearch = Callable[..., Tuple[np.ndarray, np.ndarray]]
+DenseSubmit = Callable[..., "Future[Tuple[np.ndarray, np.ndarray]]"]
+
+
+def _top(rows: np.ndarray, scores: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # highest fused score first, ties in row order
+    order = np.lexsort((rows, -scores))[:top_n]
+    return rows[order], scores[order]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], top_n: int, k: float = 60.0,
+                           weights: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse ranked row lists with score(row) = sum of w / (k + rank), rank starting at 1."""
+    weights = weights or [1.0] * len(rankings)
+    rankings = [np.asarray(rows, dtype=np.int64) for rows in rankings]
+    rows = np.concatenate(rankings)
+    contributions = np.concatenate([w / (k + np.arange(1, len(r) + 1)) for w, r in zip(weights, rankings)])
+    fused_rows, inverse = np.unique(rows, return_inverse=True)
+    return _top(fused_rows, np.bincount(inverse, weights=contributions), top_n)
+
+
+def weighted_score_fusion(results: Sequence[Tuple[np.ndarray, np.ndarray]], top_n: int,
+                          weights: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse (rows, scores) lists by a weighted sum of min-max normalized scores;
+    a row missing from a list gets 0 from it.
+    """
+    weights = weights or [1.0] * len(results)
+    all_rows, all_scores = [], []
+    for w, (rows, scores) in zip(weights, results):
+        scores = np.asarray(scores, dtype=np.float64)
+        if not len(scores):
+            continue
+        span = scores.max() - scores.min()
+        all_rows.append(np.asarray(rows, dtype=np.int64))
+        all_scores.append(w * ((scores - scores.min()) / span if span > 0 else np.ones_like(scores)))
+    if not all_rows:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    fused_rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+    return _top(fused_rows, np.bincount(inverse, weights=np.concatenate(all_scores)), top_n)
+
+
+class HybridRetriever:
+    """
+    First-stage retrieval from both the dense index and the corpus-wide
+    BM25 index, with their rankings fused. The BM25 search runs in the
+    calling thread while the dense search runs elsewhere, so latency is
+    about the slower of the two. With dense_async the dense callable
+    already returns a Future (e.g. QueryBatcher.submit) and no thread is
+    used for it; otherwise it runs on a thread pool (faiss, numpy and torch
+    release the GIL). A shared executor can be passed in, otherwise the
+    retriever creates one on first use and close() shuts it down.
+    """
+
+    def __init__(self, dense_search: DenseSearch, bm25_index: BM25Index, max_workers: int = 4,
+                 executor: Optional[ThreadPoolExecutor] = None, dense_async: bool = False):
+        self.dense_search = dense_search
+        self.bm25_index = bm25_index
+        self.dense_async = dense_async
+        self.max_workers = max_workers
+        self.owns_executor = executor is None
+        self.executor = executor
+        self.lock = threading.Lock()
+
+    def _submit_dense(self, query_text: str, depth: int, **dense_kwargs) -> Future:
+        if self.dense_async:
+            return self.dense_search(query_text, depth, **dense_kwargs)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hybrid")
+        return self.executor.submit(self.dense_search, query_text, depth, **dense_kwargs)
+
+    def search(self, query_text: str, top_n: int = 10, depth: int = 100, fusion: str = "rrf",
+               alpha: float = 0.5, rrf_k: float = 60.0, **dense_kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fused top_n (rows, scores) from the best depth hits of each stage.
+        fusion is "rrf" (reciprocal rank) or "weighted" (alpha * dense +
+        (1 - alpha) * BM25 on min-max normalized scores). dense_kwargs
+        (e.g. nprobe, ef_search) are passed on to the dense search.
+        """
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"unknown fusion {fusion!r}, expected 'rrf' or 'weighted'")
+
+        dense_future = self._submit_dense(query_text, depth, **dense_kwargs)
+        sparse_rows, sparse_scores = self.bm25_index.search(query_text, depth)
+        dense_scores, dense_rows = dense_future.result()
+
+        if fusion == "rrf":
+            return reciprocal_rank_fusion([dense_rows, sparse_rows], top_n, rrf_k, [alpha, 1 - alpha])
+        return weighted_score_fusion([(dense_rows, dense_scores), (sparse_rows, sparse_scores)],
+                                     top_n, [alpha, 1 - alpha])
+
+    def close(self) -> None:
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -1,9 +1,14 @@
 from build_index import *
+from dedup import dedup_docs
+from embed import EMBEDDINGS_FILE
+from ann import is_exact
+from doc_store import build_doc_store, doc_store_exists, open_doc_store
 from preprocess import preprocess_query
 from llm_answering import answer_docs_with_llm
 from report_gen import generate_biogen_report
-from typing import List, Dict
+from typing import List, Dict, Optional
 import nltk
+import json
 import numpy as np
 import faiss
 import os
@@ -15,41 +20,89 @@ def run_pipeline(
         top_n_faiss: int = 10,
         top_k_bm25: int = 3,
         question_id: str = "Q1",
-        report_file: str = "biogen_report.json") -> None:
+        report_file: str = "biogen_report.json",
+        dedup: bool = False,
+        index_type: str = "flat",
+        encode_processes: Optional[int] = None) -> None:
 
-    print("Loading JSONL documents...")
-    docs = load_jsonl(jsonl_dir)
-    doc_lookup = {doc.id: doc for doc in docs}  # build lookup for metadata
-    print("Loaded", len(docs), "documents")
+    # documents are served from a memory-mapped store whose rows line up with the FAISS index
+    doc_store_prefix = os.path.splitext(faiss_index_file)[0] + "_docs"
 
-    # build or load FAISS index
-    if os.path.exists(faiss_index_file):
+    if os.path.exists(faiss_index_file) and doc_store_exists(doc_store_prefix):
         print("Loading existing FAISS index...")
-        full_index = load_faiss_index(faiss_index_file)
-        faiss_index = full_index
+        faiss_index = load_faiss_index(faiss_index_file)
         print("Faiss index loaded")
 
     else:
-        print("Building FAISS index on full corpus...")
-        faiss_index, _ = build_faiss_index(docs)
-        save_faiss_index(faiss_index, faiss_index_file)
-        print("FAISS index built and saved")
+        print("Loading JSONL documents...")
+        all_docs = load_jsonl(jsonl_dir)
+        docs = all_docs
+        print("Loaded", len(docs), "documents")
+
+        # FAISS rows follow the doc list, so an index built with dedup must be queried with dedup
+        if dedup:
+            print("Collapsing near-duplicate documents...")
+            docs, clusters = dedup_docs(docs)
+            print("Kept", len(docs), "representative documents")
+            # kept id -> ids collapsed into it, so every dropped duplicate can be traced
+            dedup_file = os.path.splitext(faiss_index_file)[0] + "_dedup.json"
+            with open(dedup_file, "w", encoding="utf-8") as f:
+                json.dump({rep: ids for rep, ids in clusters.items() if len(ids) > 1}, f, indent=2)
+            print("Duplicate clusters written to", dedup_file)
+
+        if os.path.exists(faiss_index_file):
+            print("Loading existing FAISS index...")
+            faiss_index = load_faiss_index(faiss_index_file)
+            print("Faiss index loaded")
+        else:
+            print("Building FAISS index on full corpus...")
+            # ANN index types also write a recall@10 vs exact search report next to the index
+            faiss_index, _ = build_faiss_index(
+                docs, index_type=index_type, processes=encode_processes,
+                report_file=None if index_type == "flat" else os.path.splitext(faiss_index_file)[0] + "_recall.json")
+            save_faiss_index(faiss_index, faiss_index_file)
+            print("FAISS index built and saved")
+
+        print("Writing document store...")
+        kept = {id(doc) for doc in docs}
+        build_doc_store(jsonl_dir, doc_store_prefix,
+                        rows=[row for row, doc in enumerate(all_docs) if id(doc) in kept])
+        del all_docs, docs
+
+    docs = open_doc_store(doc_store_prefix)
+    doc_lookup = docs.by_id  # lookup for metadata
+    print("Opened document store with", len(docs), "documents")
+
+    # BM25 over the whole corpus with global IDF, built once and then memory-mapped
+    bm25_prefix = os.path.splitext(faiss_index_file)[0] + "_bm25"
+    if os.path.exists(bm25_prefix + ".json"):
+        bm25_index = BM25Index.load(bm25_prefix)
+    else:
+        print("Building BM25 index on full corpus...")
+        bm25_index = build_bm25_index(docs, bm25_prefix)
+        print("BM25 index built and saved")
 
     print("Preprocessing query...")
     query_text = preprocess_query(narrative)
     print("Query preprocessing complete")
 
+    # approximate and quantized indexes rescore their hits with the float32 embeddings, memory-mapped;
+    # decided by the index on disk, which may have been built with another index_type than this run's
+    embeddings_file = os.path.join("faiss_chunks", EMBEDDINGS_FILE)
+    embeddings = None
+    if not is_exact(faiss_index) and os.path.exists(embeddings_file):
+        embeddings = np.load(embeddings_file, mmap_mode="r")
+        if embeddings.shape != (faiss_index.ntotal, faiss_index.d):
+            print(f"{embeddings_file} has shape {embeddings.shape}, index has "
+                  f"{(faiss_index.ntotal, faiss_index.d)}, hits are not rescored")
+            embeddings = None
+
     print(f"Querying FAISS top {top_n_faiss} documents...")
-    faiss_top = query_faiss(query_text, faiss_index, docs, top_k=top_n_faiss)
+    _, faiss_rows = search_faiss(query_text, faiss_index, top_k=top_n_faiss, embeddings=embeddings)
     print("FAISS query complete")
 
-    print(f"Building BM25 index on FAISS top {top_n_faiss} candidates...")
-    tokenized = tokenize_docs(faiss_top)
-    bm25 = build_bm25(tokenized)
-    print("BM25 index on FAISS candidates built")
-
-    print(f"Reranking top {top_k_bm25} documents with BM25...")
-    final_top = query_bm25(query_text, bm25, faiss_top, top_n=top_k_bm25)
+    print(f"Reranking top {top_k_bm25} documents with corpus-wide BM25...")
+    final_top = query_bm25_index(query_text, bm25_index, docs, top_n=top_k_bm25, rows=faiss_rows)
     print("BM25 reranking complete")
 
     print("Sending top documents to LLM for answering...")
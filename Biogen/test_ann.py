@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from ann import (INDEX_TYPES, create_faiss_index, exact_top_k, fit_index_params, is_exact,  # noqa: E402
+                 recall_report, rescore, search, train_faiss_index)
+
+
+@pytest.fixture(scope="module")
+def embeddings():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(index_type, embeddings):
+    index = create_faiss_index(embeddings.shape[1], index_type, nlist=16, pq_m=8, hnsw_m=16)
+    train_faiss_index(index, embeddings, train_size=1000)
+    index.add(embeddings)
+    return index
+
+
+def test_exact_top_k_matches_brute_force(embeddings):
+    queries = embeddings[:20]
+    found = exact_top_k(embeddings, queries, 5, chunk_size=300)
+    expected = np.argsort(-(queries @ embeddings.T), axis=1)[:, :5]
+    assert [set(row) for row in found] == [set(row) for row in expected]
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_index_types_find_the_query_itself(embeddings, index_type):
+    index = build(index_type, embeddings)
+    assert index.ntotal == len(embeddings)
+    _, rows = search(index, embeddings[:50], 10, nprobe=16, ef_search=64)
+    # with every list probed, a corpus vector comes back among its own neighbours
+    assert np.mean([row in found for row, found in zip(range(50), rows)]) >= 0.9
+
+
+def test_recall_report_sweeps_the_search_knob(embeddings):
+    index = build("ivf_flat", embeddings)
+    report = recall_report(index, embeddings, "ivf_flat", k=10, num_queries=100, sweep=[1, 16])
+    assert report["index_type"] == "ivf_flat" and report["ntotal"] == len(embeddings)
+    assert [result["value"] for result in report["results"]] == [1, 16]
+    assert report["results"][0]["recall"] <= report["results"][1]["recall"] == pytest.approx(1.0)
+
+
+def test_rescore_ranks_candidates_exactly(embeddings):
+    queries = embeddings[:3]
+    rows = np.array([[5, 1, -1, 7], [2, 2, 9, -1], [-1, -1, -1, -1]])
+    scores, found = rescore(embeddings, queries, rows, 3)
+    for query, candidates, top, top_scores in zip(queries, rows, found, scores):
+        candidates = candidates[candidates >= 0]
+        exact = embeddings[candidates] @ query
+        order = np.argsort(-exact, kind="stable")[:3]
+        assert list(top[:len(order)]) == list(candidates[order])
+        np.testing.assert_allclose(top_scores[:len(order)], exact[order], rtol=1e-5)
+        # padding stays -1
+        assert all(top[len(order):] == -1)
+
+
+@pytest.mark.parametrize("index_type", ["sq_int8", "ivf_pq"])
+def test_rescoring_recovers_recall_of_lossy_indexes(embeddings, index_type):
+    index = build(index_type, embeddings)
+    report = recall_report(index, embeddings, index_type, k=10, num_queries=100, sweep=[16], rescore_factor=4)
+    plain, rescored = report["results"]
+    assert rescored["rescore_factor"] == 4
+    assert rescored["recall"] >= plain["recall"]
+    assert report["baseline"]["index_bytes"] == len(embeddings) * embeddings.shape[1] * 4
+    assert report["index_bytes"] < report["baseline"]["index_bytes"]
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        create_faiss_index(8, "lsh")
+
+
+@pytest.mark.parametrize("num_vectors, expected", [(2000, ("ivf_pq", 51, 8)), (100, ("ivf_pq", 2, 6)),
+                                                   (10, ("flat", 1, 8))])
+def test_small_corpora_get_trainable_settings(embeddings, num_vectors, expected):
+    with pytest.warns(UserWarning):
+        index_type, nlist, pq_nbits = fit_index_params(num_vectors, "ivf_pq", 1024, 8)
+    assert (index_type, nlist, pq_nbits) == expected
+    vectors = embeddings[:num_vectors]
+    index = create_faiss_index(vectors.shape[1], index_type, nlist=nlist, pq_m=8, pq_nbits=pq_nbits)
+    train_faiss_index(index, vectors)
+    index.add(vectors)
+    assert search(index, vectors[:5], 1)[1][:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert is_exact(index) == (index_type == "flat")
@@ -0,0 +1,84 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batcher import QueryBatcher
+
+
+class Backend:
+    def __init__(self, fail=False):
+        self.encoded = []
+        self.searches = []
+        self.fail = fail
+
+    def encode_batch(self, texts):
+        self.encoded.append(list(texts))
+        return np.array([[float(len(text))] for text in texts], dtype="float32")
+
+    def search_batch(self, queries, depth, nprobe, ef_search):
+        if self.fail:
+            raise RuntimeError("index gone")
+        self.searches.append((len(queries), depth, nprobe, ef_search))
+        # row r of the answer for a query of length n is n * 10 + r; rows past 3 are faiss padding
+        rows = np.array([[int(q[0]) * 10 + r if r < 3 else -1 for r in range(depth)] for q in queries])
+        scores = -np.arange(depth, dtype="float32")[None, :].repeat(len(queries), axis=0)
+        return scores, rows
+
+
+def test_concurrent_queries_share_one_batch():
+    backend = Backend()
+    batcher = QueryBatcher(backend.encode_batch, backend.search_batch, window_ms=200, max_batch=64)
+    futures = [batcher.submit("a" * n, depth=n) for n in range(1, 6)]
+    results = [future.result(timeout=5) for future in futures]
+
+    assert backend.encoded == [["a", "aa", "aaa", "aaaa", "aaaaa"]]
+    assert backend.searches == [(5, 5, None, None)]
+    for n, (scores, rows) in enumerate(results, start=1):
+        # truncated to each caller's depth, padding dropped
+        assert list(rows) == [n * 10 + r for r in range(min(n, 3))]
+        assert len(scores) == len(rows)
+
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["queries"] == 5
+    assert stats["mean_batch_size"] == 5.0 and stats["batch_size_counts"] == {5: 1}
+
+
+def test_search_parameters_are_grouped():
+    backend = Backend()
+    batcher = QueryBatcher(backend.encode_batch, backend.search_batch, window_ms=200)
+    futures = [batcher.submit("a", 2, nprobe=4), batcher.submit("bb", 3, nprobe=8), batcher.submit("c", 1, nprobe=4)]
+    for future in futures:
+        future.result(timeout=5)
+    assert len(backend.encoded) == 1
+    assert sorted(backend.searches, key=lambda s: s[2]) == [(2, 2, 4, None), (1, 3, 8, None)]
+
+
+def test_max_batch_and_blocking_search():
+    backend = Backend()
+    batcher = QueryBatcher(backend.encode_batch, backend.search_batch, window_ms=200, max_batch=2)
+    results = {}
+
+    def search(n):
+        results[n] = batcher.search("a" * n, 2)
+
+    threads = [threading.Thread(target=search, args=(n,)) for n in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert sorted(results) == [1, 2, 3, 4]
+    assert all(len(texts) <= 2 for texts in backend.encoded)
+    assert list(results[4][1]) == [40, 41]
+
+
+def test_errors_reach_every_caller():
+    backend = Backend(fail=True)
+    batcher = QueryBatcher(backend.encode_batch, backend.search_batch, window_ms=100)
+    futures = [batcher.submit("a", 1), batcher.submit("b", 1)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    # the worker survives a failed batch
+    backend.fail = False
+    assert list(batcher.search("abc", 1)[1]) == [30]
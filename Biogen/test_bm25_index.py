@@ -0,0 +1,68 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from bm25_index import BM25Index, tokenize
+from structures import Doc
+
+
+@pytest.fixture
+def docs():
+    rng = random.Random(0)
+    words = ["gene", "protein", "cell", "tumor", "insulin", "rna", "virus", "mouse"]
+    return [Doc(str(i), rng.choice(words).title(), " ".join(rng.choices(words, k=rng.randint(0, 20))))
+            for i in range(60)]
+
+
+def brute_force_scores(docs, query, k1=1.5, b=0.75):
+    tokenized = [tokenize(doc.title + " " + doc.text) for doc in docs]
+    avgdl = sum(map(len, tokenized)) / len(tokenized)
+    scores = []
+    for tokens in tokenized:
+        score = 0.0
+        for term in tokenize(query):
+            df = sum(term in other for other in tokenized)
+            if not df:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            tf = tokens.count(term)
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avgdl))
+        scores.append(score)
+    return np.array(scores)
+
+
+@pytest.mark.parametrize("query", ["gene", "Tumor insulin", "rna rna virus", "unknown words"])
+def test_scores_match_okapi_bm25(docs, query):
+    index = BM25Index.build(docs)
+    expected = brute_force_scores(docs, query)
+    np.testing.assert_allclose(index.score(query, range(len(docs))), expected, rtol=1e-5)
+
+    rows, scores = index.search(query, top_n=5)
+    matching = np.flatnonzero(expected > 0)
+    best = sorted(matching, key=lambda row: (-expected[row], row))[:5]
+    assert list(rows) == best
+    np.testing.assert_allclose(scores, expected[best], rtol=1e-5)
+
+
+def test_search_within_candidates(docs):
+    index = BM25Index.build(docs)
+    rows, scores = index.search("protein cell", top_n=3, rows=[5, 1, 40, 7])
+    assert set(rows) <= {5, 1, 40, 7} and len(rows) == 3
+    assert list(scores) == sorted(scores, reverse=True)
+    assert len(index.search("protein", top_n=0)[0]) == 0
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load(tmp_path, docs, mmap):
+    index = BM25Index.build(docs, k1=1.2, b=0.5)
+    prefix = str(tmp_path / "bm25")
+    index.save(prefix)
+    loaded = BM25Index.load(prefix, mmap=mmap)
+    assert len(loaded) == len(docs)
+    assert (loaded.k1, loaded.b) == (1.2, 0.5)
+    assert loaded.vocabulary == index.vocabulary
+    for query in ("gene mouse", "rna"):
+        for expected, found in zip(index.search(query, top_n=10), loaded.search(query, top_n=10)):
+            np.testing.assert_array_equal(expected, found)
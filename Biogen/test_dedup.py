@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from dedup import choose_bands, dedup_docs, make_permutations, minhash, near_duplicate_clusters, shingle_hashes
+from structures import Doc
+
+
+def random_text(rng, words=60):
+    return " ".join(f"w{rng.randrange(5000)}" for _ in range(words))
+
+
+def jaccard(first, second):
+    first, second = set(shingle_hashes(first)), set(shingle_hashes(second))
+    return len(first & second) / len(first | second)
+
+
+def test_signature_agreement_estimates_jaccard():
+    rng = random.Random(0)
+    text = random_text(rng, 200)
+    words = text.split()
+    edited = " ".join(words[:180] + [random_text(rng, 20)])
+    a, b = make_permutations(256)
+    agreement = np.mean(minhash(shingle_hashes(text), a, b) == minhash(shingle_hashes(edited), a, b))
+    assert agreement == pytest.approx(jaccard(text, edited), abs=0.08)
+
+
+def test_choose_bands_reaches_recall_at_threshold():
+    bands, rows = choose_bands(128, 0.8)
+    assert bands * rows == 128
+    assert 1 - (1 - 0.8 ** rows) ** bands >= 0.9
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_clusters_near_duplicates_only(processes):
+    rng = random.Random(1)
+    originals = [random_text(rng) for _ in range(50)]
+    texts = list(originals)
+    # exact copies, case/punctuation variants and one-word edits of the first ten
+    texts += [originals[i] for i in range(5)]
+    texts += [originals[i].upper() + "!" for i in range(5, 8)]
+    texts += [originals[i].replace(originals[i].split()[-1], "changed") for i in range(8, 10)]
+
+    representatives = near_duplicate_clusters(texts, processes=processes, chunk_size=7)
+    assert representatives[:50] == list(range(50))
+    assert representatives[50:] == list(range(10))
+
+
+def test_dedup_docs_keeps_first_occurrence():
+    rng = random.Random(2)
+    body = random_text(rng)
+    docs = [Doc("a", "Title", body), Doc("b", "Other", random_text(rng)), Doc("c", "Title", body),
+            Doc("d", "title", body + "."), Doc("e", None, None)]
+    kept, clusters = dedup_docs(docs, processes=1)
+    assert [doc.id for doc in kept] == ["a", "b", "e"]
+    assert clusters == {"a": ["a", "c", "d"], "b": ["b"], "e": ["e"]}
+
+
+def test_rows_are_checked_against_every_bucket_member(monkeypatch):
+    # 16 bands of 8 rows at num_perm=128, threshold=0.8; the rows only share band 0 in full
+    first = np.arange(128, dtype=np.uint32)
+    middle = first.copy()
+    last = first.copy()
+    last[8:128:8] += 1000                       # one position per band 1..15: agrees with middle on 113
+    for position in [8 * k + 1 for k in range(1, 14)] + [8 * k + 2 for k in range(1, 13)]:
+        first[position] += 2000                 # agrees with middle on 103, with last on 88
+    other = first + 5000
+    monkeypatch.setattr("dedup.minhash_signatures",
+                        lambda *args, **kwargs: iter([np.stack([first, other, middle, last])]))
+    # band 0 buckets first, middle and last together; last fails against first but passes against middle
+    assert near_duplicate_clusters(["unused"] * 4, threshold=0.8, num_perm=128) == [0, 1, 0, 0]
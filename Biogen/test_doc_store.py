@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import doc_store
+from doc_store import build_doc_store, doc_store_exists, open_doc_store
+
+ARTICLES = [
+    {"id": "101", "title": "Aspirin", "text": "reduces fever", "authors": ["A"]},
+    {"id": "102", "title": "", "text": ""},                       # no text, never a FAISS row
+    {"id": "103", "title": "Zinc", "text": "and colds ünïcode"},
+    {"id": "101", "title": "Aspirin again", "text": "duplicate id"},
+]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "jsonl"
+    directory.mkdir()
+    (directory / "a.jsonl").write_text("\n".join(json.dumps(a) for a in ARTICLES[:2]) + "\n\n")
+    (directory / "b.jsonl").write_text("\n".join(json.dumps(a) for a in ARTICLES[2:]) + "\n")
+    return str(directory)
+
+
+def test_rows_follow_corpus_order(tmp_path, corpus):
+    prefix = str(tmp_path / "docs")
+    assert build_doc_store(corpus, prefix) == 3
+    assert doc_store_exists(prefix)
+    store = open_doc_store(prefix)
+    try:
+        assert len(store) == 3
+        assert [doc.title for doc in store] == ["Aspirin", "Zinc", "Aspirin again"]
+        assert store.record(1) == ARTICLES[2]
+        assert store[0].authors == ["A"]
+        with pytest.raises(IndexError):
+            store.record(3)
+
+        # the first row with an id wins
+        assert store.row_of("101") == 0
+        assert store.row_of("103") == 1
+        assert store.row_of("102") is None
+        assert store.by_id["103"].text == "and colds ünïcode"
+        assert "999" not in store.by_id
+        with pytest.raises(KeyError):
+            store.by_id["999"]
+        assert list(store.by_id) == ["101", "103"]
+        assert len(store.by_id) == 2
+    finally:
+        store.close()
+
+
+def test_selected_rows(tmp_path, corpus):
+    prefix = str(tmp_path / "docs")
+    assert build_doc_store(corpus, prefix, rows=[1, 2]) == 2
+    store = open_doc_store(prefix)
+    try:
+        assert [doc.id for doc in store] == ["103", "101"]
+        assert store.row_of("101") == 1
+    finally:
+        store.close()
+
+
+def test_empty_store(tmp_path):
+    prefix = str(tmp_path / "docs")
+    assert build_doc_store(str(tmp_path), prefix) == 0
+    store = open_doc_store(prefix)
+    try:
+        assert len(store) == 0
+        assert store.row_of("101") is None
+        assert list(store.by_id) == []
+    finally:
+        store.close()
+
+
+def test_malformed_lines_are_skipped(tmp_path, corpus):
+    with open(tmp_path / "jsonl" / "a.jsonl", "a") as f:
+        f.write('{"id": "104", "title": "trunc\n')
+    prefix = str(tmp_path / "docs")
+    assert build_doc_store(corpus, prefix) == 3
+    store = open_doc_store(prefix)
+    try:
+        assert [doc.id for doc in store] == ["101", "103", "101"]
+    finally:
+        store.close()
+
+
+def test_every_id_is_found(tmp_path, monkeypatch):
+    # distinct hashes, half of them on the same home slot near the end of the 1024-slot table,
+    # so the run chains past its end and wraps around
+    monkeypatch.setattr(doc_store, "id_hash", lambda doc_id: int(doc_id) * 2 ** 40 + (1020 if int(doc_id) % 2 else 3))
+    directory = tmp_path / "jsonl"
+    directory.mkdir()
+    ids = [str(i) for i in range(500)] + ["3", "7"]
+    (directory / "a.jsonl").write_text("".join(json.dumps({"id": i, "text": "t"}) + "\n" for i in ids))
+    prefix = str(tmp_path / "docs")
+    assert build_doc_store(str(directory), prefix) == 502
+    store = open_doc_store(prefix)
+    try:
+        assert [store.row_of(i) for i in ids[:500]] == list(range(500))
+        assert store.row_of("500") is None
+        assert len(store.by_id) == 500
+    finally:
+        store.close()
+
+
+def test_hash_collision_between_ids_fails(tmp_path, corpus, monkeypatch):
+    monkeypatch.setattr(doc_store, "id_hash", lambda doc_id: 42)
+    with pytest.raises(ValueError, match="same 64-bit hash"):
+        build_doc_store(corpus, str(tmp_path / "docs"))
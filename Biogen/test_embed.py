@@ -0,0 +1,142 @@
+import json
+import os
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("torch")
+
+import embed  # noqa: E402
+import encoder  # noqa: E402
+from structures import Doc  # noqa: E402
+
+DIM = 4
+
+
+def fake_embedding(text):
+    return np.array([len(text), text.count("a"), zlib.crc32(text.encode()) % 97, 1.0], dtype="float32")
+
+
+class FakeModel:
+    device = "cpu"
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, batch_size=32, show_progress_bar=None, convert_to_numpy=False,
+               normalize_embeddings=False):
+        assert convert_to_numpy
+        self.encoded.extend(texts)
+        embeddings = np.stack([fake_embedding(text) for text in texts])
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(encoder, "get_model", lambda model_name, device=None: model)
+    monkeypatch.setattr(embed, "_worker_output_path", None)
+    return model
+
+
+@pytest.fixture
+def docs():
+    return [Doc(str(i), f"title {i}", "a" * i) for i in range(10)]
+
+
+def expected(docs):
+    return np.stack([fake_embedding(embed._doc_text(doc)) for doc in docs])
+
+
+def test_encodes_every_doc_into_a_memmap(tmp_path, model, docs):
+    # more docs than one encode mini-batch
+    docs = [Doc(str(i), f"title {i}", "a" * (i % 7)) for i in range(100)]
+    embeddings = embed.encode_corpus(docs, "fake", batch_size=40, save_dir=str(tmp_path))
+    assert embeddings.dtype == np.float32 and embeddings.shape == (100, DIM)
+    np.testing.assert_array_equal(embeddings, expected(docs))
+    with open(tmp_path / embed.PROGRESS_FILE) as f:
+        assert json.load(f)["done"] == [0, 1, 2]
+
+
+def test_normalized_embeddings(tmp_path, model, docs):
+    embeddings = embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path), normalize=True)
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-6)
+    raw = expected(docs)
+    np.testing.assert_allclose(embeddings, raw / np.linalg.norm(raw, axis=1, keepdims=True), rtol=1e-6)
+
+
+def test_resume_only_encodes_missing_batches(tmp_path, model, docs):
+    embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path))
+    progress_path = tmp_path / embed.PROGRESS_FILE
+    progress = json.loads(progress_path.read_text())
+    progress["done"] = [0, 2, 3]                        # batch 1 was interrupted
+    progress_path.write_text(json.dumps(progress))
+
+    model.encoded.clear()
+    embeddings = embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path))
+    assert sorted(model.encoded) == sorted(embed._doc_text(doc) for doc in docs[3:6])
+    np.testing.assert_array_equal(embeddings, expected(docs))
+
+    # everything done, nothing is encoded
+    model.encoded.clear()
+    embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path))
+    assert model.encoded == []
+
+
+def test_other_settings_start_over(tmp_path, model, docs):
+    embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path))
+    model.encoded.clear()
+    embed.encode_corpus(docs[:7], "fake", batch_size=3, save_dir=str(tmp_path))
+    assert len(model.encoded) == 7
+    model.encoded.clear()
+    embed.encode_corpus(docs[:7], "other", batch_size=3, save_dir=str(tmp_path))
+    assert len(model.encoded) == 7
+    assert os.path.exists(tmp_path / embed.EMBEDDINGS_FILE)
+
+
+@pytest.mark.parametrize("checkpoint_model, normalize, imported", [("fake", False, True), (None, False, False),
+                                                                  ("other", False, False), ("fake", True, False)])
+def test_legacy_checkpoints(tmp_path, model, docs, checkpoint_model, normalize, imported):
+    legacy = np.full((3, DIM), 7.0, dtype="float32")
+    np.save(tmp_path / "embeddings_batch_1.npy", legacy)
+    embeddings = embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path), normalize=normalize,
+                                     checkpoint_model=checkpoint_model)
+    assert (sorted(model.encoded) == sorted(embed._doc_text(doc) for doc in docs[:3] + docs[6:])) == imported
+    if imported:
+        np.testing.assert_array_equal(embeddings[3:6], legacy)
+
+
+def test_pool_is_terminated_on_error(tmp_path, monkeypatch, docs):
+    class FailedResult:
+        def get(self):
+            raise RuntimeError("worker died")
+
+    class FakePool:
+        calls = []
+
+        def __init__(self, processes, initializer, initargs):
+            pass
+
+        def apply(self, func):
+            return DIM
+
+        def apply_async(self, func, args):
+            return FailedResult()
+
+        def __getattr__(self, name):
+            return lambda: FakePool.calls.append(name)
+
+    class FakeContext:
+        Pool = FakePool
+
+    monkeypatch.setattr(embed.multiprocessing, "get_context", lambda method: FakeContext())
+    with pytest.raises(RuntimeError):
+        embed.encode_corpus(docs, "fake", batch_size=3, save_dir=str(tmp_path), processes=2)
+    assert FakePool.calls == ["terminate", "join"]
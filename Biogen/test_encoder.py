@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("torch")
+
+import encoder  # noqa: E402
+
+
+class FakeModel:
+    loads = 0
+
+    def __init__(self, model_name, device=None):
+        FakeModel.loads += 1
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False):
+        self.calls.append(list(texts))
+        embeddings = np.array([[len(text), text.count(" "), 1.0] for text in texts], dtype="float64")
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(encoder, "SentenceTransformer", FakeModel)
+    monkeypatch.setattr(encoder, "_models", {})
+    monkeypatch.setattr(encoder, "_encoders", {})
+    FakeModel.loads = 0
+
+
+def test_models_and_encoders_are_shared():
+    first = encoder.get_query_encoder("m", "cpu")
+    assert encoder.get_query_encoder("m", "cpu") is first
+    assert encoder.get_model("m", "cpu") is first.model
+    assert encoder.get_query_encoder("other", "cpu") is not first
+    assert FakeModel.loads == 2
+
+
+def test_only_cache_misses_reach_the_model():
+    query_encoder = encoder.QueryEncoder("m", "cpu", cache_size=2)
+    first = query_encoder.encode(["heart  attack", "stroke"])
+    assert first.dtype == np.float32 and first.shape == (2, 3)
+    # whitespace is normalized before lookup, duplicates are encoded once
+    again = query_encoder.encode(["heart attack", " heart attack ", "flu"])
+    assert query_encoder.model.calls == [["heart attack", "stroke"], ["flu"]]
+    np.testing.assert_array_equal(again[0], first[0])
+    np.testing.assert_array_equal(again[1], first[0])
+    assert query_encoder.stats() == {"hits": 2, "misses": 3, "size": 2, "capacity": 2}
+
+    # stroke was least recently used and fell out
+    query_encoder.encode(["stroke"])
+    assert query_encoder.model.calls[-1] == ["stroke"]
+
+
+def test_normalize_flag_is_part_of_the_key():
+    query_encoder = encoder.QueryEncoder("m", "cpu")
+    raw = query_encoder.encode(["fever"])
+    normalized = query_encoder.encode(["fever"], normalize=True)
+    assert np.linalg.norm(normalized[0]) == pytest.approx(1)
+    assert not np.allclose(raw, normalized)
+    assert query_encoder.stats()["misses"] == 2
@@ -0,0 +1,101 @@
+import json
+import threading
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import faiss_api  # noqa: E402
+
+DIM = 16
+WORDS = ["insulin", "tumor", "virus", "protein", "gene", "mouse", "cell", "rna"]
+
+
+def embed(text):
+    vector = np.zeros(DIM, dtype="float32")
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode()) % DIM] += 1
+    return vector / (np.linalg.norm(vector) or 1)
+
+
+class FakeEncoder:
+    def encode(self, texts, normalize=False):
+        return np.stack([embed(text) for text in texts])
+
+    def stats(self):
+        return {"hits": 0, "misses": 0, "size": 0, "capacity": 0}
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    data_dir = tmp_path / "pubmed_jsonl"
+    data_dir.mkdir()
+    articles = [{"id": str(100 + i), "title": WORDS[i % 8], "text": f"{WORDS[i % 8]} {WORDS[(i * 3) % 8]}"}
+                for i in range(24)]
+    (data_dir / "part.jsonl").write_text("\n".join(json.dumps(a) for a in articles) + "\n")
+
+    embeddings = np.stack([embed(a["title"] + " " + a["text"]) for a in articles])
+    index = faiss.IndexFlatIP(DIM)
+    index.add(embeddings)
+    faiss.write_index(index, str(tmp_path / "faiss_index.index"))
+
+    monkeypatch.setattr(faiss_api, "INDEX_PATH", str(tmp_path / "faiss_index.index"))
+    monkeypatch.setattr(faiss_api, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(faiss_api, "DOC_STORE_PREFIX", str(tmp_path / "pubmed_docs"))
+    monkeypatch.setattr(faiss_api, "BM25_PREFIX", str(tmp_path / "pubmed_bm25"))
+    monkeypatch.setattr(faiss_api, "EMBEDDINGS_PATH", str(tmp_path / "missing.npy"))
+    monkeypatch.setattr(faiss_api, "get_query_encoder", lambda model_name: FakeEncoder())
+    monkeypatch.setattr(faiss_api, "approved_key", "secret")
+    monkeypatch.setattr(faiss_api, "ready", threading.Event())
+    return articles
+
+
+@pytest.fixture
+def client():
+    # not used as a context manager, so the startup attach thread does not run
+    return TestClient(faiss_api.app, headers={"x-api-key": "secret"})
+
+
+def test_ready_only_after_attach(served, client):
+    response = client.get("/ready", headers={"x-api-key": ""})
+    assert response.status_code == 503 and response.json()["ready"] is False
+    assert client.post("/query", json={"text": "insulin"}).status_code == 503
+
+    faiss_api.attach()
+    body = client.get("/ready", headers={"x-api-key": ""}).json()
+    assert body["ready"] is True
+    assert body["vectors"] == body["documents"] == len(served)
+    assert body["rescoring"] is False
+
+
+def test_query_modes(served, client):
+    faiss_api.attach()
+    reranked = client.post("/query", json={"text": "insulin tumor", "k": 5}).json()
+    assert 1 <= len(reranked) <= 3
+    assert all("insulin" in hit["body"] or "tumor" in hit["body"] for hit in reranked.values())
+
+    hybrid = client.post("/query", json={"text": "insulin tumor", "k": 4, "mode": "hybrid", "docid": "100"}).json()
+    assert len(hybrid) == 4
+    assert "100" not in [hit["docid"] for hit in hybrid.values()]
+
+    assert client.post("/query", json={"text": "x", "mode": "other"}).status_code == 400
+    assert client.post("/query", json={"text": "x", "mode": "hybrid", "fusion": "max"}).status_code == 400
+    assert client.get("/metrics/batching").json()["queries"] >= 2
+    assert len(client.get("/random", params={"k": 3}).json()) == 3
+
+
+def test_attach_rejects_a_store_that_does_not_match_the_index(served, client):
+    index = faiss.IndexFlatIP(DIM)
+    index.add(np.stack([embed(a["text"]) for a in served[:-1]]))
+    faiss.write_index(index, faiss_api.INDEX_PATH)
+    with pytest.raises(RuntimeError):
+        faiss_api.attach()
+    response = client.get("/ready")
+    assert response.status_code == 503 and "RuntimeError" in response.json()["error"]
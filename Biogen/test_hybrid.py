@@ -0,0 +1,67 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from bm25_index import BM25Index
+from hybrid import HybridRetriever, reciprocal_rank_fusion, weighted_score_fusion
+from structures import Doc
+
+DOCS = [Doc("0", "insulin", "insulin resistance"), Doc("1", "tumor", "tumor growth"),
+        Doc("2", "virus", "virus entry"), Doc("3", "insulin", "insulin tumor"), Doc("4", "rna", "rna")]
+
+
+def dense_search(query_text, depth):
+    # fixed dense ranking: rows 2, 4, 3, best first
+    return np.array([0.9, 0.8, 0.1], dtype=np.float32)[:depth], np.array([2, 4, 3])[:depth]
+
+
+def test_reciprocal_rank_fusion():
+    rows, scores = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([3, 1])], top_n=3, k=1.0)
+    # 1: 1/2 + 1/3, 3: 1/4 + 1/2, 2: 1/3
+    assert list(rows) == [1, 3, 2]
+    np.testing.assert_allclose(scores, [5 / 6, 3 / 4, 1 / 3])
+    rows, _ = reciprocal_rank_fusion([np.array([1, 2]), np.array([2, 1])], top_n=5, weights=[1.0, 1.0])
+    assert list(rows) == [1, 2]                 # a tie is broken by row
+
+
+def test_weighted_score_fusion():
+    rows, scores = weighted_score_fusion([(np.array([7, 8, 9]), np.array([3.0, 2.0, 1.0])),
+                                          (np.array([9]), np.array([5.0]))], top_n=3, weights=[0.5, 0.5])
+    assert list(rows) == [7, 9, 8]
+    np.testing.assert_allclose(scores, [0.5, 0.5, 0.25])
+    rows, scores = weighted_score_fusion([(np.array([], dtype=np.int64), np.array([]))], top_n=3)
+    assert len(rows) == len(scores) == 0
+
+
+def test_hybrid_search_fuses_both_stages():
+    retriever = HybridRetriever(dense_search, BM25Index.build(DOCS))
+    try:
+        sparse_rows, _ = retriever.bm25_index.search("insulin tumor", top_n=10)
+        rows, _ = retriever.search("insulin tumor", top_n=3, depth=10)
+        expected, _ = reciprocal_rank_fusion([np.array([2, 4, 3]), sparse_rows], 3, 60.0, [0.5, 0.5])
+        assert list(rows) == list(expected)
+        assert rows[0] == 3                     # the only row both stages return
+
+        rows, _ = retriever.search("insulin tumor", top_n=5, fusion="weighted", alpha=1.0)
+        assert list(rows[:2]) == [2, 4]
+        with pytest.raises(ValueError):
+            retriever.search("insulin", fusion="max")
+    finally:
+        retriever.close()
+
+
+def test_hybrid_search_with_async_dense_uses_no_thread():
+    calls = []
+
+    def dense_submit(query_text, depth, nprobe=None):
+        calls.append(nprobe)
+        future = Future()
+        future.set_result(dense_search(query_text, depth))
+        return future
+
+    retriever = HybridRetriever(dense_submit, BM25Index.build(DOCS), dense_async=True)
+    rows, _ = retriever.search("insulin tumor", top_n=3, depth=10, nprobe=4)
+    assert rows[0] == 3 and calls == [4]
+    assert retriever.executor is None           # no pool was ever started
+    retriever.close()
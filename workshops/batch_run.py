@@ -0,0 +1,146 @@
+"""
+Batch TREC runs: open the on-disk index once per worker, evaluate every
+topic of a topics file in parallel and stream TREC-format lines to the
+run file as results complete.
+
+    python batch_run.py --index inverted_index.bin --topics topics.txt --output run.txt
+
+Topics are either "qid<TAB>query" lines or TREC <top> blocks with
+<num> and <title> fields.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from index_builder import build_kgram_index
+from index_store import open_index, MappedIndex
+from lexicon import Lexicon
+from main import print_trec_format
+from preprocess import preprocess_text
+from query import expand_wildcard, compute_query_weights, rank_documents
+
+TOPIC = re.compile(r'<top>(.*?)</top>', re.S)
+TOPIC_NUM = re.compile(r'<num>\s*(?:Number:)?\s*([^\s<]+)')
+TOPIC_TITLE = re.compile(r'<title>\s*(?:Topic:)?\s*(.*?)\s*(?=<|$)', re.S)
+
+
+def read_topics(path: str) -> List[Tuple[str, str]]:
+    """Return (query id, query text) pairs in file order."""
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+
+    if '<top>' in content:
+        topics = []
+        for block in TOPIC.findall(content):
+            num = TOPIC_NUM.search(block)
+            title = TOPIC_TITLE.search(block)
+            if num and title:
+                topics.append((num.group(1), ' '.join(title.group(1).split())))
+        return topics
+
+    topics = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        query_id, _, text = line.strip().partition('\t' if '\t' in line else ' ')
+        topics.append((query_id, text.strip()))
+    return topics
+
+
+class _Worker:
+    index: Optional[MappedIndex] = None
+    permuterm_root: Optional[Lexicon] = None
+    kgram_index: Optional[dict] = None
+
+
+def _init_worker(index_path: str) -> None:
+    # each process maps the same file, the OS page cache is shared
+    _Worker.index = open_index(index_path)
+
+
+def _wildcard_indexes():
+    # only built when a topic actually uses '*'
+    if _Worker.permuterm_root is None:
+        terms = list(_Worker.index)
+        _Worker.permuterm_root = Lexicon.from_terms(terms)
+        _Worker.kgram_index = build_kgram_index(terms)
+    return _Worker.permuterm_root, _Worker.kgram_index
+
+
+def _run_topic(args: Tuple[str, str, int, str]) -> Tuple[str, str, float]:
+    query_id, text, top_k, run_name = args
+    start = time.perf_counter()
+
+    query_terms: List[str] = []
+    for token in text.split():
+        if '*' in token:
+            query_terms.extend(expand_wildcard(token.lower(), *_wildcard_indexes()))
+        else:
+            query_terms.extend(preprocess_text(token))
+
+    q_weights = compute_query_weights(query_terms, _Worker.index)
+    ranked = rank_documents(q_weights, _Worker.index, top_k=top_k)
+
+    lines = io.StringIO()
+    print_trec_format(ranked, query_id, run_name, file=lines)
+    return query_id, lines.getvalue(), time.perf_counter() - start
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_batch(index_path: str, topics_path: str, output_path: str, workers: Optional[int] = None,
+              top_k: int = 1000, run_name: str = "batch") -> dict:
+    """Evaluate all topics and write the run. Returns throughput and latency stats."""
+    topics = read_topics(topics_path)
+    workers = workers or os.cpu_count() or 1
+    tasks = [(query_id, text, top_k, run_name) for query_id, text in topics]
+
+    latencies: List[float] = []
+    start = time.perf_counter()
+    with open(output_path, 'w', encoding='utf-8') as out, \
+            multiprocessing.Pool(workers, initializer=_init_worker, initargs=(index_path,)) as pool:
+        for _, lines, latency in pool.imap_unordered(_run_topic, tasks):
+            out.write(lines)
+            latencies.append(latency)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'queries': len(latencies),
+        'seconds': elapsed,
+        'qps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Produce a TREC run for a whole topics file.")
+    parser.add_argument('--index', required=True, help="on-disk index (index_store / spimi)")
+    parser.add_argument('--topics', required=True, help="topics file, 'qid<TAB>query' lines or TREC <top> blocks")
+    parser.add_argument('--output', required=True, help="run file to write")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--top-k', type=int, default=1000, help="documents per topic")
+    parser.add_argument('--run-name', default="batch")
+    args = parser.parse_args(argv)
+
+    stats = run_batch(args.index, args.topics, args.output, args.workers, args.top_k, args.run_name)
+    print(f"{stats['queries']} queries in {stats['seconds']:.2f}s ({stats['qps']:.1f} q/s), "
+          f"latency p50 {stats['p50_ms']:.2f} ms, p90 {stats['p90_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Reproducible benchmarks for the workshops indexing and query paths.
+
+Generates seeded synthetic corpora with a Zipfian vocabulary at several
+sizes, times each stage (best of --repeat runs), records its peak traced
+memory and writes the results as JSON so two commits can be compared:
+
+    python benchmark.py --sizes 1000 10000 --output before.json
+    python benchmark.py --sizes 1000 10000 --output after.json
+    python benchmark.py --compare before.json after.json --threshold 0.2
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+from index_builder import build_inverted_index, normalize_document_weights
+from preprocess import compute_term_frequencies
+from lexicon import Lexicon
+from query import find_terms_by_prefix, compute_query_weights, rank_documents
+from sparse_ranker import SparseRanker
+from tree23 import build_permuterm_index_from_terms, insert_term, generate_permuterms
+
+
+def random_terms(count: int, seed: int = 0) -> list[str]:
+    """Generate unique lowercase terms of 3-12 letters in random order."""
+    rng = random.Random(seed)
+    terms = set()
+    while len(terms) < count:
+        length = rng.randint(3, 12)
+        terms.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    terms = sorted(terms)
+    rng.shuffle(terms)
+    return terms
+
+
+def zipf_corpus(num_docs: int, vocab_size: int, seed: int = 0, exponent: float = 1.0,
+                doc_length: tuple = (20, 200)) -> dict[int, list[str]]:
+    """Tokenized documents whose term ranks follow a Zipf distribution."""
+    rng = random.Random(seed)
+    vocabulary = random_terms(vocab_size, seed)
+    cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, vocab_size + 1)))
+    return {doc_id: rng.choices(vocabulary, cum_weights=cumulative, k=rng.randint(*doc_length))
+            for doc_id in range(1, num_docs + 1)}
+
+
+def measure(func: Callable, repeat: int) -> dict:
+    """Best wall time over repeat runs, plus peak traced memory of one extra run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def benchmark_size(num_docs: int, seed: int, repeat: int, num_queries: int) -> List[dict]:
+    vocab_size = max(100, num_docs // 2)
+    doc_tokens = zipf_corpus(num_docs, vocab_size, seed)
+    term_freqs = compute_term_frequencies(doc_tokens)
+    inverted_index = normalize_document_weights(build_inverted_index(term_freqs))
+    terms = list(inverted_index)
+    perm_root = build_permuterm_index_from_terms(terms)
+    lexicon = Lexicon.from_terms(terms)
+
+    rng = random.Random(seed)
+    # wildcard patterns: prefix, suffix and infix stars on real terms
+    patterns = []
+    for term in rng.sample(terms, min(num_queries, len(terms))):
+        cut = rng.randint(1, max(1, len(term) - 1))
+        patterns.append(rng.choice([term[:cut] + '*', '*' + term[cut:], term[:cut] + '*' + term[cut + 1:]]))
+    # ranked queries: 1-4 terms drawn from the documents, so frequent terms show up
+    all_tokens = [token for tokens in doc_tokens.values() for token in tokens]
+    queries = [compute_query_weights(rng.choices(all_tokens, k=rng.randint(1, 4)), inverted_index)
+               for _ in range(num_queries)]
+    sparse_ranker = SparseRanker(inverted_index)
+    # normalization recomputes every weight from tf, so re-running it on one index times only normalization
+    to_normalize = build_inverted_index(term_freqs)
+
+    def insert_all():
+        root = None
+        for term in terms:
+            for permuterm in generate_permuterms(term):
+                root = insert_term(root, permuterm, term)
+
+    stages = {
+        'tree23.insert_term': insert_all,
+        'build_permuterm_index_from_terms': lambda: build_permuterm_index_from_terms(terms),
+        'build_inverted_index': lambda: build_inverted_index(term_freqs),
+        'normalize_document_weights': lambda: normalize_document_weights(to_normalize),
+        'Lexicon.from_terms': lambda: Lexicon.from_terms(terms),
+        'find_terms_by_prefix': lambda: [find_terms_by_prefix(perm_root, p) for p in patterns],
+        'find_terms_by_prefix_lexicon': lambda: [find_terms_by_prefix(lexicon, p) for p in patterns],
+        'rank_documents': lambda: [rank_documents(q, inverted_index) for q in queries],
+        'rank_documents_top10': lambda: [rank_documents(q, inverted_index, top_k=10) for q in queries],
+        'SparseRanker': lambda: SparseRanker(inverted_index),
+        'SparseRanker.rank_batch_top10': lambda: sparse_ranker.rank_batch(queries, top_k=10),
+    }
+
+    results = []
+    for stage, func in stages.items():
+        result = {'stage': stage, 'num_docs': num_docs, 'vocab_size': len(terms)}
+        result.update(measure(func, repeat))
+        results.append(result)
+        print(f"{num_docs:>8} {stage:<34} {result['seconds']:>10.4f}s {result['peak_bytes'] / 2**20:>9.1f} MiB",
+              file=sys.stderr)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: List[int], seed: int = 0, repeat: int = 3, num_queries: int = 200) -> dict:
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'num_queries': num_queries,
+        },
+        'results': [result for size in sizes for result in benchmark_size(size, seed, repeat, num_queries)],
+    }
+
+
+def compare(before: dict, after: dict, threshold: float) -> List[str]:
+    """Stages that got more than threshold (relative) slower or larger."""
+    baseline = {(r['stage'], r['num_docs']): r for r in before['results']}
+    regressions = []
+    for result in after['results']:
+        old = baseline.get((result['stage'], result['num_docs']))
+        if old is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if old[metric] > 0 and result[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{result['stage']} @ {result['num_docs']} docs: {metric} "
+                                   f"{old[metric]:.4g} -> {result[metric]:.4g}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the workshops indexing and query paths.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 5_000, 20_000], help="corpus sizes in documents")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument('--queries', type=int, default=200, help="queries / wildcard patterns per size")
+    parser.add_argument('--output', help="write results as JSON here")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed relative slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        for line in regressions:
+            print(line)
+        return 1 if regressions else 0
+
+    results = run(args.sizes, args.seed, args.repeat, args.queries)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Boolean, phrase and proximity queries over a positional inverted index
+(build_inverted_index with term_positions).
+
+Query syntax:
+    cat AND dog, cat dog      conjunction (AND is implied between operands)
+    cat OR dog                disjunction
+    NOT cat                   negation, cat AND NOT dog
+    "vector space model"      phrase
+    retrieval /3 model        both terms within 3 positions of each other
+    ( ... )                   grouping
+
+Conjunctions evaluate the rarest operand first and intersect the sorted
+doc-id arrays with galloping search, so a short list against a long one
+costs O(short * log(long)) instead of a linear merge.
+"""
+import heapq
+import re
+from bisect import bisect_left
+from typing import List, Optional
+
+from postings import Postings, PositionalPostings
+from preprocess import preprocess_text
+
+TOKEN = re.compile(r'"[^"]*"|[()]|/\d+|[^\s()"]+')
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+def gallop(seq, target: int, lo: int = 0) -> int:
+    """Smallest index >= lo with seq[index] >= target, exponential then binary search."""
+    n = len(seq)
+    hi = lo
+    step = 1
+    while hi < n and seq[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(seq, target, lo, min(hi, n))
+
+
+def intersect(a, b) -> List[int]:
+    """Intersection of two sorted doc-id sequences, galloping through the longer one."""
+    if len(a) > len(b):
+        a, b = b, a
+    result = []
+    position = 0
+    for doc_id in a:
+        position = gallop(b, doc_id, position)
+        if position == len(b):
+            break
+        if b[position] == doc_id:
+            result.append(doc_id)
+    return result
+
+
+def difference(a, b) -> List[int]:
+    """Documents of sorted a that are not in sorted b."""
+    result = []
+    position = 0
+    for doc_id in a:
+        position = gallop(b, doc_id, position)
+        if position == len(b) or b[position] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def union(*lists) -> List[int]:
+    result = []
+    for doc_id in heapq.merge(*lists):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def _normalize(word: str) -> Optional[str]:
+    # index terms went through preprocess_text, so query terms must too
+    terms = preprocess_text(word)
+    return terms[0] if terms else None
+
+
+class _Parser:
+    """Recursive descent parser producing tuples: ('term', t), ('phrase', [t...]),
+    ('near', t1, t2, k), ('and', [...]), ('or', [...]), ('not', node).
+    Operands that normalize to nothing (stopwords) become None."""
+
+    def __init__(self, query: str):
+        self.tokens = TOKEN.findall(query)
+        self.i = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise ValueError("unexpected end of query")
+        self.i += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"unexpected {self.peek()!r} in query")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.next()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.next()
+            return ('not', self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.next()
+        if token == '(':
+            node = self.parse_or()
+            if self.next() != ')':
+                raise ValueError("missing ')' in query")
+            return node
+        if token.startswith('"'):
+            terms = preprocess_text(token.strip('"'))
+            if not terms:
+                return None
+            return ('phrase', terms) if len(terms) > 1 else ('term', terms[0])
+        if token in OPERATORS or token == ')' or token.startswith('/'):
+            raise ValueError(f"unexpected {token!r} in query")
+
+        term = _normalize(token)
+        if self.peek() is not None and self.peek().startswith('/'):
+            distance = int(self.next()[1:])
+            other = self.next()
+            if other in OPERATORS or other in '()' or other.startswith(('"', '/')):
+                raise ValueError(f"proximity needs two terms, got {other!r}")
+            other_term = _normalize(other)
+            if term is None or other_term is None:
+                return None
+            return ('near', term, other_term, distance)
+        return ('term', term) if term is not None else None
+
+
+def parse_query(query: str):
+    return _Parser(query).parse()
+
+
+class BooleanSearcher:
+    def __init__(self, inverted_index):
+        self.index = inverted_index
+        self._universe = None
+
+    def universe(self) -> List[int]:
+        """Every indexed document, needed to evaluate a bare NOT."""
+        if self._universe is None:
+            doc_lengths = getattr(getattr(self.index, 'stats', None), 'doc_lengths', None)
+            if doc_lengths:
+                self._universe = sorted(doc_lengths)
+            else:
+                self._universe = union(*(postings.doc_ids for postings in self.index.values()))
+        return self._universe
+
+    def _postings(self, term: str) -> Optional[Postings]:
+        return self.index.get(term)
+
+    def _positional(self, term: str) -> Optional[PositionalPostings]:
+        postings = self._postings(term)
+        if postings is not None and not isinstance(postings, PositionalPostings):
+            raise ValueError("phrase and proximity queries need a positional index")
+        return postings
+
+    def estimate(self, node) -> int:
+        """Upper bound on the result size, used to order conjunctions rarest first."""
+        kind = node[0]
+        if kind == 'term':
+            postings = self._postings(node[1])
+            return len(postings) if postings is not None else 0
+        if kind == 'phrase':
+            return min(self.estimate(('term', term)) for term in node[1])
+        if kind == 'near':
+            return min(self.estimate(('term', node[1])), self.estimate(('term', node[2])))
+        if kind == 'and':
+            return min((self.estimate(child) for child in node[1] if child and child[0] != 'not'),
+                       default=len(self.universe()))
+        if kind == 'or':
+            return sum(self.estimate(child) for child in node[1] if child)
+        return len(self.universe())
+
+    def evaluate(self, node) -> List[int]:
+        if node is None:
+            return []
+        kind = node[0]
+        if kind == 'term':
+            postings = self._postings(node[1])
+            return list(postings.doc_ids) if postings is not None else []
+        if kind == 'phrase':
+            return self._match_positions(node[1], [(i, i) for i in range(len(node[1]))])
+        if kind == 'near':
+            _, term, other, distance = node
+            return self._match_positions([term, other], [(0, 0), (-distance, distance)])
+        if kind == 'not':
+            return difference(self.universe(), self.evaluate(node[1]))
+        if kind == 'or':
+            return union(*(self.evaluate(child) for child in node[1]))
+        return self._evaluate_and(node[1])
+
+    def _evaluate_and(self, children) -> List[int]:
+        # stopword operands do not constrain a conjunction
+        children = [child for child in children if child is not None]
+        if not children:
+            return []
+        positives = sorted((child for child in children if child[0] != 'not'), key=self.estimate)
+        negatives = [child[1] for child in children if child[0] == 'not']
+
+        result = self.evaluate(positives[0]) if positives else self.universe()
+        for child in positives[1:]:
+            if not result:
+                return []
+            if child[0] == 'term':
+                postings = self._postings(child[1])
+                result = intersect(result, postings.doc_ids) if postings is not None else []
+            else:
+                result = intersect(result, self.evaluate(child))
+        for child in negatives:
+            if not result:
+                break
+            result = difference(result, self.evaluate(child))
+        return result
+
+    def _match_positions(self, terms: List[str], windows: List[tuple]) -> List[int]:
+        """
+        Documents where terms[i] occurs at an offset within windows[i] = (lo, hi)
+        of an occurrence of terms[0]. A phrase uses (i, i), proximity (-k, k).
+        """
+        postings = [self._positional(term) for term in terms]
+        if any(p is None for p in postings):
+            return []
+
+        # candidate documents: rarest list first, galloping through the rest
+        candidates = list(min(postings, key=len).doc_ids)
+        for p in sorted(postings, key=len)[1:]:
+            candidates = intersect(candidates, p.doc_ids)
+            if not candidates:
+                return []
+
+        result = []
+        for doc_id in candidates:
+            positions = [p.positions_at(p.find(doc_id)) for p in postings]
+            for start in positions[0]:
+                if all(self._occurs(positions[i], start + lo, start + hi)
+                       for i, (lo, hi) in enumerate(windows) if i > 0):
+                    result.append(doc_id)
+                    break
+        return result
+
+    @staticmethod
+    def _occurs(positions, lo: int, hi: int) -> bool:
+        i = bisect_left(positions, lo)
+        return i < len(positions) and positions[i] <= hi
+
+
+def boolean_search(query: str, inverted_index) -> List[int]:
+    """Sorted ids of the documents matching a boolean/phrase/proximity query."""
+    result = BooleanSearcher(inverted_index).evaluate(parse_query(query))
+    deleted = getattr(inverted_index, 'deleted', None)
+    if deleted:
+        result = [doc_id for doc_id in result if doc_id not in deleted]
+    return result
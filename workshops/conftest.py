@@ -0,0 +1,30 @@
+import pytest
+
+import preprocess
+
+STOPWORDS = frozenset({'a', 'and', 'are', 'by', 'is', 'the', 'to', 'of', 'while', 'have'})
+
+
+def _plain_analyzer(self, cache_size: int = 100_000):
+    # tests do not need the NLTK corpora: no lemmatization, a small stopword list
+    self.cache_size = cache_size
+    self.stopwords = STOPWORDS
+    self.lemmatize = lambda token: token
+
+
+@pytest.fixture(autouse=True)
+def plain_analyzer(monkeypatch):
+    monkeypatch.setattr(preprocess.TextAnalyzer, '__init__', _plain_analyzer)
+    monkeypatch.setattr(preprocess, '_default_analyzer', None)
+
+
+@pytest.fixture
+def documents():
+    return {
+        1: "for english model retireval have a relevance model while vector space model retrieval",
+        2: "r-precision measure is relevant to average precision measure",
+        3: "most efficient retrieval models are language model and vector space model",
+        4: "english is the most efficient language",
+        5: "retrieval efficiency is measured by average precision",
+        6: "cat cut cot coat cast model cat",
+    }
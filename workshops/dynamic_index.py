@@ -0,0 +1,171 @@
+"""
+In-memory index that takes document additions, updates and deletions
+without a rebuild.
+
+Adding a document inserts its postings at their sorted positions, updates
+N, df and its own vector length (lnc weights of other documents do not
+depend on it) and inserts only new vocabulary terms into the permuterm
+tree and k-gram index. Deleting a document tombstones it: statistics are
+corrected at once, the postings are purged later by a background
+compaction. Cost is proportional to the size of the changed document.
+"""
+import math
+import threading
+from bisect import insort
+from typing import List, Optional, Tuple
+
+from index_builder import build_inverted_index, normalize_document_weights, build_kgram_index, generate_kgrams
+from index_store import write_index
+from postings import Postings, PositionalPostings
+from preprocess import preprocess_text, compute_term_frequencies, compute_term_positions
+from query import expand_wildcard, compute_query_weights, rank_documents
+from tree23 import build_permuterm_index_from_terms, generate_permuterms, insert_term
+
+
+class DynamicIndex:
+    def __init__(self, documents: Optional[dict[int, str]] = None,
+                 compact_threshold: int = 1000, kgram_k: int = 2, positional: bool = False):
+        # positional keeps term positions (PositionalPostings) through every add, update and compaction
+        documents = documents or {}
+        doc_tokens = {doc_id: preprocess_text(text) for doc_id, text in documents.items()}
+        term_freqs = compute_term_frequencies(doc_tokens)
+
+        self.positional = positional
+        self.index = normalize_document_weights(
+            build_inverted_index(term_freqs, compute_term_positions(doc_tokens) if positional else None))
+        self.forward = term_freqs                 # doc id -> {term: tf}, needed to undo a document
+        terms = list(self.index)
+        self.permuterm_root = build_permuterm_index_from_terms(terms)
+        self.kgram_k = kgram_k
+        self.kgram_index = build_kgram_index(terms, kgram_k)
+
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+
+    def add_document(self, doc_id: int, text: str) -> None:
+        tokens = preprocess_text(text)    # analysis runs outside the lock
+        with self.lock:
+            if doc_id in self.forward:
+                if doc_id not in self.index.deleted:
+                    raise ValueError(f"document {doc_id} is already indexed, use update_document")
+                self._purge(doc_id)
+            self._add(doc_id, tokens)
+
+    def update_document(self, doc_id: int, text: str) -> None:
+        tokens = preprocess_text(text)
+        with self.lock:
+            if doc_id not in self.forward or doc_id in self.index.deleted:
+                raise KeyError(doc_id)
+            self._retire(doc_id)
+            self._purge(doc_id)
+            self._add(doc_id, tokens)
+
+    def delete_document(self, doc_id: int) -> None:
+        with self.lock:
+            if doc_id not in self.forward or doc_id in self.index.deleted:
+                raise KeyError(doc_id)
+            self._retire(doc_id)
+            self.index.deleted.add(doc_id)
+            if len(self.index.deleted) >= self.compact_threshold:
+                self._start_compaction()
+
+    def _add(self, doc_id: int, tokens: List[str]) -> None:
+        term_freqs = compute_term_frequencies({doc_id: tokens})[doc_id]
+        term_positions = compute_term_positions({doc_id: tokens})[doc_id] if self.positional else None
+        self.forward[doc_id] = term_freqs
+        if not term_freqs:
+            return
+
+        length = math.sqrt(sum((1 + math.log(tf)) ** 2 for tf in term_freqs.values()))
+        stats = self.index.stats
+        stats.num_docs += 1
+        stats.doc_lengths[doc_id] = length
+
+        for term, tf in term_freqs.items():
+            postings = self.index.get(term)
+            if postings is None:
+                postings = self.index[term] = PositionalPostings() if self.positional else Postings()
+                self._add_vocabulary(term)
+            if self.positional:
+                postings.insert(doc_id, tf, (1 + math.log(tf)) / length, term_positions[term])
+            else:
+                postings.insert(doc_id, tf, (1 + math.log(tf)) / length)
+            stats.df[term] = stats.df.get(term, 0) + 1
+
+    def _add_vocabulary(self, term: str) -> None:
+        # terms whose postings empty out keep their (empty) entry,
+        # so a term is only ever added to the wildcard indexes once
+        for permuterm in generate_permuterms(term):
+            self.permuterm_root = insert_term(self.permuterm_root, permuterm, term)
+        for kgram in generate_kgrams(term, self.kgram_k):
+            insort(self.kgram_index.setdefault(kgram, []), term)
+
+    def _retire(self, doc_id: int) -> None:
+        """Remove a live document from N, df and the document lengths."""
+        term_freqs = self.forward[doc_id]
+        if not term_freqs:
+            return
+        stats = self.index.stats
+        stats.num_docs -= 1
+        stats.doc_lengths.pop(doc_id, None)
+        for term in term_freqs:
+            stats.df[term] -= 1
+            if not stats.df[term]:
+                del stats.df[term]
+
+    def _purge(self, doc_id: int) -> None:
+        """Remove a document's postings right away, cost O(its terms)."""
+        for term in self.forward.pop(doc_id):
+            self.index[term].remove(doc_id)
+        self.index.deleted.discard(doc_id)
+
+    def _start_compaction(self) -> None:
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    def compact(self) -> None:
+        """
+        Purge tombstoned documents from the postings. Each affected list is
+        rebuilt and swapped in under the lock one term at a time, so ingest
+        and queries only wait for a single term.
+        """
+        with self.lock:
+            tombstones = set(self.index.deleted)
+            terms = {term for doc_id in tombstones for term in self.forward[doc_id]}
+
+        for term in terms:
+            with self.lock:
+                # same postings class as before, positions included
+                self.index[term] = self.index[term].without(self.index.deleted)
+
+        with self.lock:
+            for doc_id in tombstones:
+                # documents re-added and deleted again meanwhile may have left postings behind
+                if doc_id in self.index.deleted:
+                    self._purge(doc_id)
+
+    def expand_wildcard(self, pattern: str) -> List[str]:
+        with self.lock:
+            matches = expand_wildcard(pattern, self.permuterm_root, self.kgram_index, self.kgram_k)
+            # the wildcard indexes never shrink, skip terms with no live documents
+            return [term for term in matches if self.index.stats.df.get(term)]
+
+    def search(self, query: str, top_k: Optional[int] = 10) -> List[Tuple[int, float]]:
+        query_terms: List[str] = []
+        for token in query.split():
+            if '*' in token:
+                query_terms.extend(self.expand_wildcard(token))
+            else:
+                query_terms.extend(preprocess_text(token))
+
+        with self.lock:
+            q_weights = compute_query_weights(query_terms, self.index)
+            return rank_documents(q_weights, self.index, top_k)
+
+    def save(self, path: str) -> None:
+        """Compact and write the index in the on-disk format of index_store."""
+        self.compact()
+        with self.lock:
+            write_index(path, self.index)
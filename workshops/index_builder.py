@@ -1,35 +1,35 @@
 # Max
 from typing import Optional
-from tree23 import TreeNode, insert_term
+from tree23 import TreeNode, bulk_load
 from preprocess import preprocess_text
+from postings import Postings, PositionalPostings, InvertedIndex
 
 import math
 from collections import defaultdict
 
-def build_inverted_index(term_frequencies):
-    inverted_index = {}
+def build_inverted_index(term_frequencies, term_positions=None):
+    # with term_positions (preprocess.compute_term_positions) the postings
+    # also record where each term occurs, for phrase and proximity queries
+    inverted_index = InvertedIndex()
 
-    for document_id in term_frequencies:
+    # visit documents in id order so every doc_ids array stays sorted
+    for document_id in sorted(term_frequencies):
         term_dict = term_frequencies[document_id]
         for term in term_dict:
             tf = term_dict[term]
 
             if term not in inverted_index:
-                inverted_index[term] = {'df': 0, 'postings': {}}
+                inverted_index[term] = Postings() if term_positions is None else PositionalPostings()
 
-            log_tf = 0.0
-            if tf > 0:
-                log_tf = 1 + math.log(tf)
-
-            inverted_index[term]['postings'][document_id] = {
-                'tf': tf,
-                'log_tf': log_tf
-            }
+            if term_positions is None:
+                inverted_index[term].append(document_id, tf)
+            else:
+                inverted_index[term].append(document_id, tf, positions=term_positions[document_id][term])
 
-    # Compute document frequency for each term
-    for term in inverted_index:
-        postings_dict = inverted_index[term]['postings']
-        inverted_index[term]['df'] = len(postings_dict)
+    # collection statistics: N counts documents with at least one term
+    stats = inverted_index.stats
+    stats.num_docs = sum(1 for document_id in term_frequencies if term_frequencies[document_id])
+    stats.df = {term: postings.df for term, postings in inverted_index.items()}
 
     return inverted_index
 
@@ -39,30 +39,50 @@ def normalize_document_weights(inverted_index):
     document_lengths = defaultdict(float)
 
     for term in inverted_index:
-        postings_dict = inverted_index[term]['postings']
-        for document_id in postings_dict:
-            log_tf = postings_dict[document_id]['log_tf']
+        postings = inverted_index[term]
+        for document_id, tf in zip(postings.doc_ids, postings.tf):
+            log_tf = 1 + math.log(tf) if tf > 0 else 0.0
             document_lengths[document_id] += log_tf * log_tf
 
     # Take square root to get vector length
     for document_id in document_lengths:
         document_lengths[document_id] = math.sqrt(document_lengths[document_id])
 
+    # keep the lengths as index metadata
+    if hasattr(inverted_index, 'stats'):
+        inverted_index.stats.doc_lengths = dict(document_lengths)
+
     # Normalize each log_tf by document vector length
     for term in inverted_index:
-        postings_dict = inverted_index[term]['postings']
-        for document_id in postings_dict:
+        postings = inverted_index[term]
+        weights = postings.weights
+        for i, (document_id, tf) in enumerate(zip(postings.doc_ids, postings.tf)):
             vector_length = document_lengths[document_id]
-            if vector_length > 0:
-                normalized_weight = postings_dict[document_id]['log_tf'] / vector_length
+            if vector_length > 0 and tf > 0:
+                weights[i] = (1 + math.log(tf)) / vector_length
             else:
-                normalized_weight = 0.0
-            postings_dict[document_id]['normalized'] = normalized_weight
+                weights[i] = 0.0
+        postings.max_weight = max(weights, default=0.0)
 
     return inverted_index
 
 
 
+def generate_kgrams(term: str, k: int = 2) -> list[str]:
+    # pad with $ so prefixes and suffixes get their own k-grams
+    term = '$' + term + '$'
+    return [term[i:i + k] for i in range(len(term) - k + 1)]
+
+def build_kgram_index(terms, k: int = 2) -> dict[str, list[str]]:
+    # maps each k-gram to the sorted list of vocabulary terms containing it
+    kgram_index = defaultdict(set)
+    for term in terms:
+        for kgram in generate_kgrams(term, k):
+            kgram_index[kgram].add(term)
+
+    return {kgram: sorted(kgram_terms) for kgram, kgram_terms in kgram_index.items()}
+
+
 def generate_permuterms(term: str) -> list[str]:
     term = term + '$'
     return [term[i:] + term[:i] for i in range(len(term))]
@@ -74,11 +94,15 @@ def build_permuterm_index(documents: dict[int, str]) -> Optional[TreeNode]:
     if not documents:
         return None
 
-    root = None
+    # gather permuterm -> doc ids first so the tree is bulk loaded once
+    permuterm_documents = {}
     for doc_id, raw_text in documents.items():
         terms = preprocess_text(raw_text)
         for term in terms:
             for permuterm in generate_permuterms(term):
-                root = insert_term(root, permuterm, doc_id)
+                doc_ids = permuterm_documents.setdefault(permuterm, [])
+                # each document is handled in one go, so only the tail can repeat
+                if not doc_ids or doc_ids[-1] != doc_id:
+                    doc_ids.append(doc_id)
 
-    return root
+    return bulk_load(permuterm_documents)
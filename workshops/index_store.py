@@ -0,0 +1,328 @@
+"""
+Persistent, memory-mapped inverted index.
+
+File layout (little-endian):
+    header    magic, version, N, number of terms, section offsets
+    postings  per term: variable-byte doc-id gaps, variable-byte tf,
+              uint16 quantized weights
+    strings   utf-8 terms in sorted order
+    entries   fixed-size record per term, sorted by term
+    lengths   sorted int64 doc ids followed by float64 vector lengths
+
+A term lookup binary searches the entries through the mmap and decodes
+only that term's postings, so opening the file costs a few page faults.
+"""
+import mmap
+import shutil
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Callable, Iterable, Iterator, Optional
+
+from postings import Postings, CollectionStats
+
+MAGIC = b'IRIX'
+VERSION = 2
+HEADER = struct.Struct('<4sIQQQQQQ')   # magic, version, N, num_terms, strings/entries/lengths offsets, num lengths
+ENTRY = struct.Struct('<QIQIII')       # string offset, string length, postings offset, df, gap bytes, tf bytes
+WEIGHT_SCALE = 65535                   # normalized weights lie in [0, 1]
+SPOOL_BYTES = 1 << 20                  # a term's tf and weight bytes beyond this go to a temporary file
+
+
+def vbyte_encode(numbers, out: bytearray) -> None:
+    """Append numbers as variable-byte codes, high bit marks the last byte."""
+    for n in numbers:
+        chunk = [n & 0x7F]
+        n >>= 7
+        while n:
+            chunk.append(n & 0x7F)
+            n >>= 7
+        chunk[0] |= 0x80
+        out.extend(reversed(chunk))
+
+
+def vbyte_decode(data, count: int, typecode: str = 'q') -> array:
+    numbers = array(typecode)
+    n = 0
+    for byte in data:
+        if byte < 0x80:
+            n = (n << 7) | byte
+        else:
+            numbers.append((n << 7) | (byte & 0x7F))
+            n = 0
+            if len(numbers) == count:
+                break
+    return numbers
+
+
+def quantize_weight(weight: float) -> int:
+    return min(WEIGHT_SCALE, max(0, round(weight * WEIGHT_SCALE)))
+
+
+class IndexWriter:
+    """
+    Streams terms to disk in sorted order. Postings are written as they
+    arrive, only the small per-term entry records stay in memory. A term's
+    postings can be added in chunks (start_term, extend_term, finish_term);
+    its tf and weight sections are spooled to a temporary file until the
+    term is finished. Document lengths come from doc_lengths, or from
+    sorted_lengths, a callable returning (doc id, length) pairs in doc id
+    order, which is called twice and never held in memory.
+    """
+
+    def __init__(self, path: str, num_docs: int, doc_lengths: Optional[dict[int, float]] = None,
+                 sorted_lengths: Optional[Callable[[], Iterable[tuple[int, float]]]] = None):
+        self.file = open(path, 'wb')
+        self.num_docs = num_docs
+        self.doc_lengths = doc_lengths or {}
+        self.sorted_lengths = sorted_lengths
+        self.entries = []
+        self.strings = bytearray()
+        self.last_term = None
+        self.tfs = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self.weights = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self.file.write(HEADER.pack(MAGIC, VERSION, num_docs, 0, 0, 0, 0, 0))
+
+    def add_term(self, term: str, postings: Postings) -> None:
+        self.start_term(term)
+        self.extend_term(postings.doc_ids, postings.tf, postings.weights)
+        self.finish_term()
+
+    def start_term(self, term: str) -> None:
+        if self.last_term is not None and term <= self.last_term:
+            raise ValueError(f"terms must be added in sorted order: {term!r} after {self.last_term!r}")
+        self.last_term = term
+        self.term_offset = self.file.tell()
+        self.df = 0
+        self.gap_bytes = 0
+        self.previous = 0
+        for spool in (self.tfs, self.weights):
+            spool.seek(0)
+            spool.truncate()
+
+    def extend_term(self, doc_ids, tfs, weights) -> None:
+        """Append postings to the current term, doc ids ascending after the ones already added."""
+        if not len(doc_ids):
+            return
+        if self.df and doc_ids[0] <= self.previous:
+            raise ValueError(f"postings of {self.last_term!r} must be added in doc id order")
+
+        gaps = bytearray()
+        previous = self.previous
+        deltas = []
+        for doc_id in doc_ids:
+            deltas.append(doc_id - previous)
+            previous = doc_id
+        vbyte_encode(deltas, gaps)
+        self.file.write(gaps)
+        self.gap_bytes += len(gaps)
+        self.previous = previous
+        self.df += len(doc_ids)
+
+        tf_bytes = bytearray()
+        vbyte_encode(tfs, tf_bytes)
+        self.tfs.write(tf_bytes)
+        self.weights.write(array('H', (quantize_weight(w) for w in weights)).tobytes())
+
+    def finish_term(self) -> None:
+        tf_bytes = self.tfs.tell()
+        for spool in (self.tfs, self.weights):
+            spool.seek(0)
+            shutil.copyfileobj(spool, self.file)
+
+        encoded_term = self.last_term.encode('utf-8')
+        self.entries.append((len(self.strings), len(encoded_term), self.term_offset,
+                             self.df, self.gap_bytes, tf_bytes))
+        self.strings.extend(encoded_term)
+
+    def _write_column(self, typecode: str, values: Iterable) -> int:
+        count = 0
+        chunk = array(typecode)
+        for value in values:
+            chunk.append(value)
+            if len(chunk) == 65536:
+                self.file.write(chunk.tobytes())
+                count += len(chunk)
+                chunk = array(typecode)
+        self.file.write(chunk.tobytes())
+        return count + len(chunk)
+
+    def close(self) -> None:
+        self.tfs.close()
+        self.weights.close()
+        strings_offset = self.file.tell()
+        self.file.write(self.strings)
+        entries_offset = self.file.tell()
+        for entry in self.entries:
+            self.file.write(ENTRY.pack(*entry))
+
+        # align so the arrays can be viewed in place through the mmap
+        self.file.write(b'\0' * (-self.file.tell() % 8))
+        lengths_offset = self.file.tell()
+        sorted_lengths = self.sorted_lengths
+        if sorted_lengths is None:
+            doc_ids = sorted(self.doc_lengths)
+            sorted_lengths = lambda: ((doc_id, self.doc_lengths[doc_id]) for doc_id in doc_ids)
+        num_lengths = self._write_column('q', (doc_id for doc_id, _ in sorted_lengths()))
+        self._write_column('d', (length for _, length in sorted_lengths()))
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.num_docs, len(self.entries),
+                                    strings_offset, entries_offset, lengths_offset, num_lengths))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_index(path: str, inverted_index: dict[str, Postings]) -> None:
+    """Save a normalized in-memory inverted index and its statistics to path."""
+    stats = getattr(inverted_index, 'stats', None)
+    if stats is None:
+        stats = CollectionStats.from_index(inverted_index)
+
+    with IndexWriter(path, stats.num_docs, stats.doc_lengths) as writer:
+        for term in sorted(inverted_index):
+            writer.add_term(term, inverted_index[term])
+
+
+class _DocumentFrequencies(Mapping):
+    """term -> df view over the entry table of a MappedIndex."""
+
+    def __init__(self, index: 'MappedIndex'):
+        self._index = index
+
+    def __getitem__(self, term: str) -> int:
+        entry = self._index._find(term)
+        if entry is None:
+            raise KeyError(term)
+        return entry[3]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class DocumentLengths(Mapping):
+    """doc id -> vector length view over parallel sorted arrays (or mapped sections)."""
+
+    def __init__(self, doc_ids: memoryview, lengths: memoryview):
+        self._doc_ids = doc_ids
+        self._lengths = lengths
+
+    def __getitem__(self, doc_id: int) -> float:
+        i = bisect_left(self._doc_ids, doc_id)
+        if i == len(self._doc_ids) or self._doc_ids[i] != doc_id:
+            raise KeyError(doc_id)
+        return self._lengths[i]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._doc_ids)
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+
+class MappedIndex(Mapping):
+    """
+    Read-only inverted index opened with mmap. Behaves like the in-memory
+    dict of term -> Postings but decodes postings lazily on lookup.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, num_docs, num_terms, strings_offset, entries_offset,
+         lengths_offset, num_lengths) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} index file")
+        self.num_docs = num_docs
+        self._num_terms = num_terms
+        self._strings_offset = strings_offset
+        self._entries_offset = entries_offset
+
+        # statistics are views into the file, nothing is copied at open time
+        view = memoryview(self._mm)
+        doc_ids = view[lengths_offset:lengths_offset + 8 * num_lengths].cast('q')
+        lengths = view[lengths_offset + 8 * num_lengths:lengths_offset + 16 * num_lengths].cast('d')
+        self._views = [view, doc_ids, lengths]
+        self.stats = CollectionStats(num_docs, _DocumentFrequencies(self), DocumentLengths(doc_ids, lengths))
+
+    def _entry(self, i: int) -> tuple:
+        return ENTRY.unpack_from(self._mm, self._entries_offset + i * ENTRY.size)
+
+    def _term(self, entry: tuple) -> str:
+        start = self._strings_offset + entry[0]
+        return self._mm[start:start + entry[1]].decode('utf-8')
+
+    def _find(self, term: str) -> Optional[tuple]:
+        # binary search over the sorted entry table
+        lo, hi = 0, self._num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            mid_term = self._term(entry)
+            if mid_term < term:
+                lo = mid + 1
+            elif mid_term > term:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def _decode(self, entry: tuple) -> Postings:
+        _, _, offset, df, gap_bytes, tf_bytes = entry
+        mm = self._mm
+
+        doc_ids = vbyte_decode(mm[offset:offset + gap_bytes], df, 'q')
+        for i in range(1, df):
+            doc_ids[i] += doc_ids[i - 1]
+        offset += gap_bytes
+
+        tf = vbyte_decode(mm[offset:offset + tf_bytes], df, 'I')
+        offset += tf_bytes
+
+        quantized = array('H')
+        quantized.frombytes(mm[offset:offset + 2 * df])
+        weights = array('d', (q / WEIGHT_SCALE for q in quantized))
+        return Postings(doc_ids, tf, weights)
+
+    def __getitem__(self, term: str) -> Postings:
+        entry = self._find(term)
+        if entry is None:
+            raise KeyError(term)
+        return self._decode(entry)
+
+    def __contains__(self, term) -> bool:
+        return self._find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._num_terms):
+            yield self._term(self._entry(i))
+
+    def __len__(self) -> int:
+        return self._num_terms
+
+    def close(self) -> None:
+        # views must be released before the mmap can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_index(path: str) -> MappedIndex:
+    return MappedIndex(path)
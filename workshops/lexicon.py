@@ -0,0 +1,234 @@
+"""
+Compact, read-only permuterm lexicon.
+
+Terms and their permuterm rotations are kept sorted and front-coded in
+blocks of block_size entries: the first entry of a block is stored whole,
+the others as (bytes shared with the previous entry, remaining bytes).
+A rotation points to its term by id instead of repeating the string. The
+block index is one uint64 offset per block; a lookup binary searches the
+first entries of the blocks and decodes a single block, a prefix search
+decodes only the blocks its range covers.
+
+File layout (little-endian):
+    header        magic, version, block size, number of terms, number of
+                  rotations, offsets section offset
+    term blocks   front-coded utf-8 terms, a term's id is its sorted rank
+    key blocks    front-coded utf-8 rotations, each followed by its term id
+    offsets       start of every term block, every key block, then the end
+
+The same bytes serve an in-memory lexicon (Lexicon.from_terms) and one
+mapped from disk (open_lexicon), which costs nothing up front.
+"""
+import mmap
+import struct
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from index_store import vbyte_encode
+from tree23 import generate_permuterms
+
+MAGIC = b'IRLX'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQQQ')   # magic, version, block size, num terms, num rotations, offsets offset
+
+
+def _read_vbyte(buffer, pos: int) -> Tuple[int, int]:
+    """Decode one variable-byte number at pos, returns (number, next pos)."""
+    n = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        if byte < 0x80:
+            n = (n << 7) | byte
+        else:
+            return (n << 7) | (byte & 0x7F), pos
+
+
+def _front_code(keys: List[bytes], term_ids: Optional[List[int]], block_size: int,
+                out: bytearray, offsets: List[int]) -> None:
+    previous = b''
+    for i, key in enumerate(keys):
+        if i % block_size == 0:
+            offsets.append(len(out))
+            previous = b''
+        shared = 0
+        limit = min(len(previous), len(key))
+        while shared < limit and previous[shared] == key[shared]:
+            shared += 1
+        vbyte_encode((shared, len(key) - shared), out)
+        out.extend(key[shared:])
+        if term_ids is not None:
+            vbyte_encode((term_ids[i],), out)
+        previous = key
+
+
+class Lexicon:
+    """
+    Sorted vocabulary plus permuterm rotations in front-coded blocks.
+    Offers the lookups query.py needs from the permuterm 2-3 tree:
+    find_term for a single rotation and prefix_search for a range.
+    """
+
+    def __init__(self, buffer, _file=None):
+        self._file = _file
+        self._buffer = buffer
+        magic, version, self.block_size, self.num_terms, self.num_keys, offsets_offset = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} lexicon")
+
+        self._num_term_blocks = -(-self.num_terms // self.block_size)
+        num_blocks = self._num_term_blocks + -(-self.num_keys // self.block_size)
+        view = memoryview(buffer)
+        self._offsets = view[offsets_offset:offsets_offset + 8 * (num_blocks + 1)].cast('Q')
+        self._views = [view, self._offsets]
+
+    @classmethod
+    def from_terms(cls, terms: Iterable[str], block_size: int = 16) -> 'Lexicon':
+        """Build an in-memory lexicon of terms and all their rotations."""
+        terms = sorted(set(terms))
+        rotations = sorted((permuterm.encode('utf-8'), term_id)
+                           for term_id, term in enumerate(terms)
+                           for permuterm in generate_permuterms(term))
+
+        out = bytearray(HEADER.size)
+        offsets: List[int] = []
+        _front_code([term.encode('utf-8') for term in terms], None, block_size, out, offsets)
+        _front_code([key for key, _ in rotations], [term_id for _, term_id in rotations],
+                    block_size, out, offsets)
+        offsets.append(len(out))
+
+        # align so the offsets can be viewed in place through an mmap
+        out.extend(b'\0' * (-len(out) % 8))
+        offsets_offset = len(out)
+        out.extend(struct.pack(f'<{len(offsets)}Q', *offsets))
+        HEADER.pack_into(out, 0, MAGIC, VERSION, block_size, len(terms), len(rotations), offsets_offset)
+        return cls(bytes(out))
+
+    def _block(self, block: int) -> Iterator[Tuple[bytes, int]]:
+        """Decode a block into (key, term id) pairs."""
+        buffer = self._buffer
+        pos, end = self._offsets[block], self._offsets[block + 1]
+        is_term_block = block < self._num_term_blocks
+        term_id = block * self.block_size
+        key = b''
+        while pos < end:
+            shared, pos = _read_vbyte(buffer, pos)
+            length, pos = _read_vbyte(buffer, pos)
+            key = key[:shared] + buffer[pos:pos + length]
+            pos += length
+            if is_term_block:
+                yield key, term_id
+                term_id += 1
+            else:
+                rotation_term_id, pos = _read_vbyte(buffer, pos)
+                yield key, rotation_term_id
+
+    def _first_key(self, block: int) -> bytes:
+        # the first entry of a block shares nothing with its predecessor
+        _, pos = _read_vbyte(self._buffer, self._offsets[block])
+        length, pos = _read_vbyte(self._buffer, pos)
+        return self._buffer[pos:pos + length]
+
+    def _find_block(self, lo: int, hi: int, key: bytes) -> int:
+        """Last block in [lo, hi) whose first key is <= key, lo if there is none."""
+        first = lo
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_key(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(first, lo - 1)
+
+    def term(self, term_id: int) -> str:
+        if not 0 <= term_id < self.num_terms:
+            raise IndexError(term_id)
+        block, i = divmod(term_id, self.block_size)
+        for j, (key, _) in enumerate(self._block(block)):
+            if j == i:
+                return key.decode('utf-8')
+
+    def term_id(self, term: str) -> Optional[int]:
+        key = term.encode('utf-8')
+        if not self.num_terms:
+            return None
+        for block_key, term_id in self._block(self._find_block(0, self._num_term_blocks, key)):
+            if block_key == key:
+                return term_id
+            if block_key > key:
+                break
+        return None
+
+    def find_term(self, permuterm: str) -> List[str]:
+        """Like tree23.find_term on a permuterm tree: [term] for a stored rotation, else []."""
+        key = permuterm.encode('utf-8')
+        if not self.num_keys:
+            return []
+        block = self._find_block(self._num_term_blocks, len(self._offsets) - 1, key)
+        for block_key, term_id in self._block(block):
+            if block_key == key:
+                return [self.term(term_id)]
+            if block_key > key:
+                break
+        return []
+
+    def prefix_search(self, prefix: str) -> Tuple[List[int], int]:
+        """
+        Term ids of the rotations starting with prefix, in rotation order.
+        Returns (term ids, number of blocks decoded).
+        """
+        key = prefix.encode('utf-8')
+        term_ids: List[int] = []
+        if not self.num_keys:
+            return term_ids, 0
+        end = len(self._offsets) - 1
+        block = self._find_block(self._num_term_blocks, end, key)
+        blocks_decoded = 0
+        while block < end:
+            blocks_decoded += 1
+            for block_key, term_id in self._block(block):
+                if block_key.startswith(key):
+                    term_ids.append(term_id)
+                elif block_key > key:
+                    return term_ids, blocks_decoded
+            block += 1
+        return term_ids, blocks_decoded
+
+    def __contains__(self, term) -> bool:
+        return self.term_id(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for block in range(self._num_term_blocks):
+            for key, _ in self._block(block):
+                yield key.decode('utf-8')
+
+    def __len__(self) -> int:
+        return self.num_terms
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer)
+
+    def write(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self._buffer)
+
+    def close(self) -> None:
+        # views must be released before an mmap can be closed
+        for view in reversed(self._views):
+            view.release()
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_lexicon(path: str) -> Lexicon:
+    """Map a lexicon written with Lexicon.write."""
+    file = open(path, 'rb')
+    return Lexicon(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), file)
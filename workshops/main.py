@@ -1,13 +1,44 @@
 # Andrew
-from preprocess import preprocess_text, compute_term_frequencies
-from index_builder import build_inverted_index, normalize_document_weights
-from tree23 import build_permuterm_index_from_terms
-from query import find_terms_by_prefix, compute_query_weights, rank_documents
+from preprocess import get_analyzer, preprocess_text
+from index_builder import build_kgram_index
+from lexicon import Lexicon, open_lexicon
+from query import expand_wildcard, compute_query_weights, rank_documents
+from index_store import open_index, VERSION as INDEX_VERSION
+from lexicon import VERSION as LEXICON_VERSION
+from spimi import build_index_spimi
+import hashlib
+import os
 
+INDEX_PATH = "inverted_index.bin"
+LEXICON_PATH = "lexicon.bin"
+TOP_K = 10
 
-def print_trec_format(ranked_results, query_id: str, run_name: str):
+
+def corpus_key(documents: dict[int, str]) -> str:
+    # fingerprint of the corpus, a changed document changes the key
+    digest = hashlib.sha256()
+    for doc_id in sorted(documents):
+        digest.update(f"{doc_id}\0{documents[doc_id]}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_is_fresh(path: str, key: str) -> bool:
+    # a cache file is reused only if its .key file matches the corpus and format version
+    try:
+        with open(path + ".key", encoding="utf-8") as f:
+            return os.path.exists(path) and f.read() == key
+    except FileNotFoundError:
+        return False
+
+
+def write_cache_key(path: str, key: str) -> None:
+    with open(path + ".key", "w", encoding="utf-8") as f:
+        f.write(key)
+
+
+def print_trec_format(ranked_results, query_id: str, run_name: str, file=None):
     for rank, (doc_id, score) in enumerate(ranked_results, start=1):
-        print(f"{query_id} Q0 {doc_id} {rank} {score:.6f} {run_name}")
+        print(f"{query_id} Q0 {doc_id} {rank} {score:.6f} {run_name}", file=file)
 
 
 def main():
@@ -19,43 +50,49 @@ def main():
         5: "retrieval efficiency is measured by average precision",
     }
 
-    # Preprocess documents
-    doc_tokens = {doc_id: preprocess_text(text) for doc_id, text in documents.items()}
+    # Build the index from raw text only when the corpus, the analyzer settings
+    # (lemmatizer, stopwords) or the file format changed, otherwise later runs just map the file.
+    # SPIMI streams blocks through worker processes, so memory does not grow with the corpus
+    corpus = f"{get_analyzer().settings_key()} {corpus_key(documents)}"
+    index_key = f"index v{INDEX_VERSION} {corpus}"
+    if not cache_is_fresh(INDEX_PATH, index_key):
+        build_index_spimi(documents.items(), INDEX_PATH)
+        write_cache_key(INDEX_PATH, index_key)
 
-    # Compute term frequencies
-    term_freqs = compute_term_frequencies(doc_tokens)
+    # both files stay mapped only while the query runs
+    with open_index(INDEX_PATH) as inverted_index:
+        # Permuterm lexicon: front-coded rotations, written once and mapped like the index
+        terms = list(inverted_index.keys())
+        lexicon_key = f"lexicon v{LEXICON_VERSION} {corpus}"
+        if not cache_is_fresh(LEXICON_PATH, lexicon_key):
+            Lexicon.from_terms(terms).write(LEXICON_PATH)
+            write_cache_key(LEXICON_PATH, lexicon_key)
 
-    # Build inverted index with weighting
-    inverted_index = build_inverted_index(term_freqs)
-    inverted_index = normalize_document_weights(inverted_index)
+        with open_lexicon(LEXICON_PATH) as perm_root:
+            # k-gram index for wildcard queries with more than one '*'
+            kgram_index = build_kgram_index(terms)
+            query = "c*t"
 
-    # Build permuterm index from unique terms
-    terms = list(inverted_index.keys())
-    perm_root = build_permuterm_index_from_terms(terms)
-    query = "c*t"
+            # Do NOT preprocess wildcard queries (keep * intact)
+            query_tokens = [query]
 
-    # Do NOT preprocess wildcard queries (keep * intact)
-    query_tokens = [query]
+            # Expand wildcard queries using permuterm or k-gram index
+            expanded_terms = []
+            for qt in query_tokens:
+                if '*' in qt:
+                    expanded_terms.extend(expand_wildcard(qt, perm_root, kgram_index))
+                else:
+                    # normal terms can still be preprocessed
+                    expanded_terms.extend(preprocess_text(qt))
 
-    # Expand wildcard queries using permuterm index
-    expanded_terms = []
-    for qt in query_tokens:
-        if '*' in qt:
-            matches, _ = find_terms_by_prefix(perm_root, qt)
-            expanded_terms.extend(matches)
-        else:
-            # normal terms can still be preprocessed
-            expanded_terms.extend(preprocess_text(qt))
+            # Compute query weights (ltc scheme)
+            q_weights = compute_query_weights(expanded_terms, inverted_index)
 
-    # Compute query weights (ltc scheme)
-    q_weights = compute_query_weights(expanded_terms, inverted_index)
-
-    # Rank documents by similarity
-    ranked_results = rank_documents(q_weights, inverted_index)
+            # Rank documents by similarity, keeping only the top results we print
+            ranked_results = rank_documents(q_weights, inverted_index, top_k=TOP_K)
 
     # Output results in TREC format
     print_trec_format(ranked_results, query_id="1", run_name="test")
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,159 @@
+import math
+from array import array
+from bisect import bisect_left
+
+
+class Postings:
+    """
+    Postings list of one term stored as parallel typed arrays:
+    sorted document ids, raw term frequencies and normalized weights.
+    """
+    __slots__ = ('doc_ids', 'tf', 'weights', 'max_weight')
+
+    def __init__(self, doc_ids=None, tf=None, weights=None):
+        self.doc_ids = doc_ids if doc_ids is not None else array('q')   # sorted ascending
+        self.tf = tf if tf is not None else array('I')
+        self.weights = weights if weights is not None else array('d')   # filled by normalization
+        self.max_weight = max(self.weights, default=0.0)                # score upper bound for pruning
+
+    @property
+    def df(self) -> int:
+        return len(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def append(self, document_id: int, tf: int, weight: float = 0.0) -> None:
+        # callers add documents in ascending id order
+        self.doc_ids.append(document_id)
+        self.tf.append(tf)
+        self.weights.append(weight)
+        if weight > self.max_weight:
+            self.max_weight = weight
+
+    def insert(self, document_id: int, tf: int, weight: float) -> None:
+        """Insert a document at its sorted position (appends when it is the largest id)."""
+        i = bisect_left(self.doc_ids, document_id)
+        if i == len(self.doc_ids):
+            self.append(document_id, tf, weight)
+            return
+        self.doc_ids.insert(i, document_id)
+        self.tf.insert(i, tf)
+        self.weights.insert(i, weight)
+        if weight > self.max_weight:
+            self.max_weight = weight
+
+    def remove(self, document_id: int) -> bool:
+        """Drop a document's posting; max_weight stays a valid upper bound."""
+        i = self.find(document_id)
+        if i < 0:
+            return False
+        del self.doc_ids[i]
+        del self.tf[i]
+        del self.weights[i]
+        return True
+
+    def find(self, document_id: int) -> int:
+        """Position of document_id in the arrays, or -1 if absent."""
+        i = bisect_left(self.doc_ids, document_id)
+        if i < len(self.doc_ids) and self.doc_ids[i] == document_id:
+            return i
+        return -1
+
+    def without(self, document_ids) -> 'Postings':
+        """A copy of these postings without the given documents."""
+        kept = type(self)()
+        for doc_id, tf, weight in zip(self.doc_ids, self.tf, self.weights):
+            if doc_id not in document_ids:
+                kept.append(doc_id, tf, weight)
+        return kept
+
+
+class PositionalPostings(Postings):
+    """
+    Postings that also keep term positions, flattened into one array:
+    the positions of the i-th document are positions[offsets[i]:offsets[i + 1]].
+    """
+    __slots__ = ('offsets', 'positions')
+
+    def __init__(self, doc_ids=None, tf=None, weights=None, offsets=None, positions=None):
+        super().__init__(doc_ids, tf, weights)
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+        self.positions = positions if positions is not None else array('I')
+
+    def append(self, document_id: int, tf: int, weight: float = 0.0, positions=()) -> None:
+        super().append(document_id, tf, weight)
+        self.positions.extend(positions)
+        self.offsets.append(len(self.positions))
+
+    def insert(self, document_id: int, tf: int, weight: float, positions=()) -> None:
+        """Insert a document and its positions at its sorted position."""
+        i = bisect_left(self.doc_ids, document_id)
+        if i == len(self.doc_ids):
+            self.append(document_id, tf, weight, positions)
+            return
+        super().insert(document_id, tf, weight)
+        # splice the positions in and shift the offsets of every later document
+        start, n = self.offsets[i], len(positions)
+        self.positions[start:start] = array('I', positions)
+        self.offsets[i + 1:] = array('Q', [start + n]) + array('Q', (o + n for o in self.offsets[i + 1:]))
+
+    def remove(self, document_id: int) -> bool:
+        i = self.find(document_id)
+        if i < 0:
+            return False
+        start, end = self.offsets[i], self.offsets[i + 1]
+        del self.positions[start:end]
+        self.offsets[i + 1:] = array('Q', (o - (end - start) for o in self.offsets[i + 2:]))
+        del self.doc_ids[i]
+        del self.tf[i]
+        del self.weights[i]
+        return True
+
+    def without(self, document_ids) -> 'PositionalPostings':
+        kept = PositionalPostings()
+        for i, (doc_id, tf, weight) in enumerate(zip(self.doc_ids, self.tf, self.weights)):
+            if doc_id not in document_ids:
+                kept.append(doc_id, tf, weight, self.positions_at(i))
+        return kept
+
+    def positions_at(self, i: int) -> array:
+        """Sorted positions of the document stored at index i."""
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+
+class CollectionStats:
+    """
+    Collection statistics kept next to the postings: N, per-term document
+    frequency and document vector lengths. Kept up to date by index_builder
+    so query weighting never has to scan the postings.
+    """
+
+    def __init__(self, num_docs: int = 0, df=None, doc_lengths=None):
+        self.num_docs = num_docs
+        self.df = df if df is not None else {}                     # term -> df
+        self.doc_lengths = doc_lengths if doc_lengths is not None else {}   # doc id -> vector length
+
+    def idf(self, term: str) -> float:
+        # unseen terms count as df = 1, like the original weighting
+        df = self.df.get(term, 0) or 1
+        return math.log((self.num_docs or 1) / df)
+
+    @classmethod
+    def from_index(cls, inverted_index) -> 'CollectionStats':
+        """Recompute N and df from the postings (O(total postings))."""
+        documents = set()
+        df = {}
+        for term, postings in inverted_index.items():
+            documents.update(postings.doc_ids)
+            df[term] = postings.df
+        return cls(len(documents), df)
+
+
+class InvertedIndex(dict):
+    """Mapping term -> Postings that carries its CollectionStats."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = CollectionStats()
+        self.deleted = set()    # tombstoned doc ids still present in some postings
@@ -1,40 +1,118 @@
 # Bailey
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+import hashlib
+import multiprocessing
+import os
 import re
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+
 def clean_and_tokenize(text: str) -> list[str]:
     #takes raw text and lowercases it + removes punctuation
     cleanText = text.lower()
-    cleanText = re.sub(r'[^\w\s]','',cleanText)
+    cleanText = PUNCTUATION.sub('',cleanText)
     tokens = cleanText.split()
     return tokens
 
+
+class TextAnalyzer:
+    #loads the lemmatizer and stopword list once and memoizes lemmas
+    def __init__(self, cache_size: int = 100_000):
+        self.cache_size = cache_size
+        self.lemmatizer = WordNetLemmatizer()
+        self.stopwords = frozenset(stopwords.words('english'))
+        #bounded LRU, vocabularies are Zipfian so most lookups hit
+        self.lemmatize = lru_cache(maxsize=cache_size)(self.lemmatizer.lemmatize)
+
+    def lemmatize_terms(self, tokens: list[str]) -> list[str]:
+        return [self.lemmatize(token) for token in tokens]
+
+    def remove_common_words(self, tokens: list[str]) -> list[str]:
+        return [token for token in tokens if token not in self.stopwords]
+
+    def settings_key(self) -> str:
+        #what the terms depend on besides the text, for cache keys of built indexes
+        lemmatizer = type(getattr(self, 'lemmatizer', None)).__name__
+        stop = hashlib.sha256(' '.join(sorted(self.stopwords)).encode('utf-8')).hexdigest()[:16]
+        return f"lemmatizer={lemmatizer} stopwords={stop}"
+
+    def preprocess(self, text: str) -> list[str]:
+        #same steps as preprocess_text: clean, lemmatize, drop stopwords
+        stop = self.stopwords
+        lemmatize = self.lemmatize
+        return [lemma for lemma in map(lemmatize, clean_and_tokenize(text)) if lemma not in stop]
+
+    def preprocess_many(self, texts: Iterable[str], processes: Optional[int] = None,
+                        chunksize: int = 1000) -> Iterator[list[str]]:
+        #yield token lists in input order, chunks are analyzed in a process pool
+        #and at most two chunks per worker are in flight, so input is streamed
+        processes = processes or os.cpu_count() or 1
+        chunks = _chunked(texts, chunksize)
+        if processes == 1:
+            for chunk in chunks:
+                for text in chunk:
+                    yield self.preprocess(text)
+            return
+
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(self.cache_size,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_preprocess_chunk, (chunk,)))
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+
+
+def _chunked(texts: Iterable[str], size: int) -> Iterator[list[str]]:
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+_worker_analyzer = None
+
+def _init_worker(cache_size: int) -> None:
+    #each pool process loads its own resources once
+    global _worker_analyzer
+    _worker_analyzer = TextAnalyzer(cache_size)
+
+def _preprocess_chunk(chunk: list[str]) -> list[list[str]]:
+    return [_worker_analyzer.preprocess(text) for text in chunk]
+
+_default_analyzer = None
+
+def get_analyzer() -> TextAnalyzer:
+    #shared analyzer used by the module-level helpers
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = TextAnalyzer()
+    return _default_analyzer
+
 def lemmatize_terms(tokens: list[str]) -> list[str]:
     #use WordNetLemmatizer to lemmatize terms.
-    lemmatizer = WordNetLemmatizer()
-    lemmatizedTokens = []
-    for token in tokens:
-        base = lemmatizer.lemmatize(token)
-        lemmatizedTokens.append(base)
-    return lemmatizedTokens
+    return get_analyzer().lemmatize_terms(tokens)
     
 
 def remove_common_words(tokens: list[str]) -> list[str]:
     #take tokens and remove common words 
-    stop = set(stopwords.words('english'))
-    outputTokens = []
-    for token in tokens:
-        if token not in stop:
-            outputTokens.append(token)
-    return outputTokens
+    return get_analyzer().remove_common_words(tokens)
 
 def preprocess_text(text: str) -> list[str]:
     #return cleaned list of terms
-    tokens = clean_and_tokenize(text)
-    tokens = lemmatize_terms(tokens)
-    tokens = remove_common_words(tokens)
+    return get_analyzer().preprocess(text)
 
-    return tokens
+def preprocess_many(texts: Iterable[str], processes: Optional[int] = None,
+                    chunksize: int = 1000) -> Iterator[list[str]]:
+    #preprocess_text over many documents using all cores
+    return get_analyzer().preprocess_many(texts, processes, chunksize)
     
 def compute_term_frequencies(doc_tokens: dict[int, list[str]]) -> dict[int, dict[str, int]]:
     #counts occurrences of each term per doc.
@@ -45,3 +123,13 @@ def compute_term_frequencies(doc_tokens: dict[int, list[str]]) -> dict[int, dict
             freq_dict[word] = freq_dict.get(word, 0) + 1
         term_freqs[doc_num] = freq_dict
     return term_freqs
+
+def compute_term_positions(doc_tokens: dict[int, list[str]]) -> dict[int, dict[str, list[int]]]:
+    #records the token positions of each term per doc (tf is the list length)
+    term_positions = {}
+    for doc_num, words in doc_tokens.items():
+        position_dict = {}
+        for position, word in enumerate(words):
+            position_dict.setdefault(word, []).append(position)
+        term_positions[doc_num] = position_dict
+    return term_positions
@@ -1,64 +1,148 @@
 # Russell
+import heapq
 import math
-from typing import List, Tuple
+import re
+from operator import itemgetter
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple, Union
 from tree23 import TreeNode
+from lexicon import Lexicon
+from postings import Postings, CollectionStats
 
 def rotate_pattern(pattern: str) -> str:
-    """Rotate pattern so '*' is at the end for prefix search."""
+    """
+    Rotate pattern so '*' is at the end for prefix search.
+    With several stars only the text before the first and after the last
+    star is used, the middle parts have to be checked afterwards.
+    """
     if '*' not in pattern:
         return pattern + '$'
-    star_index = pattern.index('*')
-    before_star: str = pattern[:star_index]
-    after_star: str = pattern[star_index + 1:]
+    first_star: int = pattern.index('*')
+    last_star: int = pattern.rindex('*')
+    before_star: str = pattern[:first_star]
+    after_star: str = pattern[last_star + 1:]
     return after_star + '$' + before_star  # remove '*' in rotation
 
+def wildcard_to_regex(pattern: str) -> re.Pattern:
+    """Compile a wildcard pattern into a regex matching whole terms."""
+    return re.compile('.*'.join(re.escape(part) for part in pattern.split('*')))
+
 def match_pattern(term: str, rotated_prefix: str) -> bool:
     """Check if a permuterm key matches the rotated prefix."""
     return term.startswith(rotated_prefix)
 
-def find_terms_by_prefix(root: TreeNode, pattern: str) -> Tuple[List[str], int]:
+def find_terms_by_prefix(root: Union[TreeNode, Lexicon], pattern: str) -> Tuple[List[str], int]:
     """
-    Search permuterm tree for terms matching a wildcard pattern.
-    Returns (list of original terms, number of nodes visited).
+    Search permuterm tree or lexicon.Lexicon for terms matching a wildcard pattern.
+    Keys are kept in sorted order, so this is a bounded in-order range scan:
+    subtrees entirely below the rotated prefix are skipped and the scan stops
+    at the first key past it, giving O(log n + matches) node visits.
+    Returns (list of original terms, number of nodes (or lexicon blocks) visited).
     """
     matches: List[str] = []
+    seen: set = set()
     steps: int = 0
     rotated_prefix: str = rotate_pattern(pattern)
+    done: bool = False
 
     def traverse(node: TreeNode) -> None:
-        nonlocal steps
-        if node is None:
+        nonlocal steps, done
+        if node is None or done:
             return
         steps += 1
-        for key in node.keys:
+        for i, key in enumerate(node.keys):
+            # child i only holds keys smaller than key, skip it if key <= prefix
+            if node.children and key > rotated_prefix:
+                traverse(node.children[i])
+                if done:
+                    return
             if match_pattern(key, rotated_prefix):
                 # original term stored as value in term_documents
                 for original_term in node.term_documents[key]:
-                    if original_term not in matches:
+                    if original_term not in seen:
+                        seen.add(original_term)
                         matches.append(original_term)
-        for child in node.children:
-            traverse(child)
+            elif key > rotated_prefix:
+                # first key past the prefix range, nothing after it can match
+                done = True
+                return
+        if node.children:
+            traverse(node.children[len(node.keys)])
+
+    if isinstance(root, Lexicon):
+        # front-coded lexicon: decode only the blocks covering the prefix range
+        term_ids, steps = root.prefix_search(rotated_prefix)
+        matches = [root.term(term_id) for term_id in dict.fromkeys(term_ids)]
+    else:
+        traverse(root)
 
-    traverse(root)
+    # the rotated prefix ignores the middle parts of multi-star patterns
+    if pattern.count('*') > 1:
+        regex = wildcard_to_regex(pattern)
+        matches = [term for term in matches if regex.fullmatch(term)]
     return matches, steps
 
-def compute_query_weights(query_terms: List[str], inverted_index: dict) -> dict[str, float]:
+def find_terms_by_kgrams(kgram_index: dict[str, List[str]], pattern: str, k: int = 2) -> Tuple[List[str], int]:
+    """
+    Search a k-gram index for terms matching a wildcard pattern with any
+    number of stars. The postings of the pattern's k-grams are intersected
+    rarest first and the candidates are post-filtered against the pattern.
+    Returns (list of matching terms, number of candidates checked).
+    """
+    kgrams: set = set()
+    for part in ('$' + pattern + '$').split('*'):
+        for i in range(len(part) - k + 1):
+            kgrams.add(part[i:i + k])
+
+    if kgrams:
+        postings: List[List[str]] = sorted((kgram_index.get(kgram, []) for kgram in kgrams), key=len)
+        candidates: set = set(postings[0])
+        for terms in postings[1:]:
+            if not candidates:
+                break
+            candidates &= set(terms)
+    else:
+        # pattern parts are all shorter than k, every term is a candidate
+        candidates = {term for terms in kgram_index.values() for term in terms}
+
+    regex = wildcard_to_regex(pattern)
+    matches: List[str] = sorted(term for term in candidates if regex.fullmatch(term))
+    return matches, len(candidates)
+
+def expand_wildcard(pattern: str, permuterm_root: Union[TreeNode, Lexicon],
+                    kgram_index: Optional[dict[str, List[str]]] = None, k: int = 2) -> List[str]:
+    """
+    Expand a wildcard query term into vocabulary terms.
+    Single-star patterns use the permuterm tree, patterns with several stars
+    use the k-gram index when one is given.
+    """
+    if pattern.count('*') > 1 and kgram_index is not None:
+        matches, _ = find_terms_by_kgrams(kgram_index, pattern, k)
+    else:
+        matches, _ = find_terms_by_prefix(permuterm_root, pattern)
+    return matches
+
+def compute_query_weights(query_terms: List[str], inverted_index: dict[str, Postings]) -> dict[str, float]:
     """
     Compute query weights using ltc scheme:
     l = log(tf)
     t = idf = log(N/df)
     c = cosine normalization
+    N and df come from the index's CollectionStats, so this is O(query terms).
     """
     tf_counts: dict[str, int] = {}
     for term in query_terms:
         tf_counts[term] = tf_counts.get(term, 0) + 1
 
-    N: int = len({doc for term in inverted_index for doc in inverted_index[term]['postings']}) or 1
+    stats: Optional[CollectionStats] = getattr(inverted_index, 'stats', None)
+    if stats is None:
+        # plain dict without metadata, fall back to scanning the postings
+        stats = CollectionStats.from_index(inverted_index)
+
     weights: dict[str, float] = {}
     for term, tf in tf_counts.items():
-        df: int = inverted_index.get(term, {}).get('df', 1)
         log_tf: float = 1 + math.log(tf)
-        idf: float = math.log(N / df)
+        idf: float = stats.idf(term)
         weights[term] = log_tf * idf
 
     norm: float = math.sqrt(sum(w ** 2 for w in weights.values()))
@@ -68,19 +152,141 @@ def compute_query_weights(query_terms: List[str], inverted_index: dict) -> dict[
 
     return weights
 
-def rank_documents(query_weights: dict[str, float], inverted_index: dict) -> List[Tuple[int, float]]:
+# below this many postings over the query terms, scoring all of them beats WAND's bookkeeping
+WAND_MIN_POSTINGS: int = 16384
+
+def _query_postings(query_weights: dict[str, float], inverted_index: dict[str, Postings]) -> dict[str, Postings]:
+    # each term is looked up once, a mapped index decodes its postings on every lookup
+    found: dict[str, Postings] = {}
+    for term in query_weights:
+        postings: Optional[Postings] = inverted_index.get(term)
+        if postings is not None:
+            found[term] = postings
+    return found
+
+def rank_documents(query_weights: dict[str, float], inverted_index: dict[str, Postings],
+                   top_k: Optional[int] = None) -> List[Tuple[int, float]]:
     """
     Compute cosine similarity of query against all documents.
-    Returns a ranked list of (doc_id, score)
+    Returns a ranked list of (doc_id, score), ties broken by doc_id.
+    With top_k only the best top_k documents are returned, ranked with WAND
+    (see rank_documents_top_k) once the query's postings are long enough.
     """
+    query_postings: dict[str, Postings] = _query_postings(query_weights, inverted_index)
+    deleted: set = getattr(inverted_index, 'deleted', set())
+    if top_k is not None and sum(len(p) for p in query_postings.values()) >= WAND_MIN_POSTINGS:
+        ranked, _ = _wand(query_weights, query_postings, deleted, top_k)
+        return ranked
+
     doc_weights: dict[int, float] = {}
-    for term, q_weight in query_weights.items():
-        if term not in inverted_index:
-            continue
-        postings: dict[int, dict] = inverted_index[term]['postings']
-        for doc_id, stats in postings.items():
-            d_weight: float = stats.get('normalized', 0.0)
+    for term, postings in query_postings.items():
+        q_weight: float = query_weights[term]
+        for doc_id, d_weight in zip(postings.doc_ids, postings.weights):
             doc_weights[doc_id] = doc_weights.get(doc_id, 0.0) + q_weight * d_weight
 
-    ranked: List[Tuple[int, float]] = sorted(doc_weights.items(), key=lambda x: x[1], reverse=True)
+    # deleted documents stay in the postings until they are compacted away
+    for doc_id in deleted:
+        doc_weights.pop(doc_id, None)
+
+    if top_k is not None:
+        return heapq.nsmallest(max(top_k, 0), doc_weights.items(), key=lambda x: (-x[1], x[0]))
+    ranked: List[Tuple[int, float]] = sorted(doc_weights.items(), key=lambda x: (-x[1], x[0]))
     return ranked
+
+def rank_documents_top_k(query_weights: dict[str, float], inverted_index: dict[str, Postings],
+                         top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+    """
+    Document-at-a-time WAND ranking with a bounded heap of size top_k.
+    Each term's upper bound is q_weight * Postings.max_weight; documents whose
+    summed upper bounds cannot beat the current k-th score are skipped
+    without being scored. Gives the same results as rank_documents.
+    Returns (ranked list of (doc_id, score), number of postings scored).
+    """
+    return _wand(query_weights, _query_postings(query_weights, inverted_index),
+                 getattr(inverted_index, 'deleted', set()), top_k)
+
+def _wand(query_weights: dict[str, float], query_postings: dict[str, Postings], deleted: set,
+          top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+    if top_k <= 0:
+        return [], 0
+
+    # cursor: [position, length, doc_ids, weights, q_weight, upper bound, query term order]
+    # active holds the unfinished cursors ordered by current doc id and docs their current doc
+    # ids; only the cursors that move are taken out and put back in place, nothing is re-sorted
+    active: List[list] = []
+    docs: List[int] = []
+    for term, postings in query_postings.items():
+        if not len(postings):
+            continue
+        q_weight: float = query_weights[term]
+        cursor: list = [0, len(postings), postings.doc_ids, postings.weights, q_weight,
+                        q_weight * postings.max_weight, len(active)]
+        i: int = bisect_right(docs, postings.doc_ids[0])
+        docs.insert(i, postings.doc_ids[0])
+        active.insert(i, cursor)
+
+    heap: List[Tuple[float, int]] = []    # (score, -doc_id), worst result on top
+    scored: int = 0
+    # slack for rounding differences between upper bounds and real scores
+    epsilon: float = 1e-9
+    threshold: float = -math.inf
+
+    while active:
+        # pivot: first cursor where the summed upper bounds can beat the threshold
+        pivot: int = 0
+        if len(heap) == top_k:
+            bound: float = 0.0
+            for cursor in active:
+                bound += cursor[5]
+                if bound > threshold:
+                    break
+                pivot += 1
+            else:
+                break
+
+        pivot_doc: int = docs[pivot]
+        if docs[0] == pivot_doc:
+            # every cursor before the pivot is on pivot_doc, score it fully
+            # (in query term order, so sums match rank_documents exactly)
+            moved: int = bisect_right(docs, pivot_doc, pivot)
+            on_doc: List[list] = active[:moved]
+            del active[:moved], docs[:moved]
+            if moved > 1:
+                on_doc.sort(key=itemgetter(6))
+            scored += moved
+            score: float = 0.0
+            for cursor in on_doc:
+                position = cursor[0]
+                score += cursor[4] * cursor[3][position]
+                position += 1
+                if position < cursor[1]:
+                    cursor[0] = position
+                    doc_id: int = cursor[2][position]
+                    i = bisect_right(docs, doc_id)
+                    docs.insert(i, doc_id)
+                    active.insert(i, cursor)
+            if pivot_doc in deleted:
+                continue
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, -pivot_doc))
+                if len(heap) == top_k:
+                    threshold = heap[0][0] - epsilon
+            elif (score, -pivot_doc) > heap[0]:
+                heapq.heapreplace(heap, (score, -pivot_doc))
+                threshold = heap[0][0] - epsilon
+        else:
+            # documents before pivot_doc cannot make the top k, skip them
+            skipped: List[list] = active[:pivot]
+            del active[:pivot], docs[:pivot]
+            for cursor in skipped:
+                position = bisect_left(cursor[2], pivot_doc, cursor[0])
+                if position < cursor[1]:
+                    cursor[0] = position
+                    doc_id = cursor[2][position]
+                    i = bisect_right(docs, doc_id)
+                    docs.insert(i, doc_id)
+                    active.insert(i, cursor)
+
+    ranked: List[Tuple[int, float]] = [(-neg_doc, score) for score, neg_doc in heap]
+    ranked.sort(key=lambda x: (-x[1], x[0]))
+    return ranked, scored
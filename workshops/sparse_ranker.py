@@ -0,0 +1,96 @@
+"""
+Batched cosine ranking with a sparse term-document matrix.
+
+SparseRanker freezes the normalized weights of an inverted index into a
+CSR matrix (terms x documents). A batch of query vectors from
+compute_query_weights becomes a CSR matrix (queries x terms) and all
+queries are scored with one sparse matrix product; the top k of every row
+is picked with argpartition. Results match query.rank_documents.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class SparseRanker:
+    def __init__(self, inverted_index):
+        deleted = getattr(inverted_index, 'deleted', set())
+        self.terms = list(inverted_index)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+
+        postings_lists = [inverted_index[term] for term in self.terms]
+        doc_ids = np.unique(np.concatenate(
+            [np.frombuffer(p.doc_ids, dtype=np.int64) for p in postings_lists] or [np.empty(0, np.int64)]))
+        if deleted:
+            doc_ids = doc_ids[~np.isin(doc_ids, np.fromiter(deleted, dtype=np.int64))]
+        self.doc_ids = doc_ids          # column -> doc id
+
+        indptr = [0]
+        indices = []
+        data = []
+        for postings in postings_lists:
+            row_docs = np.frombuffer(postings.doc_ids, dtype=np.int64)
+            row_weights = np.frombuffer(postings.weights, dtype=np.float64)
+            if deleted:
+                keep = np.isin(row_docs, self.doc_ids)
+                row_docs, row_weights = row_docs[keep], row_weights[keep]
+            indices.append(np.searchsorted(doc_ids, row_docs))
+            data.append(row_weights)
+            indptr.append(indptr[-1] + len(row_docs))
+
+        self.matrix = csr_matrix(
+            (np.concatenate(data) if data else np.empty(0),
+             np.concatenate(indices) if indices else np.empty(0, np.int64),
+             np.array(indptr, dtype=np.int64)),
+            shape=(len(self.terms), len(doc_ids)))
+
+    def query_matrix(self, query_weights_batch: List[dict[str, float]]) -> csr_matrix:
+        """One row per query, terms kept in query order so sums match rank_documents."""
+        indptr = [0]
+        indices = []
+        data = []
+        for query_weights in query_weights_batch:
+            for term, weight in query_weights.items():
+                term_id = self.term_ids.get(term)
+                if term_id is not None:
+                    indices.append(term_id)
+                    data.append(weight)
+            indptr.append(len(indices))
+        return csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64),
+                           np.array(indptr, dtype=np.int64)),
+                          shape=(len(query_weights_batch), len(self.terms)))
+
+    def rank_batch(self, query_weights_batch: List[dict[str, float]],
+                   top_k: Optional[int] = 10) -> List[List[Tuple[int, float]]]:
+        """Ranked (doc_id, score) lists, one per query, ties broken by doc_id."""
+        scores = self.query_matrix(query_weights_batch) @ self.matrix
+
+        results = []
+        for row, query_weights in enumerate(query_weights_batch):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            columns = scores.indices[start:end]
+            values = scores.data[start:end]
+
+            # the product drops zero sums; rank_documents keeps documents that only
+            # match zero-weight (idf 0) terms, so add them back with score 0
+            zero_terms = [self.term_ids[t] for t, w in query_weights.items() if w == 0 and t in self.term_ids]
+            if zero_terms:
+                zero_columns = np.unique(np.concatenate(
+                    [self.matrix.indices[self.matrix.indptr[t]:self.matrix.indptr[t + 1]] for t in zero_terms]))
+                zero_columns = np.setdiff1d(zero_columns, columns)
+                columns = np.concatenate([columns, zero_columns])
+                values = np.concatenate([values, np.zeros(len(zero_columns))])
+
+            if top_k is not None and len(values) > top_k > 0:
+                # keep everything tied with the k-th best score, ties are settled by doc id below
+                kth = values[np.argpartition(-values, top_k - 1)[top_k - 1]]
+                keep = np.flatnonzero(values >= kth)
+                columns, values = columns[keep], values[keep]
+
+            docs = self.doc_ids[columns]
+            order = np.lexsort((docs, -values))
+            if top_k is not None:
+                order = order[:max(top_k, 0)]
+            results.append([(int(docs[i]), float(values[i])) for i in order])
+        return results
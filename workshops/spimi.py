@@ -0,0 +1,211 @@
+"""
+SPIMI-style external-memory index construction.
+
+Documents are streamed in blocks of roughly block_bytes of raw text. Each
+block is inverted in a worker process and spilled to a sorted run file on
+disk, and its document lengths to a lengths file. The runs are then
+merged with a k-way merge straight into the on-disk index format of
+index_store, computing df on the way. Peak memory is bounded by
+block_bytes times the number of blocks in flight, not by the size of the
+corpus.
+"""
+import heapq
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from array import array
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+from index_store import IndexWriter
+from postings import Postings
+from preprocess import TextAnalyzer
+
+
+def _blocks(documents: Iterable[tuple[int, str]], block_bytes: int) -> Iterator[list[tuple[int, str]]]:
+    block = []
+    size = 0
+    for doc_id, text in documents:
+        block.append((doc_id, text))
+        size += len(text)
+        if size >= block_bytes:
+            yield block
+            block = []
+            size = 0
+    if block:
+        yield block
+
+
+_worker_analyzer = None
+
+def _init_worker() -> None:
+    global _worker_analyzer
+    _worker_analyzer = TextAnalyzer()
+
+
+def _invert_block(block_no: int, block: list[tuple[int, str]], run_dir: str) -> tuple[str, str, int, int, int]:
+    """
+    Invert one block and write it as a run file sorted by term, plus a
+    lengths file of its doc ids and vector lengths in doc id order.
+    Every document lives in exactly one block, so its vector length and
+    normalized weights can be computed here.
+    Returns (run path, lengths path, document count, first doc id, last doc id).
+    """
+    analyzer = _worker_analyzer
+    block_index: dict[str, list[tuple[int, int, float]]] = {}
+    doc_ids = array('q')
+    lengths = array('d')
+
+    # postings within a run are in doc id order
+    for doc_id, text in sorted(block, key=lambda doc: doc[0]):
+        term_freqs: dict[str, int] = {}
+        for term in analyzer.preprocess(text):
+            term_freqs[term] = term_freqs.get(term, 0) + 1
+        if not term_freqs:
+            continue
+
+        log_tfs = {term: 1 + math.log(tf) for term, tf in term_freqs.items()}
+        length = math.sqrt(sum(w * w for w in log_tfs.values()))
+        doc_ids.append(doc_id)
+        lengths.append(length)
+        for term, tf in term_freqs.items():
+            block_index.setdefault(term, []).append((doc_id, tf, log_tfs[term] / length))
+
+    # one line per term: term \t doc:tf:weight doc:tf:weight ...
+    run_path = os.path.join(run_dir, f"run_{block_no:06d}.txt")
+    with open(run_path, 'w', encoding='utf-8') as f:
+        for term in sorted(block_index):
+            postings = ' '.join(f"{doc_id}:{tf}:{weight!r}" for doc_id, tf, weight in block_index[term])
+            f.write(f"{term}\t{postings}\n")
+
+    # document lengths are spilled too, 16 bytes per document would otherwise pile up in the parent
+    lengths_path = os.path.join(run_dir, f"lengths_{block_no:06d}.bin")
+    with open(lengths_path, 'wb') as f:
+        doc_ids.tofile(f)
+        lengths.tofile(f)
+
+    if not doc_ids:
+        return run_path, lengths_path, 0, 0, 0
+    return run_path, lengths_path, len(doc_ids), doc_ids[0], doc_ids[-1]
+
+
+def _read_run(path: str, block_no: int) -> Iterator[tuple[str, int, str]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            term, postings = line.rstrip('\n').split('\t', 1)
+            yield term, block_no, postings
+
+
+def _read_lengths(path: str, count: int, chunk: int = 65536) -> Iterator[tuple[int, float]]:
+    with open(path, 'rb') as f:
+        for start in range(0, count, chunk):
+            size = min(chunk, count - start)
+            doc_ids = array('q')
+            lengths = array('d')
+            f.seek(8 * start)
+            doc_ids.fromfile(f, size)
+            f.seek(8 * count + 8 * start)
+            lengths.fromfile(f, size)
+            yield from zip(doc_ids, lengths)
+
+
+def _parse_postings(run_postings: str) -> tuple[array, array, array]:
+    doc_ids = array('q')
+    tfs = array('I')
+    weights = array('d')
+    for posting in run_postings.split(' '):
+        doc_id, tf, weight = posting.split(':')
+        doc_ids.append(int(doc_id))
+        tfs.append(int(tf))
+        weights.append(float(weight))
+    return doc_ids, tfs, weights
+
+
+def _merge_runs(run_paths: list[str], writer: IndexWriter, disjoint: bool) -> None:
+    """
+    k-way merge of the sorted runs into the writer. run_paths are in doc id
+    order; when their doc id ranges are disjoint each run's postings of a
+    term are written as they are read, otherwise a term's postings are
+    collected and sorted before they are written.
+    """
+    runs = [_read_run(path, block_no) for block_no, path in enumerate(run_paths)]
+    current_term = None
+    postings = None
+
+    def flush() -> None:
+        if not disjoint:
+            order = sorted(range(len(postings.doc_ids)), key=postings.doc_ids.__getitem__)
+            writer.extend_term(array('q', (postings.doc_ids[i] for i in order)),
+                               array('I', (postings.tf[i] for i in order)),
+                               array('d', (postings.weights[i] for i in order)))
+        writer.finish_term()
+
+    # runs tie on term by block number, so chunks of a term arrive in doc id order
+    for term, _, run_postings in heapq.merge(*runs):
+        if term != current_term:
+            if current_term is not None:
+                flush()
+            current_term = term
+            writer.start_term(term)
+            postings = Postings()
+        doc_ids, tfs, weights = _parse_postings(run_postings)
+        if disjoint:
+            writer.extend_term(doc_ids, tfs, weights)
+        else:
+            postings.doc_ids.extend(doc_ids)
+            postings.tf.extend(tfs)
+            postings.weights.extend(weights)
+
+    if current_term is not None:
+        flush()
+
+
+def build_index_spimi(documents: Iterable[tuple[int, str]], output_path: str,
+                      block_bytes: int = 16_000_000, processes: Optional[int] = None,
+                      run_dir: Optional[str] = None) -> int:
+    """
+    Build the on-disk index at output_path from (doc_id, raw text) pairs.
+    block_bytes caps the raw text per block and processes the number of
+    worker processes, together they set peak memory. Run and lengths files
+    go to a temporary directory under run_dir and are removed afterwards.
+    When blocks cover disjoint doc id ranges (e.g. documents arrive in doc
+    id order), postings are streamed to the index one run at a time.
+    Returns the number of indexed documents.
+    """
+    processes = processes or os.cpu_count() or 1
+    run_dir = tempfile.mkdtemp(prefix='spimi_', dir=run_dir)
+    results: list[tuple[str, str, int, int, int]] = []
+
+    try:
+        if processes == 1:
+            _init_worker()
+            for block_no, block in enumerate(_blocks(documents, block_bytes)):
+                results.append(_invert_block(block_no, block, run_dir))
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+                # wait for the oldest block so at most `processes` blocks are in flight
+                pending = deque()
+                for block_no, block in enumerate(_blocks(documents, block_bytes)):
+                    pending.append(pool.apply_async(_invert_block, (block_no, block, run_dir)))
+                    if len(pending) >= processes:
+                        results.append(pending.popleft().get())
+                while pending:
+                    results.append(pending.popleft().get())
+
+        # merge runs in order of their first doc id; if no run starts before the previous
+        # one ends, every term's postings are in order run by run
+        results = sorted((result for result in results if result[2]), key=lambda result: result[3])
+        disjoint = all(previous[4] < result[3] for previous, result in zip(results, results[1:]))
+        num_docs = sum(count for _, _, count, _, _ in results)
+
+        def sorted_lengths() -> Iterator[tuple[int, float]]:
+            return heapq.merge(*(_read_lengths(path, count) for _, path, count, _, _ in results))
+
+        with IndexWriter(output_path, num_docs, sorted_lengths=sorted_lengths) as writer:
+            _merge_runs([run_path for run_path, _, _, _, _ in results], writer, disjoint)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    return num_docs
@@ -0,0 +1,69 @@
+import pytest
+
+from batch_run import percentile, read_topics, run_batch
+from index_store import open_index
+from preprocess import preprocess_text
+from query import compute_query_weights, expand_wildcard, rank_documents
+from spimi import build_index_spimi
+from tree23 import build_permuterm_index_from_terms
+
+TOPICS = {
+    '401': 'vector space model',
+    '402': 'average precision',
+    '403': 'efficient language',
+    '404': 'ca*',
+}
+
+
+@pytest.fixture
+def index_path(tmp_path, documents):
+    path = str(tmp_path / 'index.bin')
+    build_index_spimi(documents.items(), path, processes=1)
+    return path
+
+
+def expected_run(index_path, top_k, run_name):
+    lines = []
+    with open_index(index_path) as index:
+        root = build_permuterm_index_from_terms(list(index))
+        for query_id, text in TOPICS.items():
+            terms = expand_wildcard(text, root) if '*' in text else preprocess_text(text)
+            ranked = rank_documents(compute_query_weights(terms, index), index, top_k=top_k)
+            lines += [f"{query_id} Q0 {doc_id} {rank} {score:.6f} {run_name}"
+                      for rank, (doc_id, score) in enumerate(ranked, start=1)]
+    return lines
+
+
+def test_read_topics_formats(tmp_path):
+    tabbed = tmp_path / 'topics.tsv'
+    tabbed.write_text('401\tvector space model\n\n402 average precision\n')
+    assert read_topics(str(tabbed)) == [('401', 'vector space model'), ('402', 'average precision')]
+
+    trec = tmp_path / 'topics.trec'
+    trec.write_text('<top>\n<num> Number: 401\n<title> Topic: vector\n  space model\n<desc> ...\n</top>\n'
+                    '<top><num>402</num><title>average precision</title></top>\n')
+    assert read_topics(str(trec)) == [('401', 'vector space model'), ('402', 'average precision')]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_matches_single_queries(tmp_path, index_path, workers):
+    topics = tmp_path / 'topics.txt'
+    topics.write_text(''.join(f'{query_id}\t{text}\n' for query_id, text in TOPICS.items()))
+    output = tmp_path / 'run.txt'
+
+    stats = run_batch(index_path, str(topics), str(output), workers=workers, top_k=3, run_name='test')
+    assert stats['queries'] == len(TOPICS)
+    assert stats['p50_ms'] <= stats['p90_ms'] <= stats['p99_ms']
+    # topics finish in any order, lines of one topic stay together and ranked
+    lines = output.read_text().splitlines()
+    assert sorted(lines) == sorted(expected_run(index_path, 3, 'test'))
+    for query_id in TOPICS:
+        ranks = [int(line.split()[3]) for line in lines if line.split()[0] == query_id]
+        assert ranks == list(range(1, len(ranks) + 1))
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 90) == 0.0
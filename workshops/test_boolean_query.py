@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from boolean_query import boolean_search, difference, intersect, union
+from index_builder import build_inverted_index, normalize_document_weights
+from preprocess import compute_term_frequencies, compute_term_positions, preprocess_text
+
+
+def positional_index(documents):
+    tokens = {doc_id: preprocess_text(text) for doc_id, text in documents.items()}
+    return normalize_document_weights(build_inverted_index(compute_term_frequencies(tokens),
+                                                           compute_term_positions(tokens)))
+
+
+def test_sorted_list_operations():
+    rng = random.Random(0)
+    for _ in range(50):
+        a = sorted(rng.sample(range(500), rng.randint(0, 40)))
+        b = sorted(rng.sample(range(500), rng.randint(0, 300)))
+        assert intersect(a, b) == sorted(set(a) & set(b))
+        assert difference(a, b) == sorted(set(a) - set(b))
+        assert union(a, b) == sorted(set(a) | set(b))
+
+
+def test_boolean_operators(documents):
+    index = positional_index(documents)
+    assert boolean_search('model AND retrieval', index) == [1, 3]
+    assert boolean_search('model retrieval', index) == [1, 3]
+    assert boolean_search('precision OR cat', index) == [2, 5, 6]
+    assert boolean_search('model AND NOT vector', index) == [6]
+    assert boolean_search('NOT model', index) == [2, 4, 5]
+    assert boolean_search('(english OR cat) AND model', index) == [1, 6]
+    assert boolean_search('missing', index) == []
+
+
+def test_phrase_and_proximity(documents):
+    index = positional_index(documents)
+    assert boolean_search('"vector space model"', index) == [1, 3]
+    assert boolean_search('"space vector"', index) == []
+    assert boolean_search('"average precision"', index) == [2, 5]
+    # stopwords are dropped before positions are counted, like in the index
+    assert boolean_search('"language model and vector"', index) == [3]
+    assert boolean_search('cat /1 cut', index) == [6]
+    assert boolean_search('cast /1 cat', index) == []
+    assert boolean_search('cast /2 cat', index) == [6]
+    assert boolean_search('english /2 relevance', index) == []
+    assert boolean_search('english /3 relevance', index) == [1]
+
+
+def brute_force_near(tokens, term, other, distance):
+    first = [i for i, token in enumerate(tokens) if token == term]
+    second = [i for i, token in enumerate(tokens) if token == other]
+    return any(abs(i - j) <= distance for i in first for j in second)
+
+
+def test_random_phrases_and_proximity_match_brute_force():
+    rng = random.Random(3)
+    vocabulary = ['alpha', 'beta', 'gamma', 'delta', 'omega']
+    documents = {doc_id: ' '.join(rng.choices(vocabulary, k=rng.randint(1, 25))) for doc_id in range(200)}
+    tokens = {doc_id: text.split() for doc_id, text in documents.items()}
+    index = positional_index(documents)
+    for _ in range(30):
+        phrase = rng.choices(vocabulary, k=rng.randint(2, 3))
+        expected = [doc_id for doc_id, words in tokens.items()
+                    if any(words[i:i + len(phrase)] == phrase for i in range(len(words)))]
+        assert boolean_search('"' + ' '.join(phrase) + '"', index) == expected
+
+        term, other = rng.choices(vocabulary, k=2)
+        distance = rng.randint(1, 4)
+        expected = [doc_id for doc_id, words in tokens.items() if brute_force_near(words, term, other, distance)]
+        assert boolean_search(f'{term} /{distance} {other}', index) == expected
+
+
+def test_phrase_needs_positions(documents):
+    tokens = {doc_id: preprocess_text(text) for doc_id, text in documents.items()}
+    index = build_inverted_index(compute_term_frequencies(tokens))
+    assert boolean_search('model AND retrieval', index) == [1, 3]
+    with pytest.raises(ValueError):
+        boolean_search('"vector space"', index)
+
+
+def test_deleted_documents_are_skipped(documents):
+    index = positional_index(documents)
+    index.deleted.add(3)
+    assert boolean_search('"vector space model"', index) == [1]
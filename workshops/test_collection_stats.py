@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from index_builder import build_inverted_index, normalize_document_weights
+from postings import CollectionStats
+from query import compute_query_weights
+
+
+@pytest.fixture
+def index():
+    term_freqs = {
+        1: {'model': 3, 'retrieval': 1},
+        2: {'precision': 2},
+        3: {'model': 1, 'language': 1},
+        4: {'retrieval': 2, 'language': 1},
+    }
+    return normalize_document_weights(build_inverted_index(term_freqs))
+
+
+def test_builder_fills_stats(index):
+    assert index.stats.num_docs == 4
+    assert index.stats.df == {'model': 2, 'retrieval': 2, 'precision': 1, 'language': 2}
+    assert index.stats.doc_lengths[1] == pytest.approx(math.hypot(1 + math.log(3), 1))
+    assert index.stats.doc_lengths[2] == pytest.approx(1 + math.log(2))
+
+
+def test_query_weights_from_stats_match_a_postings_scan(index):
+    query = ['model', 'model', 'precision', 'unseen']
+    from_stats = compute_query_weights(query, index)
+    # a plain dict has no stats and falls back to CollectionStats.from_index
+    from_scan = compute_query_weights(query, dict(index))
+    assert from_stats == pytest.approx(from_scan)
+    assert math.hypot(*from_stats.values()) == pytest.approx(1)
+    assert CollectionStats.from_index(index).df == index.stats.df
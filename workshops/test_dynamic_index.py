@@ -0,0 +1,60 @@
+import pytest
+
+from dynamic_index import DynamicIndex
+from postings import PositionalPostings
+
+
+def assert_same_index(index, expected):
+    # terms whose postings emptied out keep an empty entry
+    assert {t for t, p in index.index.items() if len(p)} == set(expected.index)
+    for term, postings in expected.index.items():
+        live = index.index[term]
+        assert list(live.doc_ids) == list(postings.doc_ids)
+        assert list(live.tf) == list(postings.tf)
+        assert list(live.weights) == pytest.approx(list(postings.weights))
+        if isinstance(postings, PositionalPostings):
+            assert list(live.positions) == list(postings.positions)
+            assert list(live.offsets) == list(postings.offsets)
+    assert index.index.stats.num_docs == expected.index.stats.num_docs
+    assert index.index.stats.df == expected.index.stats.df
+
+
+@pytest.mark.parametrize('positional', [False, True])
+def test_add_update_delete_compact_round_trip(documents, positional):
+    index = DynamicIndex({1: documents[1], 3: documents[3]}, compact_threshold=100, positional=positional)
+    index.add_document(5, documents[5])
+    index.add_document(2, documents[2])         # inserted before existing ids
+    index.add_document(6, documents[6])
+    index.update_document(3, documents[4])
+    index.delete_document(1)
+
+    # a tombstoned document is gone from results before compaction
+    assert 1 not in [doc_id for doc_id, _ in index.search('english model', top_k=None)]
+
+    index.compact()
+    assert not index.index.deleted
+    expected = DynamicIndex({2: documents[2], 3: documents[4], 5: documents[5], 6: documents[6]},
+                            positional=positional)
+    assert_same_index(index, expected)
+    assert index.search('model retrieval', top_k=None) == expected.search('model retrieval', top_k=None)
+
+
+def test_wildcards_see_new_terms_and_skip_dead_ones(documents):
+    index = DynamicIndex({1: documents[1]})
+    index.add_document(2, "zebra zeal")
+    assert sorted(index.expand_wildcard('ze*')) == ['zeal', 'zebra']
+    index.delete_document(2)
+    assert index.expand_wildcard('ze*') == []
+
+
+def test_errors(documents):
+    index = DynamicIndex({1: documents[1]})
+    with pytest.raises(ValueError):
+        index.add_document(1, documents[2])
+    with pytest.raises(KeyError):
+        index.update_document(9, documents[2])
+    index.delete_document(1)
+    with pytest.raises(KeyError):
+        index.delete_document(1)
+    index.add_document(1, documents[2])     # a deleted id can be reused
+    assert [doc_id for doc_id, _ in index.search('precision')] == [1]
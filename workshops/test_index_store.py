@@ -0,0 +1,79 @@
+from array import array
+
+import pytest
+
+import index_store
+from index_builder import build_inverted_index, normalize_document_weights
+from index_store import WEIGHT_SCALE, IndexWriter, open_index, vbyte_decode, vbyte_encode, write_index
+from postings import Postings
+
+
+def synthetic_index():
+    term_freqs = {
+        1: {'model': 3, 'retrieval': 1, 'vector': 1},
+        2: {'precision': 2, 'measure': 2},
+        3: {'model': 2, 'retrieval': 1, 'language': 1, 'vector': 1},
+        200: {'language': 1, 'efficient': 1},
+        70000: {'retrieval': 1, 'precision': 1, 'mésure': 1},
+    }
+    return normalize_document_weights(build_inverted_index(term_freqs))
+
+
+def test_vbyte_round_trip():
+    numbers = [0, 1, 127, 128, 16383, 16384, 2 ** 40]
+    encoded = bytearray()
+    vbyte_encode(numbers, encoded)
+    assert list(vbyte_decode(encoded, len(numbers))) == numbers
+
+
+def test_round_trip(tmp_path):
+    index = synthetic_index()
+    path = str(tmp_path / 'index.bin')
+    write_index(path, index)
+
+    with open_index(path) as mapped:
+        assert list(mapped) == sorted(index)
+        assert mapped.stats.num_docs == index.stats.num_docs == 5
+        assert dict(mapped.stats.df) == index.stats.df
+        assert dict(mapped.stats.doc_lengths) == pytest.approx(index.stats.doc_lengths)
+        for term, postings in index.items():
+            stored = mapped[term]
+            assert list(stored.doc_ids) == list(postings.doc_ids)
+            assert list(stored.tf) == list(postings.tf)
+            # weights are stored as uint16
+            assert list(stored.weights) == pytest.approx(list(postings.weights), abs=1 / WEIGHT_SCALE)
+        assert 'missing' not in mapped
+        with pytest.raises(KeyError):
+            mapped['missing']
+
+
+def test_postings_written_in_chunks(tmp_path, monkeypatch):
+    # a tiny spool makes the tf and weight bytes of a term go through a temporary file
+    monkeypatch.setattr(index_store, 'SPOOL_BYTES', 4)
+    path = str(tmp_path / 'index.bin')
+    lengths = [(1, 1.0), (5, 2.0), (300, 1.5)]
+    with IndexWriter(path, 3, sorted_lengths=lambda: iter(lengths)) as writer:
+        writer.start_term('model')
+        writer.extend_term([1, 5], [2, 1], [0.5, 0.25])
+        writer.extend_term([], [], [])
+        writer.extend_term([300], [7], [1.0])
+        with pytest.raises(ValueError):
+            writer.extend_term([300], [1], [0.5])
+        writer.finish_term()
+        writer.add_term('vector', Postings(array('q', [5]), array('I', [3]), array('d', [0.75])))
+
+    with open_index(path) as mapped:
+        assert list(mapped) == ['model', 'vector']
+        assert list(mapped['model'].doc_ids) == [1, 5, 300]
+        assert list(mapped['model'].tf) == [2, 1, 7]
+        assert list(mapped['model'].weights) == pytest.approx([0.5, 0.25, 1.0], abs=1 / WEIGHT_SCALE)
+        assert list(mapped['vector'].tf) == [3]
+        assert dict(mapped.stats.doc_lengths) == dict(lengths)
+
+
+@pytest.mark.parametrize('magic, version', [(b'XXXX', 2), (b'IRIX', 1)])
+def test_rejects_other_files(tmp_path, magic, version):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(magic + version.to_bytes(4, 'little') + bytes(56))
+    with pytest.raises(ValueError):
+        open_index(str(path))
@@ -0,0 +1,35 @@
+import fnmatch
+import random
+
+import pytest
+
+from index_builder import build_kgram_index
+from query import expand_wildcard, find_terms_by_kgrams, find_terms_by_prefix
+from tree23 import build_permuterm_index_from_terms
+
+
+@pytest.fixture
+def terms():
+    rng = random.Random(1)
+    return sorted({''.join(rng.choices('abcdeto', k=rng.randint(1, 8))) for _ in range(400)})
+
+
+@pytest.mark.parametrize('pattern', ['a*', '*to', 'c*d*', '*a*e*', 'a*b*c', '*', '**', 't*o*t*o', 'zz*z'])
+def test_kgram_lookup_matches_brute_force(terms, pattern):
+    kgram_index = build_kgram_index(terms)
+    found, candidates = find_terms_by_kgrams(kgram_index, pattern)
+    assert found == fnmatch.filter(terms, pattern)
+    assert candidates >= len(found)
+
+
+@pytest.mark.parametrize('pattern', ['c*d*', '*a*e*', 'a*b*c'])
+def test_multi_star_patterns_agree_on_both_indexes(terms, pattern):
+    tree = build_permuterm_index_from_terms(terms)
+    kgram_index = build_kgram_index(terms)
+    from_tree, _ = find_terms_by_prefix(tree, pattern)
+    assert sorted(from_tree) == sorted(expand_wildcard(pattern, tree, kgram_index)) == fnmatch.filter(terms, pattern)
+
+
+def test_kgrams_prune_candidates(terms):
+    _, candidates = find_terms_by_kgrams(build_kgram_index(terms), 't*o*t*o')
+    assert candidates < len(terms) // 4
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from lexicon import Lexicon, open_lexicon
+from query import find_terms_by_prefix
+from tree23 import build_permuterm_index_from_terms
+
+
+@pytest.fixture
+def terms():
+    rng = random.Random(0)
+    return sorted({''.join(rng.choices('abcdeto', k=rng.randint(2, 8))) for _ in range(400)})
+
+
+def test_term_ids(terms):
+    lexicon = Lexicon.from_terms(terms, block_size=8)
+    assert len(lexicon) == len(terms)
+    assert list(lexicon) == terms
+    for term_id, term in enumerate(terms):
+        assert lexicon.term(term_id) == term
+        assert lexicon.term_id(term) == term_id
+    assert lexicon.term_id('zzz') is None
+    assert 'zzz' not in lexicon
+
+
+@pytest.mark.parametrize('pattern', ['a*', '*to', 'b*e', 'c*d*', '*', 'tot*o'])
+def test_wildcards_match_permuterm_tree(tmp_path, terms, pattern):
+    path = str(tmp_path / 'lexicon.bin')
+    Lexicon.from_terms(terms).write(path)
+    tree = build_permuterm_index_from_terms(terms)
+    with open_lexicon(path) as lexicon:
+        found, _ = find_terms_by_prefix(lexicon, pattern)
+        expected, _ = find_terms_by_prefix(tree, pattern)
+        assert sorted(found) == sorted(expected)
@@ -0,0 +1,33 @@
+import fnmatch
+import random
+
+import pytest
+
+from query import find_terms_by_prefix
+from tree23 import build_permuterm_index_from_terms
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.children) if node else 0
+
+
+@pytest.fixture
+def terms():
+    rng = random.Random(0)
+    return sorted({''.join(rng.choices('abcdeto', k=rng.randint(2, 8))) for _ in range(400)})
+
+
+@pytest.mark.parametrize('pattern', ['a*', '*to', 'b*e', 'to*', 'zz*'])
+def test_prefix_scan_matches_brute_force(terms, pattern):
+    tree = build_permuterm_index_from_terms(terms)
+    found, _ = find_terms_by_prefix(tree, pattern)
+    assert len(found) == len(set(found))
+    assert sorted(found) == fnmatch.filter(terms, pattern)
+
+
+def test_prefix_scan_visits_few_nodes(terms):
+    tree = build_permuterm_index_from_terms(terms)
+    found, steps = find_terms_by_prefix(tree, 'to*')
+    # a bounded scan touches a root-to-leaf path plus the matching range
+    assert found
+    assert steps < count_nodes(tree) // 10
@@ -0,0 +1,40 @@
+import pytest
+
+import preprocess
+
+
+def test_preprocess_cleans_and_drops_stopwords():
+    assert preprocess.preprocess_text("The Model, and the R-precision!") == ['model', 'rprecision']
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_preprocess_many_keeps_input_order(documents, processes):
+    texts = list(documents.values()) * 7
+    expected = [preprocess.preprocess_text(text) for text in texts]
+    # small chunks so several are in flight at once
+    assert list(preprocess.preprocess_many(texts, processes=processes, chunksize=4)) == expected
+
+
+def test_preprocess_many_streams_its_input():
+    consumed = []
+
+    def texts():
+        for i in range(10_000):
+            consumed.append(i)
+            yield f"term{i}"
+
+    first = next(iter(preprocess.preprocess_many(texts(), processes=1, chunksize=100)))
+    assert first == ['term0']
+    assert len(consumed) <= 100
+
+
+def test_default_analyzer_is_shared():
+    assert preprocess.get_analyzer() is preprocess.get_analyzer()
+
+
+def test_settings_key_follows_the_stopwords():
+    analyzer = preprocess.TextAnalyzer()
+    key = analyzer.settings_key()
+    assert preprocess.TextAnalyzer().settings_key() == key
+    analyzer.stopwords = analyzer.stopwords | {'model'}
+    assert analyzer.settings_key() != key
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from index_builder import build_inverted_index, normalize_document_weights
+import query
+from query import compute_query_weights, rank_documents, rank_documents_top_k
+
+
+def random_index(seed: int, num_docs: int = 300, vocab_size: int = 60):
+    rng = random.Random(seed)
+    vocabulary = [f"t{i}" for i in range(vocab_size)]
+    term_freqs = {}
+    for doc_id in range(num_docs):
+        # skewed term choice, so some postings are long and some short
+        tokens = rng.choices(vocabulary, weights=[1 / (i + 1) for i in range(vocab_size)], k=rng.randint(1, 30))
+        term_freqs[doc_id] = {term: tokens.count(term) for term in set(tokens)}
+    return normalize_document_weights(build_inverted_index(term_freqs)), vocabulary, rng
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('top_k', [1, 10, 50])
+def test_wand_matches_exhaustive_ranking(seed, top_k):
+    index, vocabulary, rng = random_index(seed)
+    for _ in range(20):
+        weights = compute_query_weights(rng.choices(vocabulary, k=rng.randint(1, 5)), index)
+        ranked, _ = rank_documents_top_k(weights, index, top_k)
+        assert ranked == rank_documents(weights, index)[:top_k]
+
+
+@pytest.mark.parametrize('min_postings', [0, 10 ** 9])
+def test_rank_documents_top_k_on_either_path(monkeypatch, min_postings):
+    # short queries are scored exhaustively, long ones with WAND, same results
+    monkeypatch.setattr(query, 'WAND_MIN_POSTINGS', min_postings)
+    index, vocabulary, rng = random_index(7)
+    for _ in range(20):
+        weights = compute_query_weights(rng.choices(vocabulary, k=rng.randint(1, 5)), index)
+        assert rank_documents(weights, index, top_k=10) == rank_documents(weights, index)[:10]
+
+
+def test_wand_skips_postings():
+    index, _, _ = random_index(0, num_docs=2000)
+    weights = compute_query_weights(['t0', 't1', 't40'], index)
+    _, scored = rank_documents_top_k(weights, index, 5)
+    total = sum(len(index[term]) for term in weights if term in index)
+    assert scored < total
+
+
+def test_wand_skips_deleted_documents():
+    index, _, _ = random_index(1)
+    weights = compute_query_weights(['t0', 't2'], index)
+    best = rank_documents(weights, index)[0][0]
+    index.deleted.add(best)
+    ranked, _ = rank_documents_top_k(weights, index, 10)
+    assert best not in [doc_id for doc_id, _ in ranked]
+    assert ranked == rank_documents(weights, index)[:10]
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from index_builder import build_inverted_index, normalize_document_weights
+from query import compute_query_weights, rank_documents
+from sparse_ranker import SparseRanker
+
+
+def random_index(seed: int, num_docs: int = 300, vocab_size: int = 60):
+    rng = random.Random(seed)
+    vocabulary = [f"t{i}" for i in range(vocab_size)]
+    term_freqs = {}
+    for doc_id in range(num_docs):
+        tokens = rng.choices(vocabulary, weights=[1 / (i + 1) for i in range(vocab_size)], k=rng.randint(1, 30))
+        # 'all' occurs everywhere, so its idf and query weight are 0
+        term_freqs[doc_id] = {'all': 1, **{term: tokens.count(term) for term in set(tokens)}}
+    return normalize_document_weights(build_inverted_index(term_freqs)), vocabulary + ['all', 'unseen'], rng
+
+
+def assert_same_ranking(batch, expected):
+    assert [doc_id for doc_id, _ in batch] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in batch] == pytest.approx([score for _, score in expected])
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('top_k', [1, 10, None])
+def test_rank_batch_matches_rank_documents(seed, top_k):
+    index, vocabulary, rng = random_index(seed)
+    queries = [compute_query_weights(rng.choices(vocabulary, k=rng.randint(1, 5)), index) for _ in range(40)]
+    results = SparseRanker(index).rank_batch(queries, top_k=top_k)
+    assert len(results) == len(queries)
+    for batch, weights in zip(results, queries):
+        expected = rank_documents(weights, index)
+        assert_same_ranking(batch, expected if top_k is None else expected[:top_k])
+
+
+def test_zero_weight_terms_and_deleted_documents():
+    index, _, _ = random_index(4)
+    index.deleted.update({0, 1, 2})
+    ranker = SparseRanker(index)
+    assert not set(ranker.doc_ids) & {0, 1, 2}
+
+    only_zero = compute_query_weights(['all'], index)
+    assert only_zero['all'] == 0
+    results = ranker.rank_batch([only_zero, compute_query_weights(['unseen'], index), {}], top_k=None)
+    # a zero-weight match still ranks every live document, with score 0
+    assert [doc_id for doc_id, _ in results[0]] == list(range(3, 300))
+    assert all(score == 0 for _, score in results[0])
+    assert results[1] == results[2] == []
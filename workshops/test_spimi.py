@@ -0,0 +1,34 @@
+import pytest
+
+from index_builder import build_inverted_index, normalize_document_weights
+from index_store import WEIGHT_SCALE, open_index
+from preprocess import compute_term_frequencies, preprocess_text
+from spimi import build_index_spimi
+
+
+def in_memory_index(documents):
+    term_freqs = compute_term_frequencies({doc_id: preprocess_text(text) for doc_id, text in documents.items()})
+    return normalize_document_weights(build_inverted_index(term_freqs))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+@pytest.mark.parametrize('order, block_bytes', [([1, 2, 3, 4, 5, 6], 64), ([1, 3, 5, 2, 4, 6], 150)])
+def test_spimi_matches_in_memory_index(tmp_path, documents, processes, order, block_bytes):
+    # tiny blocks force a real multi-way merge; out of order input gives runs with
+    # overlapping doc id ranges, which are merged term by term instead of streamed
+    path = str(tmp_path / 'index.bin')
+    assert build_index_spimi([(doc_id, documents[doc_id]) for doc_id in order], path, block_bytes=block_bytes,
+                             processes=processes, run_dir=str(tmp_path)) == len(documents)
+
+    expected = in_memory_index(documents)
+    with open_index(path) as mapped:
+        assert list(mapped) == sorted(expected)
+        assert mapped.stats.num_docs == expected.stats.num_docs
+        assert dict(mapped.stats.doc_lengths) == pytest.approx(expected.stats.doc_lengths)
+        for term, postings in expected.items():
+            stored = mapped[term]
+            assert list(stored.doc_ids) == list(postings.doc_ids)
+            assert list(stored.tf) == list(postings.tf)
+            assert list(stored.weights) == pytest.approx(list(postings.weights), abs=1 / WEIGHT_SCALE)
+    # run files are cleaned up
+    assert [p.name for p in tmp_path.iterdir()] == ['index.bin']
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from tree23 import build_permuterm_index_from_terms, bulk_load, find_term, insert_term
+
+
+def leaf_depths_and_keys(node, depth=0, depths=None, keys=None):
+    # in-order walk: every leaf must sit at the same depth
+    depths = set() if depths is None else depths
+    keys = [] if keys is None else keys
+    if not node.children:
+        depths.add(depth)
+        keys.extend(node.keys)
+        return depths, keys
+    assert len(node.children) == len(node.keys) + 1
+    for i, child in enumerate(node.children):
+        leaf_depths_and_keys(child, depth + 1, depths, keys)
+        if i < len(node.keys):
+            keys.append(node.keys[i])
+    return depths, keys
+
+
+def iter_keys(node):
+    yield node.keys
+    for child in node.children:
+        yield from iter_keys(child)
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_insert_keeps_tree_balanced(shuffle):
+    terms = [f"t{i:05d}" for i in range(3000)]
+    if shuffle:
+        random.Random(0).shuffle(terms)
+    root = None
+    for document_id, term in enumerate(terms):
+        root = insert_term(root, term, document_id)
+    root = insert_term(root, terms[0], 9999)        # existing term gets another document
+
+    depths, keys = leaf_depths_and_keys(root)
+    assert len(depths) == 1
+    assert keys == sorted(terms)
+    assert find_term(root, terms[0]) == [0, 9999]
+    assert all(find_term(root, term) == [document_id] for document_id, term in enumerate(terms[1:], 1))
+    assert find_term(root, 'missing') == []
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 3, 4, 8, 26, 27, 100, 1000])
+def test_bulk_load_builds_balanced_tree(count):
+    term_documents = {f"t{i:04d}": [i] for i in range(count)}
+    root = bulk_load(term_documents)
+    if not count:
+        assert root is None
+        return
+    depths, keys = leaf_depths_and_keys(root)
+    assert len(depths) == 1
+    assert keys == sorted(term_documents)
+    assert all(1 <= len(node_keys) <= 2 for node_keys in iter_keys(root))
+    assert all(find_term(root, term) == documents for term, documents in term_documents.items())
+
+
+def test_bulk_and_incremental_permuterm_trees_agree():
+    terms = ['cat', 'cut', 'coat', 'model', 'retrieval', 'precision']
+    bulk = build_permuterm_index_from_terms(terms)
+    incremental = build_permuterm_index_from_terms(terms, incremental=True)
+    assert leaf_depths_and_keys(bulk)[1] == leaf_depths_and_keys(incremental)[1]
+    for term in terms:
+        for rotation in [(term + '$')[i:] + (term + '$')[:i] for i in range(len(term) + 1)]:
+            assert find_term(bulk, rotation) == find_term(incremental, rotation) == [term]
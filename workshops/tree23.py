@@ -1,4 +1,6 @@
 # Oliwia
+from bisect import insort
+
 class TreeNode:
     def __init__(self, keys=None, children=None):
         self.keys = keys or []             # holds 1 or 2 keys
@@ -57,6 +59,19 @@ def insert_term(root: TreeNode, term: str, document_id: int) -> TreeNode:
         node.term_documents[term] = [document_id]
         return node
 
+    root = _insert(root, term, document_id)
+
+    #overflow propagated up to the root: split it, tree grows one level
+    if len(root.keys) == 3:
+        if not root.children:
+            return _split_leaf(root)
+        return _split_internal(TreeNode([], [root]), 0)
+    return root
+
+
+def _insert(root: TreeNode, term: str, document_id: int) -> TreeNode:
+    """Insert below root, leaving a 3-key node for the caller to split."""
+
     #if term already exists in this node, just add document_id
     if term in root.term_documents:
         if document_id not in root.term_documents[term]:
@@ -65,15 +80,11 @@ def insert_term(root: TreeNode, term: str, document_id: int) -> TreeNode:
 
     #if current node is a leaf, insert term here
     if not root.children:
-        root.keys.append(term)
         #keep keys in order
-        root.keys.sort()                     
+        insort(root.keys, term)
         root.term_documents[term] = [document_id]
 
-        #check for overflow: node now has 3 keys
-        if len(root.keys) == 3:
-            #split leaf and promote middle key
-            return _split_leaf(root)         
+        #a leaf with 3 keys is split by its parent, which takes the middle key
         return root
 
     #internal node: find the correct child to descend
@@ -91,7 +102,7 @@ def insert_term(root: TreeNode, term: str, document_id: int) -> TreeNode:
             child_index = 2
 
     #recursively insert term into the chosen child
-    root.children[child_index] = insert_term(root.children[child_index], term, document_id)
+    root.children[child_index] = _insert(root.children[child_index], term, document_id)
 
     #after recursion, check if child overflowed (3 keys)
     if len(root.children[child_index].keys) == 3:
@@ -149,47 +160,87 @@ def _split_internal(parent: TreeNode, child_index: int) -> TreeNode:
         right.children.append(child.children[2])
         right.children.append(child.children[3])
 
-    #create new lists for parent's keys and children after promotion
-    new_keys = []
-    new_children = []
-
-    for i in range(len(parent.children)):
-        if i == child_index:
-            #insert promoted key
-            new_keys.append(mid_key)   
-            #add left child          
-            new_children.append(left) 
-            #add right child           
-            new_children.append(right)           
+    #promoted key goes between the keys around child_index,
+    #left and right replace the split child
+    parent.keys = parent.keys[:child_index] + [mid_key] + parent.keys[child_index:]
+    parent.children = parent.children[:child_index] + [left, right] + parent.children[child_index + 1:]
+    parent.term_documents[mid_key] = child.term_documents[mid_key]
+
+    #if parent now has 3 keys, its own parent (or insert_term at the root) splits it
+    return parent
+
+def bulk_load(term_documents: dict) -> TreeNode:
+    """
+    Input:  mapping term -> [document_ids]
+    Output: balanced 2-3 tree holding every term
+    Behavior: sorts the terms once and builds the tree bottom-up in linear
+              time instead of inserting terms one by one
+    """
+    if not term_documents:
+        return None
+
+    keys = sorted(term_documents)
+
+    #smallest height whose full 3-node tree can hold every key
+    height = 1
+    while 3 ** height - 1 < len(keys):
+        height += 1
+
+    def build(lo: int, hi: int, height: int) -> TreeNode:
+        #keys[lo:hi] go into a subtree with all leaves at the given height
+        count = hi - lo
+        if height == 1:
+            node = TreeNode(keys[lo:hi])
         else:
-            #keep original keys
-            new_keys.append(parent.keys[i])   
-            #keep original children   
-            new_children.append(parent.children[i])  
+            #a child of height h-1 holds between 2^(h-1)-1 and 3^(h-1)-1 keys
+            child_max = 3 ** (height - 1) - 1
+            num_children = 2 if count - 1 <= 2 * child_max else 3
+            remaining = count - (num_children - 1)
+
+            node = TreeNode()
+            start = lo
+            for i in range(num_children):
+                #spread the remaining keys as evenly as possible
+                size = remaining // num_children + (1 if i < remaining % num_children else 0)
+                node.children.append(build(start, start + size, height - 1))
+                start += size
+                if i < num_children - 1:
+                    #separator key between this child and the next
+                    node.keys.append(keys[start])
+                    start += 1
+
+        for key in node.keys:
+            node.term_documents[key] = term_documents[key]
+        return node
 
-    parent.keys = new_keys
-    parent.children = new_children
-    parent.term_documents[mid_key] = child.term_documents[mid_key]
+    return build(0, len(keys), height)
 
-    #if parent now has 3 keys, split it as well 
-    if len(parent.keys) == 3:
-        return _split_leaf(parent)
 
-    return parent
+def generate_permuterms(term: str) -> list[str]:
+    """Generate all rotations of a term with $ marker"""
+    s = term + "$"
+    return [s[i:] + s[:i] for i in range(len(s))]
 
-def build_permuterm_index_from_terms(terms: list[str]) -> TreeNode:
+
+def build_permuterm_index_from_terms(terms: list[str], incremental: bool = False) -> TreeNode:
     """
     Input: list of unique terms from inverted index
     Output: 2–3 tree mapping permuted terms to base term
+    Behavior: bulk loads the tree by default, incremental=True keeps the
+              old insert_term path (used for build-time comparisons)
     """
-    def generate_permuterms(term: str) -> list[str]:
-        """Generate all rotations of a term with $ marker"""
-        s = term + "$"
-        return [s[i:] + s[:i] for i in range(len(s))]
+    if incremental:
+        root = None
+        for term in terms:
+            # generate all rotations for the permuterm index
+            for perm in generate_permuterms(term):
+                root = insert_term(root, perm, term)  # use your existing insert_term
+        return root
 
-    root = None
+    # collect every rotation first, then sort and build the tree once
+    perm_terms = {}
     for term in terms:
-        # generate all rotations for the permuterm index
         for perm in generate_permuterms(term):
-            root = insert_term(root, perm, term)  # use your existing insert_term
-    return root
\ No newline at end of file
+            # the $ marker makes each rotation unique to its base term
+            perm_terms.setdefault(perm, [term])
+    return bulk_load(perm_terms)